@@ -0,0 +1,244 @@
+# app/archive.py
+# 全期間の報告・履歴のアーカイブ出力（コンプライアンス用。gzip 圧縮の NDJSON を分割して書き出す）
+#
+# - periods → reports_p → report_history_p の順に、キー順（keyset）で CHUNK_ROWS 件ずつ読む。
+#   1チャンク = 1セグメントファイル（<番号>-<表>.ndjson.gz）。メモリに載るのは常に1チャンク分だけ
+# - セグメントは .part に書いて fsync・rename してから manifest.json（件数・バイト数・sha256・次の位置）を更新する。
+#   途中で止まっても manifest の位置から再開でき、manifest に無いファイルは作り直す
+# - 出力は組織ごと。ダウンロードは Range 対応（/admin/api/archives/{id}/files/{name}）
+# - 開いている期間も含める（出力中の更新は、そのチャンクを読んだ時点の内容になる）
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional
+from sqlalchemy import Integer, String, bindparam, select, tuple_
+
+from app.database import SessionLocal
+from app.models_persistent import Period, ReportP, ReportHistoryP
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR") or Path(__file__).resolve().parents[1] / "archive")
+CHUNK_ROWS = int(os.getenv("ARCHIVE_CHUNK_ROWS", "5000"))
+MANIFEST = "manifest.json"
+
+periods = Period.__table__
+reports = ReportP.__table__
+history = ReportHistoryP.__table__
+
+_org = bindparam("org", type_=String)
+_limit = bindparam("limit", type_=Integer)
+_a1 = bindparam("a1", type_=String)
+_a2 = bindparam("a2", type_=String)
+_after_seq = bindparam("after_seq", type_=Integer)
+
+# 組織の期間（seq 順）
+_PERIODS = (
+    select(*periods.c)
+    .where(periods.c.org_id == _org, periods.c.seq > _after_seq)
+    .order_by(periods.c.seq).limit(_limit)
+)
+_org_periods = select(periods.c.id).where(periods.c.org_id == _org)
+
+# 報告は主キー (period_id, user_id) の順
+_REPORTS = (
+    select(*reports.c)
+    .where(reports.c.period_id.in_(_org_periods),
+           tuple_(reports.c.period_id, reports.c.user_id) > tuple_(_a1, _a2))
+    .order_by(reports.c.period_id, reports.c.user_id).limit(_limit)
+)
+
+# 履歴は (period_id, id) の順（ix_report_history_p_period）
+_HISTORY = (
+    select(*history.c)
+    .where(history.c.period_id.in_(_org_periods),
+           tuple_(history.c.period_id, history.c.id) > tuple_(_a1, _a2))
+    .order_by(history.c.period_id, history.c.id).limit(_limit)
+)
+
+# (出力名, 文, 次の位置を行から取り出す関数)
+_PHASES = (
+    ("periods", _PERIODS, lambda r: [r["seq"]]),
+    ("reports", _REPORTS, lambda r: [r["period_id"], r["user_id"]]),
+    ("history", _HISTORY, lambda r: [r["period_id"], r["id"]]),
+)
+
+_lock = threading.Lock()
+_running: set = set()   # このプロセスで実行中の export id
+
+def _default(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    return str(v)
+
+def _dir(export_id: str) -> Path:
+    return ARCHIVE_DIR / export_id
+
+def load_manifest(export_id: str) -> Optional[dict]:
+    try:
+        return json.loads((_dir(export_id) / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def _save_manifest(m: dict) -> None:
+    m["updated_at"] = datetime.utcnow().isoformat()
+    path = _dir(m["id"]) / MANIFEST
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(m, fh, ensure_ascii=False, indent=1)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+def create(org_id: str) -> dict:
+    export_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+    _dir(export_id).mkdir(parents=True, exist_ok=True)
+    m = {
+        "id": export_id, "org_id": org_id, "format": "ndjson+gzip", "chunk_rows": CHUNK_ROWS,
+        "status": "pending", "created_at": datetime.utcnow().isoformat(), "completed_at": None,
+        "error": None, "cursor": {"phase": 0, "after": None},
+        "counts": {name: 0 for name, _, _ in _PHASES}, "segments": [],
+    }
+    _save_manifest(m)
+    return m
+
+def list_manifests(org_id: str) -> List[dict]:
+    if not ARCHIVE_DIR.exists():
+        return []
+    out = []
+    for d in sorted(ARCHIVE_DIR.iterdir(), reverse=True):
+        m = load_manifest(d.name) if d.is_dir() else None
+        if m is not None and m["org_id"] == org_id:
+            out.append({k: m[k] for k in ("id", "status", "created_at", "updated_at", "completed_at", "counts")}
+                       | {"segments": len(m["segments"]), "running": is_running(m["id"])})
+    return out
+
+def is_running(export_id: str) -> bool:
+    return export_id in _running
+
+def segment_path(m: dict, name: str) -> Optional[Path]:
+    # ダウンロード可能なのは manifest に載った（書き終えた）セグメントと manifest 自体
+    if name == MANIFEST or any(s["name"] == name for s in m["segments"]):
+        return _dir(m["id"]) / name
+    return None
+
+class _HashingWriter:
+    """gzip の出力を書きながら sha256 とバイト数を数える"""
+
+    def __init__(self, fh):
+        self.fh = fh
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, b) -> int:
+        self.sha.update(b)
+        self.size += len(b)
+        return self.fh.write(b)
+
+    def flush(self) -> None:
+        self.fh.flush()
+
+def _write_segment(path: Path, rows: List[dict]) -> dict:
+    tmp = path.with_name(path.name + ".part")
+    with open(tmp, "wb") as raw:
+        hw = _HashingWriter(raw)
+        with gzip.GzipFile(fileobj=hw, mode="wb", mtime=0) as gz:
+            for r in rows:
+                gz.write(json.dumps(r, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8"))
+                gz.write(b"\n")
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return {"bytes": hw.size, "sha256": hw.sha.hexdigest()}
+
+def _discard_unlisted(m: dict) -> None:
+    # 前回の中断で残った .part や、manifest の更新前に止まったセグメントを消す
+    listed = {s["name"] for s in m["segments"]} | {MANIFEST}
+    for p in _dir(m["id"]).iterdir():
+        if p.name not in listed and not p.name.startswith("."):
+            p.unlink(missing_ok=True)
+
+@contextmanager
+def _export_lock(export_id: str):
+    # 同じ出力先を共有する複数ワーカーのうち1つだけが書く
+    with _lock:
+        if export_id in _running:
+            yield False
+            return
+        _running.add(export_id)
+    try:
+        if fcntl is None:
+            yield True
+            return
+        with open(_dir(export_id) / ".lock", "a") as fh:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+    finally:
+        with _lock:
+            _running.discard(export_id)
+
+def run(export_id: str) -> dict:
+    """バックグラウンドタスクから呼ぶ。manifest の位置から最後まで（または失敗まで）進める"""
+    with _export_lock(export_id) as locked:
+        if not locked:
+            return {"skipped": "already running"}
+        m = load_manifest(export_id)
+        if m is None:
+            return {"skipped": "no such export"}
+        if m["status"] == "complete":
+            return m
+        _discard_unlisted(m)
+        m["status"], m["error"] = "running", None
+        _save_manifest(m)
+        try:
+            _run(m)
+        except Exception as e:  # noqa: BLE001  位置は manifest に残っているので再開できる
+            log.exception("archive export %s failed", export_id)
+            m["status"], m["error"] = "failed", f"{type(e).__name__}: {e}"
+            _save_manifest(m)
+        return m
+
+def _run(m: dict) -> None:
+    cur = m["cursor"]
+    while cur["phase"] < len(_PHASES):
+        name, stmt, next_key = _PHASES[cur["phase"]]
+        after = cur["after"]
+        if name == "periods":
+            params = {"after_seq": after[0] if after else 0}
+        else:
+            params = {"a1": after[0] if after else "", "a2": after[1] if after else ""}
+        with SessionLocal() as db:
+            rows = [dict(r) for r in db.execute(stmt, {"org": m["org_id"], "limit": m["chunk_rows"], **params})
+                    .mappings()]
+        if rows:
+            seg_name = f"{len(m['segments']) + 1:05d}-{name}.ndjson.gz"
+            info = _write_segment(_dir(m["id"]) / seg_name, rows)
+            first, last = next_key(rows[0]), next_key(rows[-1])
+            m["segments"].append({"name": seg_name, "table": name, "rows": len(rows), **info,
+                                  "first_key": first, "last_key": last})
+            m["counts"][name] += len(rows)
+            cur["after"] = last
+        if len(rows) < m["chunk_rows"]:
+            cur["phase"], cur["after"] = cur["phase"] + 1, None
+        _save_manifest(m)
+    m["status"], m["completed_at"] = "complete", datetime.utcnow().isoformat()
+    _save_manifest(m)
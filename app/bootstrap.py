@@ -0,0 +1,106 @@
+# app/bootstrap.py
+# 起動処理の段階実行と計測（スキーマ指紋による create_all / 反映の省略、後回しにできる処理の遅延実行）
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.models import Base
+from app import models_persistent  # noqa: F401  テーブル定義を metadata に載せる
+from app import migrations_bootstrap
+
+log = logging.getLogger(__name__)
+
+STATE_NAME = "app"
+_PROCESS_T0 = time.perf_counter()   # 最初に app を import した時点
+
+_phases: List[dict] = []
+_deferred: List[Tuple[str, Callable[[], object]]] = []
+_state = {"schema": None, "ready_at_ms": None, "deferred_done_at_ms": None}
+
+@contextmanager
+def phase(name: str):
+    t0 = time.perf_counter()
+    entry = {"phase": name, "status": "ok"}
+    try:
+        yield entry
+    except Exception as e:
+        entry["status"] = f"error: {type(e).__name__}: {e}"
+        raise
+    finally:
+        entry["elapsed_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        _phases.append(entry)
+
+def mark_imported() -> None:
+    _phases.append({"phase": "import", "status": "ok",
+                    "elapsed_ms": round((time.perf_counter() - _PROCESS_T0) * 1000, 2)})
+
+def schema_fingerprint(engine: Engine) -> str:
+    """モデル定義＋その場マイグレーションのソースから指紋を作る（どちらかが変われば再実行）"""
+    h = hashlib.sha256(engine.dialect.name.encode())
+    for t in Base.metadata.sorted_tables:
+        h.update(f"T {t.name}\n".encode())
+        for c in t.columns:
+            h.update(f"C {c.name} {c.type!r} {c.nullable} {c.primary_key}\n".encode())
+        for ix in sorted(t.indexes, key=lambda i: i.name or ""):
+            h.update(f"I {ix.name} {[c.name for c in ix.columns]} {ix.unique}\n".encode())
+    h.update(Path(migrations_bootstrap.__file__).read_bytes())
+    return h.hexdigest()
+
+def _stored_fingerprint(engine: Engine) -> Optional[str]:
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT fingerprint FROM schema_state WHERE name = :n"),
+                                {"n": STATE_NAME}).scalar()
+    except SQLAlchemyError:  # 新規DB（schema_state 未作成）
+        return None
+
+def ensure_schema(engine: Engine) -> str:
+    """指紋が一致すれば何もしない。違えば create_all とその場マイグレーションを実行して記録する"""
+    fp = schema_fingerprint(engine)
+    if _stored_fingerprint(engine) == fp:
+        _state["schema"] = "unchanged"
+        return "unchanged"
+    Base.metadata.create_all(bind=engine)
+    migrations_bootstrap.run_bootstrap_migrations(engine)
+    with engine.begin() as conn:
+        params = {"n": STATE_NAME, "f": fp, "now": datetime.utcnow()}
+        if not conn.execute(text("UPDATE schema_state SET fingerprint = :f, applied_at = :now WHERE name = :n"),
+                            params).rowcount:
+            conn.execute(text("INSERT INTO schema_state (name, fingerprint, applied_at) VALUES (:n, :f, :now)"),
+                         params)
+    _state["schema"] = "applied"
+    return "applied"
+
+def defer(name: str, fn: Callable[[], object]) -> None:
+    """接続受付の開始後にバックグラウンドで実行する処理を登録"""
+    _deferred.append((name, fn))
+
+async def _run_deferred() -> None:
+    for name, fn in _deferred:
+        try:
+            with phase(f"deferred:{name}"):
+                await asyncio.to_thread(fn)
+        except Exception:  # noqa: BLE001  後回し処理の失敗で起動済みのサーバを止めない
+            log.exception("deferred startup task failed: %s", name)
+    _state["deferred_done_at_ms"] = round((time.perf_counter() - _PROCESS_T0) * 1000, 2)
+    log.info("startup phases: %s", report())
+
+def start_deferred() -> None:
+    _state["ready_at_ms"] = round((time.perf_counter() - _PROCESS_T0) * 1000, 2)
+    asyncio.get_running_loop().create_task(_run_deferred())
+
+def report() -> dict:
+    return {
+        "schema": _state["schema"],
+        "ready_at_ms": _state["ready_at_ms"],                  # 接続受付を開始した時点（プロセス開始から）
+        "deferred_done_at_ms": _state["deferred_done_at_ms"],
+        "phases": list(_phases),
+    }
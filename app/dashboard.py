@@ -0,0 +1,215 @@
+# app/dashboard.py
+# 管理ダッシュボードの読み取りモデル（期間ごとに1つのスナップショット文書）
+#
+# 総数・状況別・グループ/属性/被害レベル別・未報告者・最近の更新をまとめて組み立て、
+# メモリと dashboard_snapshots 表に版番号付きで保存する。/admin・/admin/api/summary・
+# /admin/api/dashboard・/admin/api/absentees はこの文書をそのまま返すだけで、集計クエリは走らない。
+#
+# - 報告の commit（reporting.on_committed）や名簿の変更で「要再構築」にし、DEBOUNCE 秒後に1回だけ作り直す
+#   （殺到時も再構築は DEBOUNCE 秒に1回。表示の遅れもこの程度）
+# - 名簿の変更で再構築を予約するのは変更したワーカーだけ（他ワーカーは作り直さない）
+# - 作り直したら DASHBOARD を publish し、各ワーカーは表の版番号が進んだ期間の文書だけを捨てて次の参照時に表から読む
+# - 表はプライマリから読む（遅れたレプリカの古い版を載せない）。メモリには手元より新しい版だけを置く
+# - 再構築は版番号の行を先に更新（= 行ロック）してから集計する。同じ期間の再構築はワーカーをまたいで直列になり、
+#   後に保存される文書は必ず後に読んだデータから作られる（古い集計が新しい文書を上書きしない）
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Set
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models_persistent import DashboardSnapshotP, Period
+from app import invalidation, queries, reporting, summary
+
+log = logging.getLogger(__name__)
+
+DEBOUNCE = float(os.getenv("DASHBOARD_DEBOUNCE", "1.0"))
+RECENT_LIMIT = int(os.getenv("DASHBOARD_RECENT_LIMIT", "20"))
+
+_RECENT = queries.REPORTS.limit(RECENT_LIMIT)
+
+class Snapshot(NamedTuple):
+    period_id: str
+    version: int
+    doc: dict
+    body: bytes     # 保存した JSON そのもの（API はこれをそのまま返す）
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.period_id}:{self.version}"'
+
+CURRENT = ""   # mark_dirty 用: 再構築の時点で開いている期間（全組織）
+
+_lock = threading.Lock()
+_snapshots: Dict[str, Snapshot] = {}
+_pending: Set[str] = set()
+_timer: Optional[threading.Timer] = None
+
+def _iso(v) -> Optional[str]:
+    return v.isoformat() if isinstance(v, datetime) else v
+
+def build(db: Session, period: Period) -> dict:
+    """スナップショットの中身を組み立てる（版番号は保存時に付ける）"""
+    s = summary.compute_summary(db, period_id=period.id)
+    conn = db.connection()
+    absentees = [dict(r) for r in conn.execute(queries.ABSENTEES, {"pid": period.id}).mappings()]
+    recent = [
+        {**r, "updated_at": _iso(r["updated_at"])}
+        for r in conn.execute(_RECENT, queries.report_params(period.id)).mappings()
+    ]
+    return {
+        "period": {"id": period.id, "seq": period.seq, "started_at": _iso(period.started_at),
+                   "ended_at": _iso(period.ended_at)},
+        "built_at": datetime.utcnow().isoformat(),
+        **s,
+        "absentee_ids": [a["id"] for a in absentees],
+        "absentees": absentees,
+        "recent": recent,
+    }
+
+# 版番号を進めて行を確保する（無ければ作る）。commit まで同じ期間の再構築はここで待たされる
+_NEXT_VERSION = text("""
+    INSERT INTO dashboard_snapshots (period_id, version, built_at, doc) VALUES (:pid, 1, :now, '{}')
+    ON CONFLICT (period_id) DO UPDATE SET version = dashboard_snapshots.version + 1, built_at = :now
+""")
+
+def _next_version(db: Session, period_id: str) -> int:
+    params = {"pid": period_id, "now": datetime.utcnow()}
+    db.execute(_NEXT_VERSION, params)
+    return int(db.execute(text("SELECT version FROM dashboard_snapshots WHERE period_id = :pid"),
+                          params).scalar())
+
+def _store(db: Session, period_id: str, doc: dict) -> str:
+    body = json.dumps(doc, ensure_ascii=False, separators=(",", ":"))
+    db.execute(text("UPDATE dashboard_snapshots SET doc = :doc WHERE period_id = :pid"),
+               {"pid": period_id, "doc": body})
+    return body
+
+def rebuild(period_id: str) -> Optional[Snapshot]:
+    with SessionLocal() as db:
+        period = db.get(Period, period_id)
+        if period is None:
+            return None
+        version = _next_version(db, period_id)   # 集計より先にロックを取る
+        doc = build(db, period)
+        doc["version"] = version
+        body = _store(db, period_id, doc)
+        db.commit()
+    # 他ワーカーへ通知（自分の購読者も呼ばれて古い文書が消えるので、その後に置く）
+    invalidation.publish(invalidation.DASHBOARD)
+    return _install(Snapshot(period_id, doc["version"], doc, body.encode("utf-8")))
+
+def _install(snap: Snapshot) -> Snapshot:
+    # 同じ期間の文書は版番号が大きい方を残す（後から届いた古い版で置き換えない）
+    with _lock:
+        cur = _snapshots.get(snap.period_id)
+        if cur is not None and cur.version >= snap.version:
+            return cur
+        _snapshots[snap.period_id] = snap
+    return snap
+
+def get(period_id: str) -> Snapshot:
+    """メモリ → 表（プライマリ） → その場で構築 の順に探す"""
+    invalidation.ensure_fresh()
+    snap = _snapshots.get(period_id)
+    if snap is not None:
+        return snap
+    with SessionLocal() as db:
+        row = db.execute(text("SELECT version, doc FROM dashboard_snapshots WHERE period_id = :pid"),
+                         {"pid": period_id}).first()
+    if row is not None:
+        return _install(Snapshot(period_id, int(row[0]), json.loads(row[1]), row[1].encode("utf-8")))
+    snap = rebuild(period_id)
+    if snap is None:
+        raise LookupError(period_id)
+    return snap
+
+def mark_dirty(period_ids) -> None:
+    global _timer
+    with _lock:
+        _pending.update(period_ids)
+        if _timer is None and _pending:
+            _timer = threading.Timer(DEBOUNCE, _flush)
+            _timer.daemon = True
+            _timer.start()
+
+def _flush() -> None:
+    global _timer
+    with _lock:
+        todo = list(_pending)
+        _pending.clear()
+        _timer = None
+    try:
+        if CURRENT in todo:
+            with SessionLocal() as db:
+                cur = _open_period_ids(db)
+            todo = [pid for pid in todo if pid != CURRENT] + [pid for pid in cur if pid not in todo]
+        for pid in todo:
+            rebuild(pid)
+            todo = todo[1:]
+    except Exception:  # noqa: BLE001  失敗分は残して次の変更か定期ジョブで作り直す
+        log.exception("dashboard rebuild failed")
+        with _lock:
+            _pending.update(todo)
+
+def _open_period_ids(db: Session) -> List[str]:
+    # 組織ごとに1つずつ
+    return [pid for (pid,) in db.query(Period.id).filter(Period.ended_at.is_(None)).all()]
+
+def refresh() -> dict:
+    """定期ジョブ用: 取りこぼした再構築を実行し、各組織の現在の期間の文書をメモリに載せておく"""
+    if _pending:
+        _flush()
+    with SessionLocal() as db:
+        cur = _open_period_ids(db)
+        if not cur:
+            return {"skipped": "no open period"}
+    versions = {pid: get(pid).version for pid in cur}
+    return {"versions": versions}
+
+def pending() -> List[str]:
+    return sorted(_pending)
+
+def evict(keep) -> int:
+    keep = set(keep)
+    with _lock:
+        stale = [k for k in _snapshots if k not in keep]
+        for k in stale:
+            del _snapshots[k]
+    return len(stale)
+
+def _on_reports(writes: List[dict]) -> None:
+    mark_dirty({w["period_id"] for w in writes})
+
+def _on_roster() -> None:
+    # 名簿が変われば総数・未報告者が変わる（手元に文書のある期間と現在の期間を作り直す）。
+    # 作り直すのは名簿を変更したワーカーだけで、他ワーカーはその DASHBOARD 通知で該当期間を捨てる
+    if invalidation.published_here():
+        mark_dirty(list(_snapshots) + [CURRENT])
+
+def _drop() -> None:
+    # 通知には期間が載らないので、表の版番号が手元より進んだ期間の文書だけを捨てる
+    with _lock:
+        held = {pid: s.version for pid, s in _snapshots.items()}
+    if not held:
+        return
+    try:
+        with SessionLocal() as db:
+            stored = dict(db.query(DashboardSnapshotP.period_id, DashboardSnapshotP.version)
+                          .filter(DashboardSnapshotP.period_id.in_(list(held))).all())
+    except Exception:  # noqa: BLE001  版番号を確かめられなければ全て捨てる（次の参照時に表から読む）
+        log.exception("dashboard version check failed")
+        stored = {pid: v + 1 for pid, v in held.items()}
+    with _lock:
+        for pid, version in stored.items():
+            cur = _snapshots.get(pid)
+            if cur is not None and cur.version < version:
+                del _snapshots[pid]
+
+reporting.on_committed(_on_reports)
+invalidation.subscribe(invalidation.ROSTER, _on_roster)
+invalidation.subscribe(invalidation.DASHBOARD, _drop)
@@ -1,10 +1,15 @@
 # app/database.py
 import os
+import threading
+import time
 from urllib.parse import urlsplit, urlunsplit, ParseResult
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Connection, Engine
 from sqlalchemy.orm import sessionmaker, Session
 from typing import Generator
 
+from app import pool_health
+
 def _normalize_db_url(raw: str | None) -> str:
     raw = (raw or "").strip()
     if not raw:
@@ -33,10 +38,35 @@ def _normalize_db_url(raw: str | None) -> str:
     return raw
 
 DATABASE_URL = _normalize_db_url(os.getenv("DATABASE_URL"))
+# 管理画面の重い参照系を逃がすリードレプリカ（未設定ならプライマリを共用）
+DATABASE_READ_URL = _normalize_db_url(os.getenv("DATABASE_READ_URL")) if os.getenv("DATABASE_READ_URL") else None
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "3"))
+READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "5"))
+# レプリカの遅延がこれを超えたらプライマリへ戻す（秒）
+READ_MAX_LAG_SEC = float(os.getenv("READ_REPLICA_MAX_LAG", "10"))
+READ_HEALTH_INTERVAL_SEC = 5.0
+# 貸し出しごとの pre-ping はせず、アイドル接続はこの秒数で張り直す（サーバー側のアイドル切断より短く）
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def _make_engine(url: str, pool_size: int, max_overflow: int, name: str) -> Engine:
+    # 死活確認とサーキットブレーカーは app/pool_health.py（バックグラウンドで確認し、障害中は即失敗）
+    kw = {}
+    if not url.startswith("sqlite"):
+        kw.update(pool_size=pool_size, max_overflow=max_overflow, pool_recycle=POOL_RECYCLE)
+    eng = create_engine(url, **kw)
+    pool_health.attach(eng, name)
+    return eng
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = _make_engine(DATABASE_URL, POOL_SIZE, MAX_OVERFLOW, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+read_engine = (_make_engine(DATABASE_READ_URL, READ_POOL_SIZE, READ_MAX_OVERFLOW, "replica")
+               if DATABASE_READ_URL else engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
 # ★ FastAPI 用：@contextmanager を使わず、素の generator 関数で yield する
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
@@ -44,3 +74,89 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+# --- リードレプリカの健全性（遅延・接続失敗）はバックグラウンドで確認し、結果だけを参照する ---
+# 一度も確認できていない間（起動直後）はプライマリを使う
+_replica = {"usable": False, "lag_sec": None, "checked_at": 0.0, "last_error": None}
+_replica_stop = threading.Event()
+_replica_thread: threading.Thread | None = None
+
+_LAG_SQL = text("""
+    SELECT CASE WHEN pg_is_in_recovery()
+                THEN COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                ELSE 0 END
+""")
+
+def _check_replica() -> None:
+    try:
+        with read_engine.connect() as conn:
+            if read_engine.dialect.name == "postgresql":
+                lag = float(conn.execute(_LAG_SQL).scalar() or 0.0)
+            else:
+                conn.execute(text("SELECT 1"))
+                lag = 0.0
+        _replica.update(lag_sec=lag, usable=lag <= READ_MAX_LAG_SEC, last_error=None)
+    except Exception as e:  # noqa: BLE001  レプリカ不調はプライマリへフォールバック
+        _replica.update(usable=False, last_error=f"{type(e).__name__}: {e}")
+    _replica["checked_at"] = time.monotonic()
+
+def replica_usable() -> bool:
+    if read_engine is engine:
+        return False
+    if pool_health.get("replica").state != pool_health.CLOSED:
+        return False   # ブレーカーが開いている間はプライマリへ
+    return bool(_replica["usable"])
+
+def _replica_loop() -> None:
+    # リクエストのスレッドではレプリカへ接続しない（レプリカが固まっても参照系を巻き込まない）
+    while True:
+        _check_replica()
+        if _replica_stop.wait(READ_HEALTH_INTERVAL_SEC):
+            return
+
+def start_replica_monitor() -> None:
+    global _replica_thread
+    if read_engine is engine or _replica_thread is not None:
+        return
+    _replica_stop.clear()
+    _replica_thread = threading.Thread(target=_replica_loop, name="db-replica-health", daemon=True)
+    _replica_thread.start()
+
+def stop_replica_monitor() -> None:
+    global _replica_thread
+    _replica_stop.set()
+    _replica_thread = None
+
+def read_routing_status() -> dict:
+    return {
+        "replica_configured": read_engine is not engine,
+        "replica_usable": replica_usable(),
+        "lag_sec": _replica["lag_sec"],
+        "max_lag_sec": READ_MAX_LAG_SEC,
+        "last_error": _replica["last_error"],
+    }
+
+if read_engine is not engine:
+    @event.listens_for(read_engine, "handle_error")
+    def _on_read_error(ctx) -> None:
+        # 接続断を検知したら次のヘルスチェックまでプライマリへ
+        if ctx.is_disconnect:
+            _replica.update(usable=False, checked_at=time.monotonic(),
+                            last_error=f"{type(ctx.original_exception).__name__}: {ctx.original_exception}")
+
+# 参照専用（管理画面の GET 用）。レプリカが使えなければプライマリのセッションを返す
+def read_bind() -> Engine:
+    # セッションを使わず接続を直接開く場合（ストリーミング応答など）の参照先
+    return read_engine if replica_usable() else engine
+
+def get_read_db() -> Generator[Session, None, None]:
+    db = ReadSessionLocal() if replica_usable() else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_conn() -> Generator[Connection, None, None]:
+    # 参照専用の定型クエリ（app/queries.py）向け。ORM セッションを作らず接続だけを借りる
+    with read_bind().connect() as conn:
+        yield conn
@@ -21,3 +21,20 @@ async def require_admin_header_or_session(
     if x_admin_token and x_admin_token == ADMIN_TOKEN:
         return
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Admin auth required")
+
+# 担当者の識別（トリアージの担当・対応済み）。画面はログイン時に入力した名前、
+# トークンで呼ぶツールは X-Admin-Responder ヘッダ（セッションがあればヘッダは見ない）
+async def admin_responder(
+    request: Request,
+    x_admin_token: str | None = Header(default=None),
+    x_admin_responder: str | None = Header(default=None),
+) -> str:
+    await require_admin_header_or_session(request, x_admin_token)
+    if request.session.get("is_admin"):
+        name = request.session.get("responder")
+    else:
+        name = (x_admin_responder or "").strip()[:120]
+    if not name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Responder unknown: log in with a name or send X-Admin-Responder")
+    return name
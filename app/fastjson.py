@@ -0,0 +1,60 @@
+# app/fastjson.py
+# 管理API向けの高速JSON出力（DBの行タプルを Pydantic 検証を通さず直接エンコードする）
+# orjson があれば使い、無ければ標準の json で同じ形式を出力する
+import json
+from datetime import date, datetime
+from typing import Iterable, List, Sequence
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # 任意依存
+    orjson = None
+
+FORMATS = ("records", "columnar")
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+class RowEncoder:
+    """
+    列名と日時列の位置を事前に決めておき、行タプルをそのまま JSON にする。
+    DB 由来の信頼できる値だけを対象にする（型変換・検証は行わない）。
+    """
+
+    def __init__(self, columns: Sequence[str], datetime_columns: Iterable[str] = ()):
+        self.columns = list(columns)
+        dt = set(datetime_columns)
+        self._dt_idx = [i for i, c in enumerate(self.columns) if c in dt]
+
+    def _values(self, rows) -> List[list]:
+        # orjson は datetime をそのまま ISO 8601 にできるので変換不要
+        if orjson is not None:
+            return [tuple(r) for r in rows]
+        idx = self._dt_idx
+        if not idx:
+            return [list(r) for r in rows]
+        out = []
+        for r in rows:
+            v = list(r)
+            for i in idx:
+                x = v[i]
+                if isinstance(x, (datetime, date)):
+                    v[i] = x.isoformat()
+            out.append(v)
+        return out
+
+    def records(self, rows) -> bytes:
+        cols = self.columns
+        return _dumps([dict(zip(cols, v)) for v in self._values(rows)])
+
+    def columnar(self, rows) -> bytes:
+        return _dumps({"columns": self.columns, "rows": self._values(rows)})
+
+    def encode(self, rows, format: str = "records") -> bytes:
+        return self.columnar(rows) if format == "columnar" else self.records(rows)
+
+    def response(self, rows, format: str = "records") -> Response:
+        return Response(self.encode(rows, format), media_type="application/json")
@@ -0,0 +1,77 @@
+# app/geo.py
+# 避難先座標の geohash セル化（地図表示用の事前集計キー）
+import unicodedata
+from typing import Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+CELL_PRECISION = 9   # 保存する精度（約5m）。集計時は前方一致で粗くする
+
+def encode(lat: float, lng: float, precision: int = CELL_PRECISION) -> str:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    out = []
+    bit, ch, even = 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                ch = (ch << 1) | 1
+                lng_lo = mid
+            else:
+                ch <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch = (ch << 1) | 1
+                lat_lo = mid
+            else:
+                ch <<= 1
+                lat_hi = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            out.append(_BASE32[ch])
+            bit, ch = 0, 0
+    return "".join(out)
+
+def decode_center(cell: str) -> Tuple[float, float]:
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    even = True
+    for c in cell:
+        v = _DECODE[c]
+        for shift in range(4, -1, -1):
+            b = (v >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                if b:
+                    lng_lo = mid
+                else:
+                    lng_hi = mid
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                if b:
+                    lat_lo = mid
+                else:
+                    lat_hi = mid
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+def cell_for(lat: float | None, lng: float | None) -> str | None:
+    if lat is None or lng is None:
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return encode(lat, lng)
+
+def precision_for_zoom(zoom: int) -> int:
+    # Web地図のズーム（0〜20）→ geohash 桁数（1セルが数十ピクセル程度になる目安）
+    table = [1, 1, 2, 2, 2, 3, 3, 4, 4, 4, 5, 5, 6, 6, 6, 7, 7, 8, 8, 8, 9]
+    return table[max(0, min(int(zoom), len(table) - 1))]
+
+def normalize_shelter_name(s: str | None) -> str:
+    s = unicodedata.normalize("NFKC", s or "").casefold()
+    return "".join(ch for ch in s if not ch.isspace())
@@ -0,0 +1,164 @@
+# app/invalidation.py
+# 名簿・期間などの変更時に、プロセス内キャッシュへ無効化を通知するバス
+#
+# uvicorn --workers N でも各ワーカーのキャッシュが古いまま残らないよう、
+# publish() はローカルの購読者を呼ぶのに加えて cache_generations の世代番号を進める。
+# - Postgres: 同じトランザクションで NOTIFY し、各ワーカーの LISTEN スレッドが即座に受信
+# - SQLite 等: 各ワーカーが世代番号を POLL_INTERVAL ごとにポーリング
+# どちらの場合も ensure_fresh() が MAX_STALENESS を超えて確認していなければ同期的に確認するので、
+# 他ワーカーの変更が見えるまでの遅れは MAX_STALENESS 秒以内に収まる。
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, DefaultDict, Dict, List
+from sqlalchemy import text
+
+from app.database import engine
+
+log = logging.getLogger(__name__)
+
+ROSTER = "roster"   # users / rosters の変更
+PERIOD = "period"   # periods の開始・終了
+DASHBOARD = "dashboard"   # ダッシュボードのスナップショットの再構築（app/dashboard.py）
+ORG = "org"   # organizations の追加・変更（app/tenancy.py）
+TRIAGE = "triage"   # トリアージの担当・対応済みの変更（app/triage.py）
+TOPICS = (ROSTER, PERIOD, DASHBOARD, ORG, TRIAGE)
+
+CHANNEL = "cache_invalidation"
+POLL_INTERVAL = float(os.getenv("INVALIDATION_POLL_INTERVAL", "1.0"))
+MAX_STALENESS = float(os.getenv("INVALIDATION_MAX_STALENESS", "2.0"))
+
+_subscribers: DefaultDict[str, List[Callable[[], None]]] = defaultdict(list)
+_seen: Dict[str, int] = {}          # このワーカーが反映済みの世代
+_seen_lock = threading.Lock()
+_last_checked = 0.0
+_thread: threading.Thread | None = None
+_stop = threading.Event()
+_local = threading.local()   # publish() から購読者を呼んでいる間だけ True
+
+def subscribe(topic: str, fn: Callable[[], None]) -> None:
+    if fn not in _subscribers[topic]:
+        _subscribers[topic].append(fn)
+
+def unsubscribe(topic: str, fn: Callable[[], None]) -> None:
+    if fn in _subscribers[topic]:
+        _subscribers[topic].remove(fn)
+
+def _fire(topic: str) -> None:
+    for fn in list(_subscribers[topic]):
+        try:
+            fn()
+        except Exception:  # noqa: BLE001  1つの購読者の失敗で他を止めない
+            log.exception("invalidation subscriber failed: %s", topic)
+
+def _bump(topic: str) -> int:
+    with engine.begin() as conn:
+        n = conn.execute(
+            text("UPDATE cache_generations SET generation = generation + 1 WHERE topic = :t"), {"t": topic}
+        ).rowcount
+        if not n:
+            conn.execute(text("INSERT INTO cache_generations (topic, generation) VALUES (:t, 1)"), {"t": topic})
+        gen = int(conn.execute(text("SELECT generation FROM cache_generations WHERE topic = :t"), {"t": topic}).scalar())
+        if engine.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_notify(:ch, :payload)"), {"ch": CHANNEL, "payload": f"{topic}:{gen}"})
+    return gen
+
+def publish(topic: str) -> None:
+    # 先に世代を進めてから自分のキャッシュを捨てる（それ以前の他ワーカーの変更も確定済み）
+    try:
+        gen = _bump(topic)
+        with _seen_lock:
+            _seen[topic] = max(_seen.get(topic, 0), gen)
+    except Exception:  # noqa: BLE001  世代表が使えなくてもローカルは必ず無効化する
+        log.exception("failed to publish invalidation: %s", topic)
+    outer = getattr(_local, "publishing", False)
+    _local.publishing = True
+    try:
+        _fire(topic)
+    finally:
+        _local.publishing = outer
+
+def published_here() -> bool:
+    """購読者の中で呼ぶ。このワーカー自身の publish() による通知なら True（他ワーカーの変更の受信なら False）"""
+    return getattr(_local, "publishing", False)
+
+def _apply_generations(gens: Dict[str, int]) -> None:
+    changed = []
+    with _seen_lock:
+        for topic, gen in gens.items():
+            if topic not in _seen:
+                # 初回（起動直後）はキャッシュが空なので記録だけ
+                _seen[topic] = gen
+            elif gen > _seen[topic]:
+                changed.append(topic)
+                _seen[topic] = gen
+    for topic in changed:
+        _fire(topic)
+
+def poll() -> None:
+    global _last_checked
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT topic, generation FROM cache_generations")).all()
+    gens = {t: 0 for t in TOPICS}
+    gens.update({t: int(g) for t, g in rows})
+    _apply_generations(gens)
+    _last_checked = time.monotonic()
+
+def ensure_fresh() -> None:
+    """キャッシュを返す前に呼ぶ。最後の確認から MAX_STALENESS を超えていれば同期的に確認する"""
+    if _thread is None or time.monotonic() - _last_checked < MAX_STALENESS:
+        return
+    try:
+        poll()
+    except Exception:  # noqa: BLE001  DB不調時は手元のキャッシュで続行
+        log.exception("invalidation poll failed")
+
+def _poll_loop() -> None:
+    while not _stop.wait(POLL_INTERVAL):
+        try:
+            poll()
+        except Exception:  # noqa: BLE001
+            log.exception("invalidation poll failed")
+
+def _listen_loop() -> None:
+    global _last_checked
+    import psycopg
+    dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+    while not _stop.is_set():
+        try:
+            with psycopg.connect(dsn, autocommit=True) as conn:
+                conn.execute(f"LISTEN {CHANNEL}")
+                poll()  # LISTEN 開始前の取りこぼしを拾う
+                while not _stop.is_set():
+                    gens = {}
+                    for n in conn.notifies(timeout=POLL_INTERVAL):
+                        topic, _, gen = n.payload.partition(":")
+                        gens[topic] = max(gens.get(topic, 0), int(gen or 0))
+                        if len(gens) >= len(TOPICS):
+                            break
+                    if gens:
+                        _apply_generations(gens)
+                    _last_checked = time.monotonic()
+        except Exception:  # noqa: BLE001  接続断は少し待って再接続
+            log.exception("invalidation listener failed; reconnecting")
+            _stop.wait(POLL_INTERVAL * 2)
+
+def start() -> None:
+    global _thread
+    if _thread is not None:
+        return
+    try:
+        poll()
+    except Exception:  # noqa: BLE001
+        log.exception("invalidation initial poll failed")
+    _stop.clear()
+    target = _listen_loop if engine.dialect.name == "postgresql" else _poll_loop
+    _thread = threading.Thread(target=target, name="invalidation-bus", daemon=True)
+    _thread.start()
+
+def stop() -> None:
+    global _thread
+    _stop.set()
+    _thread = None
@@ -0,0 +1,107 @@
+# app/jobs.py
+# スケジューラに登録する定期ジョブ（事前計算・履歴圧縮・キャッシュ掃除・期間の自動切替）
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func, text
+
+from app.database import SessionLocal
+from app.models_persistent import Period, SubmissionKeyP
+from app import scheduler, triage, invalidation, spool, dashboard, tenancy
+
+SUMMARY_INTERVAL = float(os.getenv("JOB_SUMMARY_INTERVAL", "5"))
+# 終了した期間の履歴は (期間, ユーザー) ごとに直近 N 件だけ残す（0 で無効）
+HISTORY_KEEP_PER_USER = int(os.getenv("HISTORY_KEEP_PER_USER", "20"))
+# オフライン送信の冪等キーを残す日数（端末に溜まった報告の再送を重複と判定できる期間。0 で無効）
+SUBMISSION_KEY_KEEP_DAYS = float(os.getenv("SUBMISSION_KEY_KEEP_DAYS", "30"))
+# 期間を自動で切り替えるまでの時間（0 で無効。訓練の自動リセット用）
+AUTO_ROTATE_AFTER_HOURS = float(os.getenv("AUTO_ROTATE_AFTER_HOURS", "0"))
+
+def _current_period(db, org_id: str) -> Optional[Period]:
+    return db.query(Period).filter(Period.org_id == org_id, Period.ended_at.is_(None)).one_or_none()
+
+def dashboard_refresh() -> dict:
+    # 通常は書き込み側が再構築を予約する。ここでは取りこぼしの再実行と、メモリへの読み込みのみ
+    return dashboard.refresh()
+
+def history_compaction() -> dict:
+    out = {}
+    with SessionLocal() as db:
+        if HISTORY_KEEP_PER_USER > 0:
+            out["deleted"] = _compact_history(db)
+        if SUBMISSION_KEY_KEEP_DAYS > 0:
+            cutoff = datetime.utcnow() - timedelta(days=SUBMISSION_KEY_KEEP_DAYS)
+            out["submission_keys_deleted"] = (
+                db.query(SubmissionKeyP).filter(SubmissionKeyP.applied_at < cutoff)
+                .delete(synchronize_session=False))
+        if not scheduler.still_leader():
+            db.rollback()
+            return {"aborted": "lease lost"}
+        db.commit()
+    return out or {"skipped": "disabled"}
+
+def _compact_history(db) -> int:
+    return db.execute(text("""
+        DELETE FROM report_history_p WHERE id IN (
+            SELECT id FROM (
+                SELECT h.id,
+                       ROW_NUMBER() OVER (PARTITION BY h.period_id, h.user_id
+                                          ORDER BY h.changed_at DESC) AS rn
+                FROM report_history_p h
+                JOIN periods p ON p.id = h.period_id
+                WHERE p.ended_at IS NOT NULL
+            ) ranked
+            WHERE ranked.rn > :keep
+        )
+    """), {"keep": HISTORY_KEEP_PER_USER}).rowcount
+
+def cache_eviction() -> dict:
+    # 各組織の開いている期間だけ残す
+    with SessionLocal() as db:
+        keep = [pid for (pid,) in db.query(Period.id).filter(Period.ended_at.is_(None)).all()]
+    return {"queues_evicted": triage.evict(keep), "dashboards_evicted": dashboard.evict(keep)}
+
+def triage_claim_expiry() -> dict:
+    return {"claims_expired": triage.expire_claims()}
+
+def period_rotation() -> dict:
+    if AUTO_ROTATE_AFTER_HOURS <= 0:
+        return {"skipped": "disabled"}
+    rotated = {}
+    with SessionLocal() as db:
+        for org in tenancy.all_orgs():
+            cur = _current_period(db, org.id)
+            if cur and datetime.utcnow() - cur.started_at < timedelta(hours=AUTO_ROTATE_AFTER_HOURS):
+                continue
+            seq = cur.seq if cur else int(
+                db.query(func.max(Period.seq)).filter(Period.org_id == org.id).scalar() or 0)
+            if cur:
+                cur.ended_at = datetime.utcnow()
+                db.flush()
+            new = Period(org_id=org.id, seq=seq + 1)
+            db.add(new)
+            db.flush()
+            rotated[org.id] = new.id
+        if not rotated:
+            return {"rotated": False}
+        if not scheduler.still_leader():
+            db.rollback()
+            return {"aborted": "lease lost"}
+        db.commit()
+    invalidation.publish(invalidation.PERIOD)
+    return {"rotated": True, "period_ids": rotated}
+
+def spool_replay() -> dict:
+    return spool.replay()
+
+def register_default_jobs() -> None:
+    # 各ワーカーのメモリ内キャッシュ向け（全ワーカーで実行）
+    scheduler.register("dashboard_refresh", SUMMARY_INTERVAL, dashboard_refresh, leader_only=False)
+    scheduler.register("cache_eviction", 60, cache_eviction, leader_only=False)
+    # 退避ファイルはワーカーのローカルディスクにあるため各ワーカーで再生（同じディレクトリはロックで1つだけ）
+    scheduler.register("spool_replay", float(os.getenv("JOB_SPOOL_REPLAY_INTERVAL", "2")), spool_replay,
+                       leader_only=False)
+    # DB を書き換えるもの（リーダーのみ）
+    scheduler.register("history_compaction", 3600, history_compaction)
+    scheduler.register("period_rotation", 60, period_rotation)
+    scheduler.register("triage_claim_expiry", 60, triage_claim_expiry)
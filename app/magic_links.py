@@ -0,0 +1,103 @@
+# app/magic_links.py
+# 署名付きマジックリンク（DBに行を作らず、HMAC で本人・対象・期限を検証する）
+# 1回限りモードでは使用時に token_uses へ1行 INSERT し、主キーの重複を「使用済み」とする
+# （どのワーカーで使っても、同時に使われても1回だけ通る）
+import base64
+import hashlib
+import hmac
+import os
+from datetime import datetime
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.utils import default_expiry
+
+SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
+TTL_HOURS = int(os.getenv("MAGIC_LINK_TTL_HOURS", "48"))
+# 1回限りのリンクにする場合は 1（使用を token_uses に記録）
+ONE_TIME = os.getenv("MAGIC_LINK_ONE_TIME", "0").lower() in ("1", "true", "yes")
+
+_SIG_BYTES = 16
+_USE_BYTES = 8   # 使用記録のキーにする署名の先頭バイト数
+# SECRET_KEY からリンク専用の鍵を導出（セッション署名と鍵を分ける）
+_KEY = hashlib.sha256(SECRET_KEY.encode("utf-8") + b"\x00magic-link").digest()
+_MAC = hmac.new(_KEY, digestmod=hashlib.sha256)
+
+class InvalidToken(Exception):
+    pass
+
+def _b64(b: bytes) -> str:
+    return base64.urlsafe_b64encode(b).rstrip(b"=").decode("ascii")
+
+def _unb64(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+def _sig(payload: bytes) -> bytes:
+    h = _MAC.copy()
+    h.update(payload)
+    return h.digest()[:_SIG_BYTES]
+
+def sign(user_id: str, scope_id: str, expires_at: datetime | None = None) -> str:
+    exp = int((expires_at or default_expiry(TTL_HOURS)).timestamp())
+    payload = f"{user_id}|{scope_id}|{exp}".encode("utf-8")
+    return f"{_b64(payload)}.{_b64(_sig(payload))}"
+
+def verify(token: str, scope_id: str, now: datetime | None = None) -> str:
+    """トークンを検証して user_id を返す。DBは読まない（使用済みかどうかは is_used / redeem）"""
+    try:
+        p64, s64 = token.split(".", 1)
+        payload, sig = _unb64(p64), _unb64(s64)
+    except (ValueError, TypeError):
+        raise InvalidToken("malformed")
+    if not hmac.compare_digest(sig, _sig(payload)):
+        raise InvalidToken("bad signature")
+    try:
+        user_id, scope, exp = payload.decode("utf-8").split("|")
+        exp = int(exp)
+    except ValueError:
+        raise InvalidToken("malformed")
+    if not hmac.compare_digest(scope, scope_id):
+        raise InvalidToken("wrong scope")
+    if exp < (now or datetime.utcnow()).timestamp():
+        raise InvalidToken("expired")
+    return user_id
+
+def generate_for_roster(db: Session, scope_id: str, base_url: str,
+                        expires_at: datetime | None = None) -> List[dict]:
+    # アクティブ名簿全員分を1クエリ・1パスで生成
+    expires_at = expires_at or default_expiry(TTL_HOURS)
+    rows = db.execute(text("""
+        SELECT u.id, u.grade, u.name, u.email, rro.group_name
+        FROM rosters rro
+        JOIN users u ON u.id = rro.user_id
+        WHERE rro.is_active = TRUE
+        ORDER BY u.name
+    """)).all()
+    out = []
+    for uid, grade, name, email, group_name in rows:
+        t = sign(uid, scope_id, expires_at)
+        out.append({"user_id": uid, "grade": grade, "name": name, "email": email or "",
+                    "group_name": group_name or "", "url": f"{base_url}?t={t}"})
+    return out
+
+def _digest(token: str) -> str:
+    return _unb64(token.split(".", 1)[1])[:_USE_BYTES].hex()
+
+def is_used(db: Session, token: str, scope_id: str) -> bool:
+    """フォーム表示前の案内用（最終判定は redeem）"""
+    return db.execute(text("SELECT 1 FROM token_uses WHERE scope_id = :s AND digest = :d"),
+                      {"s": scope_id, "d": _digest(token)}).first() is not None
+
+def redeem(db: Session, token: str, scope_id: str) -> None:
+    """
+    使用を記録する（検証済みのトークンで、呼び出し側のトランザクション内。commit は呼び出し側）。
+    既に使われていれば（他のワーカー・同時の送信を含む）ロールバックして InvalidToken
+    """
+    try:
+        db.execute(text("INSERT INTO token_uses (scope_id, digest, used_at) VALUES (:s, :d, :now)"),
+                   {"s": scope_id, "d": _digest(token), "now": datetime.utcnow()})
+    except IntegrityError:
+        db.rollback()
+        raise InvalidToken("already used")
@@ -1,24 +1,24 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 import os
 
 from app.database import engine, SessionLocal
-from app.models import Base
-from app import models_persistent  # noqa: F401  # Period/ReportP をロードしてテーブル作成対象にする
-from app.models_persistent import Period
-from sqlalchemy import func
 
 # v2：常時公開フォーム & リセット型の管理UI/API
 from app.routers import admin_persistent, public_persistent, admin_web
 # （旧インシデント方式のAPIを併用したい場合は、下記2行をコメント解除）
 # from app.routers import admin, public
-# 既存インポートの近くに追記
-from app.migrations_bootstrap import run_bootstrap_migrations
+from app import bootstrap, database, invalidation, queries, scheduler, templating, tenancy, pool_health
+from app.jobs import register_default_jobs
 
 app = FastAPI(title="Disaster Check-in (v2 persistent page)")
 
+# 組織の解決（/o/<slug>・Host・管理画面のセッション）と組織ごとの予算。セッションより内側に置くため先に追加する
+app.add_middleware(tenancy.TenantMiddleware)
+
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
 app.add_middleware(
     SessionMiddleware,
@@ -29,25 +29,52 @@ app.add_middleware(
     # https_only=True  # Renderの本番httpsのみでCookieを送らせたい場合は有効化。ローカルhttpでは外す。
 )
 
-# 管理UIでセッションを使うため
-SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-change-me")
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, same_site="lax")
+# 現在の期間（Period）が無ければ組織ごとに作成する。各ルートと同じ共通処理（同時作成に強い）を使い、
+# 接続受付の前に済ませる（新しい DB でも最初のリクエストが作成を取り合わない）
+def ensure_current_period():
+    with SessionLocal() as db:
+        for org in tenancy.all_orgs():
+            queries.get_or_create_current_period(db, org.id)
+
+# 起動時：スキーマの確認・組織の読み込み・現在の期間の作成は接続受付の前に行う
+# （指紋が同じなら create_all / 反映を省略）。本番はAlembic推奨
+@app.on_event("startup")
+def ensure_schema():
+    with bootstrap.phase("schema") as p:
+        p["result"] = bootstrap.ensure_schema(engine)
+    with bootstrap.phase("organizations"):
+        tenancy.load()
+    with bootstrap.phase("current_period"):
+        ensure_current_period()
 
-# DBテーブル作成（MVP）— 本番はAlembic推奨
-Base.metadata.create_all(bind=engine)
+# 接続受付の開始後にバックグラウンドで行う処理
+bootstrap.defer("invalidation_bus", invalidation.start)   # 他ワーカーからの無効化を受信
+bootstrap.defer("db_pool_health", pool_health.start)      # 接続プールの死活確認（ブレーカー）
+bootstrap.defer("replica_health", database.start_replica_monitor)   # リードレプリカの遅延確認
+if templating.PRECOMPILE:
+    # テンプレートを全てコンパイルしておく（デプロイ直後の初回アクセスを速く）
+    bootstrap.defer("templates", templating.precompile)
 
-# Base.metadata.create_all(bind=engine) の直後あたりに追記
-run_bootstrap_migrations(engine)
+# 定期ジョブ（事前計算・履歴圧縮・キャッシュ掃除・期間の自動切替）
+register_default_jobs()
 
-# 起動時：現在の期間（Period）が無ければ自動作成
 @app.on_event("startup")
-def ensure_current_period():
-    with SessionLocal() as db:
-        cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
-        if not cur:
-            max_seq = db.query(func.max(Period.seq)).scalar() or 0
-            db.add(Period(seq=int(max_seq) + 1))
-            db.commit()
+async def start_background():
+    scheduler.start()
+    bootstrap.start_deferred()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    invalidation.stop()
+    pool_health.stop()
+    database.stop_replica_monitor()
+
+# DB のブレーカーが開いている間は接続タイムアウトを待たずに 503（公開フォームの送信は退避される）
+@app.exception_handler(pool_health.CircuitOpenError)
+async def circuit_open(request: Request, exc: pool_health.CircuitOpenError):
+    return JSONResponse({"detail": "Database unavailable"}, status_code=503,
+                        headers={"Retry-After": str(max(1, round(exc.retry_in)))})
 
 app.include_router(public_persistent.router)  # /f など公開フォーム
 app.include_router(admin_web.router)          # /admin, /admin/absentees（HTML）
@@ -57,6 +84,8 @@ app.include_router(admin_persistent.router)   # /admin/api/...（JSON）
 # app.include_router(admin.router)
 # app.include_router(public.router)
 
+bootstrap.mark_imported()
+
 @app.get("/")
 def root():
     return {"ok": True, "service": "disaster-checkin", "version": 2}
@@ -1,5 +1,8 @@
 # app/migrations_bootstrap.py
+from datetime import datetime
 from sqlalchemy import inspect, text
+from app import geo, search, timeline
+from app.models import DEFAULT_ORG_ID
 from sqlalchemy.engine import Engine
 
 def run_bootstrap_migrations(engine: Engine) -> None:
@@ -8,8 +11,13 @@ def run_bootstrap_migrations(engine: Engine) -> None:
     - users に grade 列が無ければ追加
     - users.email の NOT NULL を解除
     - users.email のユニーク制約があれば削除
-    - (grade, name) の一意制約を追加
+    - 組織（organizations）: 既定の組織を作り、users / rosters / periods に org_id を追加（既存行は既定の組織）
+    - 一意制約を組織ごとに: users (org_id, grade, name) / periods (org_id, seq)、開いている期間は組織ごとに1つ
     - reports_p.contact_email が無ければ追加（使っていれば）
+    - reports_p.geo_cell が無ければ追加し、座標のある既存行を埋める
+    - reports_p.written_at（サーバーの書き込み時刻）が無ければ追加
+    - 全文検索用の索引（SQLite: FTS5 trigram 表 / Postgres: pg_trgm の GIN 索引）
+    - 初回報告の時系列（report_timeline_p）が無い期間を既存の報告から埋める
     """
     insp = inspect(engine)
 
@@ -42,14 +50,40 @@ def run_bootstrap_migrations(engine: Engine) -> None:
         except Exception:
             pass
 
-        # --- users: (grade, name) にユニーク制約 ---
+        # --- 組織: 既定の組織と org_id 列 ---
+        if insp.has_table("organizations"):
+            if not conn.execute(text("SELECT 1 FROM organizations WHERE id = :id"), {"id": DEFAULT_ORG_ID}).first():
+                conn.execute(text(
+                    "INSERT INTO organizations (id, slug, name, created_at) VALUES (:id, 'default', 'Default', :now)"
+                ), {"id": DEFAULT_ORG_ID, "now": datetime.utcnow()})
+        for table in ("users", "rosters", "periods"):
+            if insp.has_table(table) and "org_id" not in {c["name"] for c in insp.get_columns(table)}:
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN org_id VARCHAR(36) NOT NULL DEFAULT '{DEFAULT_ORG_ID}'"))
+
+        # --- 一意制約・索引を組織ごとに（先頭を org_id に） ---
+        # SQLite は既存の制約を外せないため、(grade, name) / seq の全体一意が残る（必要なら local.db を削除して再生成）
         try:
             if engine.url.get_backend_name().startswith("postgresql"):
                 uqs = {uq["name"] for uq in insp.get_unique_constraints("users")}
-                if "uq_users_grade_name" not in uqs:
-                    conn.execute(text("ALTER TABLE users ADD CONSTRAINT uq_users_grade_name UNIQUE (grade, name)"))
+                conn.execute(text("ALTER TABLE users DROP CONSTRAINT IF EXISTS uq_users_grade_name"))
+                if "uq_users_org_grade_name" not in uqs:
+                    conn.execute(text(
+                        "ALTER TABLE users ADD CONSTRAINT uq_users_org_grade_name UNIQUE (org_id, grade, name)"))
+                if insp.has_table("periods"):
+                    puqs = {uq["name"] for uq in insp.get_unique_constraints("periods")}
+                    conn.execute(text("ALTER TABLE periods DROP CONSTRAINT IF EXISTS periods_seq_key"))
+                    if "uq_periods_org_seq" not in puqs:
+                        conn.execute(text("ALTER TABLE periods ADD CONSTRAINT uq_periods_org_seq UNIQUE (org_id, seq)"))
         except Exception:
             pass
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_org_email ON users (org_id, email)"))
+        if insp.has_table("rosters"):
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_rosters_org_active ON rosters (org_id, is_active, group_name)"))
+        if insp.has_table("periods"):
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS ux_periods_org_open ON periods (org_id) WHERE ended_at IS NULL"))
 
         # --- reports_p: contact_email 列を追加（使っている場合のみ） ---
         if insp.has_table("reports_p"):
@@ -58,3 +92,34 @@ def run_bootstrap_migrations(engine: Engine) -> None:
                 conn.execute(text("ALTER TABLE reports_p ADD COLUMN contact_email VARCHAR(320)"))
                 # 既存行は空文字に
                 conn.execute(text("UPDATE reports_p SET contact_email = '' WHERE contact_email IS NULL"))
+
+            # --- reports_p: geo_cell 列＋索引（地図集計用） ---
+            if "geo_cell" not in rpcols:
+                conn.execute(text("ALTER TABLE reports_p ADD COLUMN geo_cell VARCHAR(12)"))
+                rows = conn.execute(text("""
+                    SELECT period_id, user_id, shelter_lat, shelter_lng FROM reports_p
+                    WHERE shelter_lat IS NOT NULL AND shelter_lng IS NOT NULL
+                """)).all()
+                for pid, uid, lat, lng in rows:
+                    conn.execute(
+                        text("UPDATE reports_p SET geo_cell = :c WHERE period_id = :pid AND user_id = :uid"),
+                        {"c": geo.cell_for(lat, lng), "pid": pid, "uid": uid},
+                    )
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_reports_p_period_geo ON reports_p (period_id, geo_cell)"))
+            # トリアージキューの構築用と、差分の取り込み用（既存行は NULL のまま。構築時に全件読むので不要）
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_reports_p_triage ON reports_p (period_id, status, damage_level, updated_at)"
+            ))
+            if "written_at" not in rpcols:
+                conn.execute(text("ALTER TABLE reports_p ADD COLUMN written_at TIMESTAMP"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_reports_p_written ON reports_p (period_id, written_at)"))
+            # 全文検索（被害メモ・避難先）の索引
+            search.setup(conn, engine)
+            # 報告の時系列（集計行の無い期間のみ）
+            if insp.has_table("report_timeline_p"):
+                timeline.backfill(conn)
+
+        # --- report_history_p: 期間ごとのキー順の走査用（アーカイブ出力） ---
+        if insp.has_table("report_history_p"):
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_report_history_p_period ON report_history_p (period_id, id)"))
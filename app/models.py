@@ -1,16 +1,31 @@
 from sqlalchemy.orm import declarative_base, relationship, Mapped, mapped_column
-from sqlalchemy import String, Text, Boolean, DateTime, ForeignKey, Float, UniqueConstraint
+from sqlalchemy import String, Text, Boolean, DateTime, ForeignKey, Float, Integer, UniqueConstraint, Index
 import uuid
 from datetime import datetime
 
 Base = declarative_base()
 
+DEFAULT_ORG_ID = "default"   # 既定の組織（単一組織で使う場合はすべてこの組織。app/tenancy.py もこれを使う）
+
 def uuid_str() -> str:
     return str(uuid.uuid4())
 
+class Organization(Base):
+    # テナント（研究室・部署）。パス /o/<slug> または hosts のホスト名で選ぶ（app/tenancy.py）
+    __tablename__ = "organizations"
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uuid_str)
+    slug: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
+    name: Mapped[str] = mapped_column(String(200), nullable=False)
+    hosts: Mapped[str | None] = mapped_column(Text, nullable=True)                # カンマ区切り
+    max_concurrency: Mapped[int | None] = mapped_column(Integer, nullable=True)   # 省略時は TENANT_MAX_CONCURRENCY
+    submit_rate: Mapped[float | None] = mapped_column(Float, nullable=True)       # 省略時は TENANT_SUBMIT_RATE
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
 class User(Base):
     __tablename__ = "users"
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uuid_str)
+    org_id: Mapped[str] = mapped_column(String(36), default=DEFAULT_ORG_ID, nullable=False)
 
     email: Mapped[str | None] = mapped_column(String(320), nullable=True)
 
@@ -24,7 +39,8 @@ class User(Base):
     roster = relationship("Roster", back_populates="user", uselist=False)
 
     __table_args__ = (
-        UniqueConstraint('grade', 'name', name='uq_users_grade_name'),
+        UniqueConstraint('org_id', 'grade', 'name', name='uq_users_org_grade_name'),
+        Index('ix_users_org_email', 'org_id', 'email'),
     )
 
 
@@ -43,6 +59,7 @@ class Incident(Base):
 class Roster(Base):
     __tablename__ = "rosters"
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uuid_str)
+    org_id: Mapped[str] = mapped_column(String(36), default=DEFAULT_ORG_ID, nullable=False)
     user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     group_name: Mapped[str | None] = mapped_column(String(200), nullable=True)
@@ -51,7 +68,10 @@ class Roster(Base):
     user = relationship("User", back_populates="roster")
 
 
-    __table_args__ = (UniqueConstraint('user_id', name='uq_rosters_user'),)
+    __table_args__ = (
+        UniqueConstraint('user_id', name='uq_rosters_user'),
+        Index('ix_rosters_org_active', 'org_id', 'is_active', 'group_name'),
+    )
 
 
 class Report(Base):
@@ -87,4 +107,12 @@ class Token(Base):
     user_id: Mapped[str] = mapped_column(String(36), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     token: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
-    used_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
\ No newline at end of file
+    used_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class TokenUse(Base):
+    # 署名付きマジックリンク（app/magic_links.py）の使用記録。1回限りモードで使用ごとに1行（主キーで二重使用を防ぐ）
+    __tablename__ = "token_uses"
+    scope_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    digest: Mapped[str] = mapped_column(String(16), primary_key=True)   # 署名の先頭8バイト（16進）
+    used_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
@@ -1,8 +1,8 @@
 # app/models_persistent.py
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Text, DateTime, ForeignKey, Float, Integer
+from sqlalchemy import String, Text, DateTime, ForeignKey, Float, Integer, Index, UniqueConstraint, text
 from datetime import datetime
-from app.models import Base  # 既存の Base を共有
+from app.models import Base, DEFAULT_ORG_ID  # 既存の Base を共有
 import uuid
 
 def uuid_str() -> str:
@@ -11,10 +11,18 @@ def uuid_str() -> str:
 class Period(Base):
     __tablename__ = "periods"
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=uuid_str)
-    seq: Mapped[int] = mapped_column(Integer, unique=True, nullable=False)
+    org_id: Mapped[str] = mapped_column(String(36), default=DEFAULT_ORG_ID, nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)   # 組織ごとの通し番号
     started_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     ended_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
+    __table_args__ = (
+        UniqueConstraint("org_id", "seq", name="uq_periods_org_seq"),
+        # 組織ごとに開いている期間は1つ（ended_at IS NULL の部分一意索引）
+        Index("ux_periods_org_open", "org_id", unique=True,
+              sqlite_where=text("ended_at IS NULL"), postgresql_where=text("ended_at IS NULL")),
+    )
+
 class ReportP(Base):
     __tablename__ = "reports_p"
     period_id: Mapped[str] = mapped_column(String(36), ForeignKey("periods.id", ondelete="CASCADE"), primary_key=True)
@@ -31,6 +39,93 @@ class ReportP(Base):
     damage_level: Mapped[str | None] = mapped_column(String(20))
     damage_notes: Mapped[str | None] = mapped_column(Text)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # 避難先座標の geohash（app/geo.py）。地図のセル集計用
+    geo_cell: Mapped[str | None] = mapped_column(String(12))
+    # サーバーが書き込んだ時刻（updated_at はオフライン送信では端末時刻になる）。トリアージの差分取り込み用
+    written_at: Mapped[datetime | None] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_reports_p_period_geo", "period_id", "geo_cell"),
+        Index("ix_reports_p_triage", "period_id", "status", "damage_level", "updated_at"),
+        Index("ix_reports_p_written", "period_id", "written_at"),
+    )
+
+
+class SubmissionKeyP(Base):
+    # オフライン送信キューの再送を冪等にするためのキー（クライアント生成）
+    __tablename__ = "submission_keys_p"
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    period_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    user_id: Mapped[str] = mapped_column(String(36), nullable=False)
+    result: Mapped[str] = mapped_column(String(20), nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class ReminderDeliveryP(Base):
+    # 未報告者リマインドの宛先ごとの配信状態（再実行時に送信済みをスキップ）
+    __tablename__ = "reminder_deliveries_p"
+    period_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    email: Mapped[str] = mapped_column(String(320), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), nullable=False)  # 'sending' | 'sent' | 'failed'
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[str | None] = mapped_column(Text)
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class TriageClaimP(Base):
+    # トリアージの担当・対応済みの状態（ワーカー間で共有。app/triage.py）
+    __tablename__ = "triage_claims_p"
+    period_id: Mapped[str] = mapped_column(String(36), ForeignKey("periods.id", ondelete="CASCADE"), primary_key=True)
+    user_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    claimed_by: Mapped[str | None] = mapped_column(String(120))
+    claimed_at: Mapped[datetime | None] = mapped_column(DateTime)
+    acked_by: Mapped[str | None] = mapped_column(String(120))
+    # 対応済みにした時点の報告の updated_at（これより新しい報告が来たら再びキューに入る）
+    acked_at: Mapped[datetime | None] = mapped_column(DateTime)
+
+
+class SchedulerLease(Base):
+    # 定期ジョブのリーダー選出用のリース行（app/scheduler.py）
+    __tablename__ = "scheduler_leases"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(120), nullable=False)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class SchemaState(Base):
+    # 適用済みスキーマの指紋。一致すれば起動時の create_all / 反映を省略（app/bootstrap.py）
+    __tablename__ = "schema_state"
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class CacheGeneration(Base):
+    # ワーカー間のキャッシュ無効化用の世代番号（app/invalidation.py）
+    __tablename__ = "cache_generations"
+    topic: Mapped[str] = mapped_column(String(50), primary_key=True)
+    generation: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ReportTimelineP(Base):
+    # 期間開始からの分ごとの初回報告数（dim: all / group / grade。app/timeline.py）
+    __tablename__ = "report_timeline_p"
+    period_id: Mapped[str] = mapped_column(String(36), ForeignKey("periods.id", ondelete="CASCADE"), primary_key=True)
+    minute: Mapped[int] = mapped_column(Integer, primary_key=True)
+    dim: Mapped[str] = mapped_column(String(10), primary_key=True)
+    key: Mapped[str] = mapped_column(String(100), primary_key=True)
+    n: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class DashboardSnapshotP(Base):
+    # 期間ごとのダッシュボード読み取りモデル（JSON 文書と版番号。app/dashboard.py）
+    __tablename__ = "dashboard_snapshots"
+    period_id: Mapped[str] = mapped_column(String(36), ForeignKey("periods.id", ondelete="CASCADE"), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    built_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    doc: Mapped[str] = mapped_column(Text, nullable=False)
 
 
 class ReportHistoryP(Base):
@@ -40,3 +135,8 @@ class ReportHistoryP(Base):
     user_id: Mapped[str] = mapped_column(String(36), nullable=False)
     changed_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
     diff: Mapped[str | None] = mapped_column(Text)
+
+    __table_args__ = (
+        # 期間ごとにキー順で読む（app/archive.py）
+        Index("ix_report_history_p_period", "period_id", "id"),
+    )
@@ -0,0 +1,196 @@
+# app/pool_health.py
+# DB 接続プールの健全性管理（接続の貸し出しごとの pre-ping の代わりに、バックグラウンドの死活確認とサーキットブレーカー）
+#
+# - closed   : 通常。HEALTH_INTERVAL 秒ごとに SELECT 1 で確認する（リクエスト側の往復は増えない）。
+#              確認はプールを通さない専用の接続で行う（プールが使い切られていても DB の障害とは数えない）
+# - open     : 接続・問い合わせの切断系の失敗が FAILURE_THRESHOLD 回続いたら開く。プールを捨て、
+#              新しい接続は張らずに即 CircuitOpenError（OperationalError の一種）にする。
+#              公開フォームの送信は退避（app/spool.py）に、それ以外は 503 になる（接続タイムアウトを待たない）
+# - half_open: open 中は指数バックオフ＋ジッタの間隔で確認スレッドだけが接続を試し、成功すれば closed に戻す
+# プールの貸し出し待ちのタイムアウト（sqlalchemy.exc.TimeoutError）は混雑であって障害ではないので数えない
+# プール内の古い接続は pool_recycle と、切断検知時のプール無効化（SQLAlchemy 標準）で入れ替わる
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool
+
+log = logging.getLogger(__name__)
+
+HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "5"))
+FAILURE_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+BACKOFF_BASE = float(os.getenv("DB_BREAKER_BACKOFF", "0.5"))
+BACKOFF_MAX = float(os.getenv("DB_BREAKER_BACKOFF_MAX", "30"))
+TICK_SEC = 0.1
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class CircuitOpenError(OperationalError):
+    """ブレーカーが開いている間の接続要求。既存の OperationalError の扱い（退避・503）にそのまま乗る"""
+
+    def __init__(self, name: str, retry_in: float):
+        self.retry_in = retry_in
+        super().__init__(f"[{name}] database circuit open", None,
+                         ConnectionError(f"database circuit open, retry in {retry_in:.1f}s"))
+
+class PoolHealth:
+    def __init__(self, engine: Engine, name: str, threshold: int = FAILURE_THRESHOLD,
+                 interval: float = HEALTH_INTERVAL, backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX, probe_engine: Optional[Engine] = None):
+        self.engine = engine
+        # 確認用（同じ URL・プールなし）。ブレーカーの判定も通らない
+        self.probe_engine = probe_engine or create_engine(engine.url, poolclass=NullPool)
+        self.name = name
+        self.threshold = threshold
+        self.interval = interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0           # 連続失敗数
+        self.attempt = 0            # open 中の再接続の試行回数（バックオフの指数）
+        self.next_check = time.monotonic()
+        self.opened_at: Optional[datetime] = None
+        self.last_ok_at: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+        self.last_check_ms: Optional[float] = None
+        self.counters = {"opened": 0, "rejected": 0, "checks": 0, "check_failures": 0}
+
+    # --- 状態遷移 ---
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.last_ok_at = datetime.utcnow()
+            if self.state != CLOSED:
+                log.warning("db circuit %s closed after %d attempt(s)", self.name, self.attempt)
+                self.state = CLOSED
+                self.attempt = 0
+                self.next_check = time.monotonic() + self.interval
+
+    def record_failure(self, error: BaseException) -> None:
+        if isinstance(error, PoolTimeoutError):
+            return   # 貸し出し待ちのタイムアウト（プールの枯渇）
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.threshold):
+                self._open()
+        if self.state == OPEN:
+            # 死んだ接続をプールに残さない（次の貸し出しは新規接続 → 即拒否）
+            self.engine.pool.dispose()
+
+    def _open(self) -> None:
+        if self.state == CLOSED:
+            self.counters["opened"] += 1
+            self.opened_at = datetime.utcnow()
+            log.error("db circuit %s opened: %s", self.name, self.last_error)
+        self.state = OPEN
+        # 等分ジッタ: [b/2, b) の一様乱数（複数ワーカーの再接続が揃わないように）
+        b = min(self.backoff_max, self.backoff_base * (2 ** self.attempt))
+        self.attempt += 1
+        self.next_check = time.monotonic() + random.uniform(b / 2, b)
+
+    def allow_connect(self) -> bool:
+        return self.state == CLOSED
+
+    def retry_in(self) -> float:
+        return max(0.0, self.next_check - time.monotonic())
+
+    # --- 死活確認（確認スレッドから） ---
+    def check(self) -> bool:
+        with self._lock:
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+        t0 = time.perf_counter()
+        self.counters["checks"] += 1
+        try:
+            with self.probe_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:  # noqa: BLE001
+            self.counters["check_failures"] += 1
+            self.record_failure(e)
+            return False
+        finally:
+            self.last_check_ms = round((time.perf_counter() - t0) * 1000, 2)
+        self.record_success()
+        with self._lock:
+            self.next_check = time.monotonic() + self.interval
+        return True
+
+    def due(self) -> bool:
+        return time.monotonic() >= self.next_check
+
+    def status(self) -> dict:
+        pool = self.engine.pool
+        stats = {}
+        for k in ("size", "checkedin", "checkedout", "overflow"):
+            fn = getattr(pool, k, None)
+            if callable(fn):
+                stats[k] = fn()
+        return {
+            "name": self.name, "state": self.state, "consecutive_failures": self.failures,
+            "threshold": self.threshold, "retry_in_sec": round(self.retry_in(), 2) if self.state != CLOSED else None,
+            "opened_at": self.opened_at, "last_ok_at": self.last_ok_at, "last_error": self.last_error,
+            "last_check_ms": self.last_check_ms, "pool": {"class": type(pool).__name__, **stats},
+            **self.counters,
+        }
+
+_monitors: Dict[str, PoolHealth] = {}
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+def attach(engine: Engine, name: str, **kw) -> PoolHealth:
+    """エンジンに監視とブレーカーを付ける（_make_engine から呼ぶ）"""
+    h = PoolHealth(engine, name, **kw)
+
+    @event.listens_for(engine, "do_connect")
+    def _guard(dialect, conn_rec, cargs, cparams):
+        if not h.allow_connect():
+            h.counters["rejected"] += 1
+            raise CircuitOpenError(name, h.retry_in())
+
+    @event.listens_for(engine, "connect")
+    def _connected(dbapi_conn, conn_rec):
+        h.record_success()
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(ctx):
+        # 切断、または接続そのものの失敗（connection が無い）だけを数える。SQL の誤りなどは対象外
+        # （確認の失敗は確認用のエンジンで起きるので check() 側で数える）
+        if ctx.is_disconnect or ctx.connection is None:
+            h.record_failure(ctx.original_exception)
+
+    _monitors[name] = h
+    return h
+
+def get(name: str) -> Optional[PoolHealth]:
+    return _monitors.get(name)
+
+def status() -> dict:
+    return {name: h.status() for name, h in _monitors.items()}
+
+def _loop() -> None:
+    while not _stop.wait(TICK_SEC):
+        for h in list(_monitors.values()):
+            if h.due():
+                h.check()
+
+def start() -> None:
+    global _thread
+    if _thread is not None:
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="db-pool-health", daemon=True)
+    _thread.start()
+
+def stop() -> None:
+    global _thread
+    _stop.set()
+    _thread = None
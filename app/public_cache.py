@@ -0,0 +1,133 @@
+# app/public_cache.py
+# 公開ページ（/f）と名簿JSON（/public/roster）の事前レンダリング＋事前圧縮キャッシュ
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+from fastapi import Request
+from starlette.responses import Response
+from sqlalchemy.orm import Session
+
+from app.models_persistent import Period
+from app import invalidation, tenancy
+
+try:  # brotli は requirements.txt に含める（未導入の開発環境では gzip のみ）
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# CDN / リバースプロキシ向け。期間リセット後の反映は max-age 以内
+MAX_AGE = int(os.getenv("PUBLIC_CACHE_MAX_AGE", "60"))
+STALE_WHILE_REVALIDATE = int(os.getenv("PUBLIC_CACHE_SWR", "600"))
+
+class Payload(NamedTuple):
+    media_type: str
+    etag: str
+    identity: bytes
+    gzip: bytes
+    br: Optional[bytes]
+
+def build_payload(body: bytes, media_type: str) -> Payload:
+    etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+    return Payload(
+        media_type=media_type,
+        etag=etag,
+        identity=body,
+        gzip=gzip.compress(body, compresslevel=9, mtime=0),
+        br=brotli.compress(body, quality=11) if brotli else None,
+    )
+
+def _accepts(request: Request, coding: str) -> bool:
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+def respond(request: Request, payload: Payload) -> Response:
+    # 圧縮形式ごとに別 ETag（同一URLで表現が異なるため）
+    if payload.br is not None and _accepts(request, "br"):
+        body, coding, etag = payload.br, "br", f'"{payload.etag}-br"'
+    elif _accepts(request, "gzip"):
+        body, coding, etag = payload.gzip, "gzip", f'"{payload.etag}-gz"'
+    else:
+        body, coding, etag = payload.identity, None, f'"{payload.etag}"'
+
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": f"public, max-age={MAX_AGE}, stale-while-revalidate={STALE_WHILE_REVALIDATE}",
+    }
+    inm = request.headers.get("if-none-match")
+    if inm and etag in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if coding:
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type=payload.media_type, headers=headers)
+
+# --- 現在の期間（期間リセットまで不変。いずれも組織ごと） ---
+class PeriodSnapshot(NamedTuple):
+    id: str
+    seq: int
+    started_at: object
+
+_lock = threading.Lock()
+_period: Dict[str, Optional[PeriodSnapshot]] = {}   # 組織 → 現在の期間
+_form: Dict[Tuple[str, str], Payload] = {}          # (period.id（期間なしは組織）, URL接頭辞) → /f
+_roster: Dict[str, Tuple[int, Payload]] = {}        # 組織 → (名簿世代, /public/roster)
+_period_gen = 0   # invalidate_period のたびに進める（無効化前に読んだ期間を書き戻さないため）
+
+def current_period(db: Session) -> Optional[PeriodSnapshot]:
+    invalidation.ensure_fresh()
+    org_id = tenancy.current_id()
+    if org_id in _period:
+        return _period[org_id]
+    gen = _period_gen
+    cur = db.query(Period).filter(Period.org_id == org_id, Period.ended_at.is_(None)).one_or_none()
+    snap = PeriodSnapshot(cur.id, cur.seq, cur.started_at) if cur else None
+    with _lock:
+        # 読んでいる間にリセット（無効化）があれば、この結果は古いかもしれないので覚えない
+        if gen == _period_gen:
+            _period[org_id] = snap
+    return snap
+
+def cached_period() -> Optional[PeriodSnapshot]:
+    # DB を読まずに分かる現在の期間（未取得なら None）。DB 障害時の退避用
+    return _period.get(tenancy.current_id())
+
+def form_payload(period: Optional[PeriodSnapshot], render: Callable[[], str]) -> Payload:
+    # 同じ組織でも /o/<slug> 経由と Host 経由でフォームの送信先が違うため接頭辞もキーに含める
+    key = (period.id if period else tenancy.current_id(), tenancy.prefix())
+    p = _form.get(key)
+    if p is None:
+        p = build_payload(render().encode("utf-8"), "text/html; charset=utf-8")
+        with _lock:
+            _form[key] = p
+    return p
+
+def roster_payload(generation: int, grouped: Callable[[], dict]) -> Payload:
+    org_id = tenancy.current_id()
+    hit = _roster.get(org_id)
+    if hit is not None and hit[0] == generation:
+        return hit[1]
+    body = json.dumps(grouped(), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    p = build_payload(body, "application/json")
+    with _lock:
+        _roster[org_id] = (generation, p)
+    return p
+
+def invalidate_period() -> None:
+    global _period_gen
+    with _lock:
+        _period_gen += 1
+        _period.clear()
+        _form.clear()
+
+def invalidate_roster() -> None:
+    with _lock:
+        _roster.clear()
+
+invalidation.subscribe(invalidation.PERIOD, invalidate_period)
+invalidation.subscribe(invalidation.ROSTER, invalidate_roster)
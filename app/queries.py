@@ -0,0 +1,144 @@
+# app/queries.py
+# 参照系の定型クエリ（JSON API / 管理画面で共通）
+# モジュール読み込み時に Core の select を1度だけ組み立て、ORM セッションを介さず接続で実行する。
+# 任意の絞り込みは SQL 文字列を組み替えず、NULL なら無条件になるバインド変数で表す
+# （文が1種類に固定されるため、SQLAlchemy のコンパイル済みキャッシュとドライバの文キャッシュが効く）
+from typing import Optional
+from sqlalchemy import String, and_, bindparam, func, or_, select
+from sqlalchemy.engine import Connection, Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import User, Roster
+from app.models_persistent import Period, ReportP
+from app import invalidation, tenancy
+
+users = User.__table__
+rosters = Roster.__table__
+reports = ReportP.__table__
+periods = Period.__table__
+
+_pid = bindparam("pid", type_=String)
+_org = bindparam("org", type_=String)
+_uid = bindparam("uid", type_=String)
+# None なら全件（型を付けておくと Postgres でも `IS NULL` の型が決まる）
+_status = bindparam("status", type_=String)
+
+CURRENT_PERIOD = (
+    select(periods.c.id, periods.c.seq, periods.c.started_at, periods.c.ended_at)
+    .where(periods.c.org_id == _org, periods.c.ended_at.is_(None))
+)
+
+# 報告 × ユーザー × 名簿（グループ名）
+_report_join = (
+    reports.join(users, users.c.id == reports.c.user_id)
+    .outerjoin(rosters, rosters.c.user_id == users.c.id)
+)
+
+# 一覧の列（admin_persistent.ReportRow と同じ並び）
+_REPORT_COLUMNS = (
+    users.c.id.label("user_id"), users.c.name, users.c.email, rosters.c.group_name,
+    reports.c.status, reports.c.updated_at,
+    reports.c.shelter_type, reports.c.shelter_name, reports.c.shelter_addr,
+    reports.c.damage_level,
+)
+
+REPORTS = (
+    select(*_REPORT_COLUMNS)
+    .select_from(_report_join)
+    .where(reports.c.period_id == _pid, or_(_status.is_(None), reports.c.status == _status))
+    .order_by(reports.c.updated_at.desc())
+)
+
+REPORT_ROW = (
+    select(*_REPORT_COLUMNS)
+    .select_from(_report_join)
+    .where(reports.c.period_id == _pid, reports.c.user_id == _uid)
+    .limit(1)
+)
+
+REPORT_DETAIL = (
+    select(*_REPORT_COLUMNS[:-1], reports.c.shelter_lat, reports.c.shelter_lng,
+           reports.c.damage_level, reports.c.damage_notes)
+    .select_from(_report_join)
+    .where(reports.c.period_id == _pid, reports.c.user_id == _uid)
+    .limit(1)
+)
+
+def _blank(col):
+    return func.coalesce(col, "").label(col.name)
+
+# CSV 出力用（NULL は空文字）
+REPORTS_EXPORT = (
+    select(users.c.name, users.c.email, _blank(rosters.c.group_name),
+           reports.c.status, reports.c.updated_at,
+           _blank(reports.c.shelter_type), _blank(reports.c.shelter_name), _blank(reports.c.shelter_addr),
+           _blank(reports.c.damage_level), _blank(reports.c.damage_notes))
+    .select_from(_report_join)
+    .where(reports.c.period_id == _pid, or_(_status.is_(None), reports.c.status == _status))
+    .order_by(reports.c.updated_at.desc())
+)
+
+# アクティブ名簿のうち、期間内に報告の無い人（名簿は期間と同じ組織のもの）
+_period_org = select(periods.c.org_id).where(periods.c.id == _pid).scalar_subquery()
+_absent_from = (
+    rosters.join(users, users.c.id == rosters.c.user_id)
+    .outerjoin(reports, and_(reports.c.user_id == users.c.id, reports.c.period_id == _pid))
+)
+_absent_where = and_(rosters.c.org_id == _period_org, rosters.c.is_active == True, reports.c.user_id.is_(None))
+
+ABSENTEES = (
+    select(users.c.id, users.c.name, users.c.email, rosters.c.group_name)
+    .select_from(_absent_from).where(_absent_where).order_by(users.c.name)
+)
+
+ABSENTEES_DETAIL = (
+    select(users.c.id, users.c.name, users.c.email, users.c.dept, users.c.phone,
+           rosters.c.group_name, rosters.c.is_active)
+    .select_from(_absent_from).where(_absent_where).order_by(users.c.name)
+)
+
+def current_period(conn: Connection, org_id: Optional[str] = None) -> Optional[Row]:
+    # 省略時はこのリクエストの組織
+    return conn.execute(CURRENT_PERIOD, {"org": org_id or tenancy.current_id()}).first()
+
+def _open_period(db: Session, org_id: str) -> Optional[Period]:
+    return db.query(Period).filter(Period.org_id == org_id, Period.ended_at.is_(None)).one_or_none()
+
+def get_or_create_current_period(db: Session, org_id: Optional[str] = None) -> Period:
+    # 省略時はこのリクエストの組織
+    org_id = org_id or tenancy.current_id()
+    cur = _open_period(db, org_id)
+    if cur:
+        return cur
+    # 参照用セッション（レプリカ）でも呼ばれるため、作成は常にプライマリで行う。
+    # 他のワーカー・リクエストと同時に作ると ux_periods_org_open / uq_periods_org_seq に当たるので、
+    # その場合は巻き戻して相手が作った期間を読み直す
+    with SessionLocal() as w:
+        cur = _open_period(w, org_id)
+        if not cur:
+            max_seq = w.query(func.max(Period.seq)).filter(Period.org_id == org_id).scalar() or 0
+            w.add(Period(org_id=org_id, seq=int(max_seq) + 1))
+            try:
+                w.commit()
+                invalidation.publish(invalidation.PERIOD)
+            except IntegrityError:
+                w.rollback()
+            cur = _open_period(w, org_id)
+            if cur is None:   # 作った直後に別の処理が締めた（リセット）。次の呼び出しで作り直す
+                raise RuntimeError(f"no open period for org {org_id}")
+        w.expunge(cur)
+    return cur
+
+def current_period_or_create(conn: Connection):
+    # 定型クエリ用: 接続で引き、無ければ（初回のみ）プライマリで作成
+    row = current_period(conn)
+    if row is not None:
+        return row
+    with SessionLocal() as db:
+        return get_or_create_current_period(db)
+
+def report_params(period_id: str, status: Optional[str] = None) -> dict:
+    # 空文字の status（フォームの「すべて」）も絞り込み無し
+    return {"pid": period_id, "status": status or None}
@@ -0,0 +1,282 @@
+# app/reminders.py
+# 未報告者へのリマインドメール一斉送信（SMTP接続の再利用・並列数制限・バッチ・再試行）
+#
+# 宛先は送信前に reminder_deliveries_p へ 'sending' として取る（条件付き upsert）。
+# 複数ワーカーで同時に実行しても、同じ人へは1通だけ送る
+#
+# ローカル確認用のSMTPスタンドイン例（pip install aiosmtpd。受信したメールを標準出力に出す）:
+#   python -m aiosmtpd -n -l localhost:1025
+#   SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=0 で起動
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from string import Template
+from typing import Dict, List, Optional
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.models_persistent import ReminderDeliveryP
+from app import tenancy
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_FROM = os.getenv("SMTP_FROM", "no-reply@example.com")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "10"))
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+CONCURRENCY = int(os.getenv("REMINDER_CONCURRENCY", "4"))   # 同時SMTP接続数
+BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "100"))
+MAX_ATTEMPTS = 3
+# 'sending' のまま止まった宛先（送信中にワーカーが落ちた等）を取り直せるまでの時間
+CLAIM_TTL = timedelta(seconds=float(os.getenv("REMINDER_CLAIM_TTL", "900")))
+
+DEFAULT_SUBJECT = "【安否確認】未報告です / Safety check: please report (#$period_seq)"
+DEFAULT_BODY = """$name 様
+
+現在の安否確認（期間 #$period_seq）にまだ報告がありません。
+下記のフォームから安否状況を報告してください。
+
+Dear $name,
+We have not received your safety report for period #$period_seq yet.
+Please report your status using the form below.
+
+$form_url
+"""
+
+# 既送信者を除いた未報告者（アドレスは users.email、無ければ過去の報告の連絡先）をキー順にページング
+_PAGE_SQL = text("""
+    SELECT u.id, u.name,
+           COALESCE(NULLIF(u.email, ''),
+                    (SELECT rp2.contact_email FROM reports_p rp2
+                     WHERE rp2.user_id = u.id AND COALESCE(rp2.contact_email, '') <> ''
+                     ORDER BY rp2.updated_at DESC LIMIT 1)) AS email
+    FROM rosters rro
+    JOIN users u ON u.id = rro.user_id
+    LEFT JOIN reports_p rp ON rp.user_id = u.id AND rp.period_id = :pid
+    LEFT JOIN reminder_deliveries_p rd ON rd.user_id = u.id AND rd.period_id = :pid
+    WHERE rro.is_active = TRUE
+      AND rro.org_id = (SELECT p.org_id FROM periods p WHERE p.id = :pid)
+      AND rp.user_id IS NULL
+      AND (rd.status IS NULL OR rd.status <> 'sent')
+      AND u.id > :after
+    ORDER BY u.id
+    LIMIT :limit
+""")
+
+# 宛先の取得。未配信なら作り、失敗・期限切れの送信中なら取り直す。取れた時だけ行が返る
+# （Postgres では同時に同じ宛先を取り合うと後の側は先の確定を待ってから条件を評価する）
+_CLAIM_SQL = text("""
+    INSERT INTO reminder_deliveries_p (period_id, user_id, email, status, attempts, updated_at)
+    VALUES (:pid, :uid, :email, 'sending', 0, :now)
+    ON CONFLICT (period_id, user_id) DO UPDATE
+        SET status = 'sending', email = excluded.email, updated_at = excluded.updated_at
+        WHERE reminder_deliveries_p.status = 'failed'
+           OR (reminder_deliveries_p.status = 'sending' AND reminder_deliveries_p.updated_at < :stale)
+    RETURNING user_id
+""")
+
+class SmtpPool:
+    """SMTP接続を使い回す簡易プール（スレッドごとに1本借りて返す）"""
+
+    def __init__(self, size: int):
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue(maxsize=size)
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT)
+        if SMTP_STARTTLS:
+            conn.starttls()
+        if SMTP_USER:
+            conn.login(SMTP_USER, SMTP_PASSWORD)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self) -> smtplib.SMTP:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn: smtplib.SMTP, broken: bool = False) -> None:
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.quit()
+
+    def close(self) -> None:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                conn.quit()
+            except Exception:
+                pass
+
+def _is_permanent(e: Exception) -> bool:
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in e.recipients.values())
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code >= 500
+    return False
+
+# --- 実行状態（プロセス内） ---
+_state_lock = threading.Lock()
+_running = False
+_last_run: Optional[dict] = None
+
+def is_running() -> bool:
+    return _running
+
+def last_run() -> Optional[dict]:
+    return _last_run
+
+def run_reminders(period_id: str, period_seq: int,
+                  subject: str | None = None, body: str | None = None) -> dict:
+    global _running, _last_run
+    with _state_lock:
+        if _running:
+            raise RuntimeError("reminder job already running")
+        _running = True
+    try:
+        stats = _run(period_id, period_seq, subject or DEFAULT_SUBJECT, body or DEFAULT_BODY)
+        _last_run = stats
+        return stats
+    finally:
+        _running = False
+
+def _run(period_id: str, period_seq: int, subject: str, body: str) -> dict:
+    started = time.perf_counter()
+    stats: Dict[str, object] = {
+        "period_id": period_id, "started_at": datetime.utcnow(),
+        "candidates": 0, "sent": 0, "failed": 0, "skipped_no_email": 0, "skipped_claimed": 0, "retries": 0,
+    }
+    # 期間・URLなど全員共通の部分はここで1回だけ埋め、宛先ごとには氏名だけ差し込む
+    # （URL は起動したリクエストの組織のフォーム。バックグラウンドタスクにも組織は引き継がれる）
+    shared = {"period_seq": period_seq, "form_url": f"{PUBLIC_BASE_URL}{tenancy.path_prefix(tenancy.current())}/f"}
+    subject_t = Template(Template(subject).safe_substitute(shared))
+    body_t = Template(Template(body).safe_substitute(shared))
+
+    pool = SmtpPool(CONCURRENCY)
+    counter_lock = threading.Lock()
+
+    def send_one(user_id: str, name: str, email: str) -> dict:
+        try:
+            msg = EmailMessage()
+            msg["From"] = SMTP_FROM
+            msg["To"] = email
+            msg["Subject"] = subject_t.safe_substitute(name=name)
+            msg.set_content(body_t.safe_substitute(name=name))
+        except ValueError as e:
+            # 宛先・氏名の改行（ヘッダインジェクション）など。この宛先だけ失敗にして続ける
+            return {"user_id": user_id, "email": email, "status": "failed", "attempts": 1,
+                    "error": f"{type(e).__name__}: {e}"}
+        last_error = None
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            conn = None
+            try:
+                conn = pool.acquire()
+                conn.send_message(msg)
+                pool.release(conn)
+                return {"user_id": user_id, "email": email, "status": "sent", "attempts": attempt, "error": None}
+            except Exception as e:  # noqa: BLE001  SMTP/ソケット例外をまとめて扱う
+                last_error = f"{type(e).__name__}: {e}"
+                if conn is not None:
+                    # 応答エラーなら接続自体は生きているので返却、それ以外は破棄
+                    pool.release(conn, broken=not isinstance(e, smtplib.SMTPResponseException))
+                if _is_permanent(e) or attempt == MAX_ATTEMPTS:
+                    break
+                with counter_lock:
+                    stats["retries"] += 1
+                time.sleep(0.5 * 2 ** (attempt - 1))
+        return {"user_id": user_id, "email": email, "status": "failed", "attempts": attempt, "error": last_error}
+
+    after = ""
+    try:
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+            while True:
+                with SessionLocal() as db:
+                    rows = db.execute(_PAGE_SQL, {"pid": period_id, "after": after, "limit": BATCH_SIZE}).all()
+                if not rows:
+                    break
+                after = rows[-1][0]
+                stats["candidates"] += len(rows)
+                with_email = [r for r in rows if r[2]]
+                stats["skipped_no_email"] += len(rows) - len(with_email)
+                mine = _claim(period_id, with_email)
+                stats["skipped_claimed"] += len(with_email) - len(mine)
+                futures = [ex.submit(send_one, uid, name, email)
+                           for uid, name, email in with_email if uid in mine]
+                results = [f.result() for f in futures]
+                _record(period_id, results)
+                for r in results:
+                    stats[r["status"]] += 1
+    finally:
+        pool.close()
+
+    elapsed = time.perf_counter() - started
+    stats.update(
+        finished_at=datetime.utcnow(),
+        elapsed_sec=round(elapsed, 3),
+        smtp_connections=pool.opened,
+        messages_per_sec=round(stats["sent"] / elapsed, 2) if elapsed > 0 else None,
+    )
+    return stats
+
+def _claim(period_id: str, rows) -> set:
+    # このページの宛先を取る（1トランザクション）。他のワーカーが送信中・送信済みの宛先は返らない
+    if not rows:
+        return set()
+    now = datetime.utcnow()
+    mine = set()
+    with SessionLocal() as db:
+        for uid, _, email in rows:
+            got = db.execute(_CLAIM_SQL, {"pid": period_id, "uid": uid, "email": email,
+                                          "now": now, "stale": now - CLAIM_TTL}).first()
+            if got is not None:
+                mine.add(uid)
+        db.commit()
+    return mine
+
+def _record(period_id: str, results: List[dict]) -> None:
+    # バッチ単位で配信状態を保存（再実行時は sent をスキップ）
+    if not results:
+        return
+    now = datetime.utcnow()
+    with SessionLocal() as db:
+        existing = {
+            d.user_id: d for d in db.query(ReminderDeliveryP).filter(
+                ReminderDeliveryP.period_id == period_id,
+                ReminderDeliveryP.user_id.in_([r["user_id"] for r in results]),
+            )
+        }
+        for r in results:
+            d = existing.get(r["user_id"])
+            if d is None:
+                d = ReminderDeliveryP(period_id=period_id, user_id=r["user_id"], attempts=0)
+                db.add(d)
+            d.email = r["email"]
+            d.status = r["status"]
+            d.attempts = (d.attempts or 0) + r["attempts"]
+            d.last_error = r["error"]
+            d.updated_at = now
+            if r["status"] == "sent":
+                d.sent_at = now
+        db.commit()
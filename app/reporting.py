@@ -0,0 +1,55 @@
+# app/reporting.py
+# 報告の書き込み経路（フォーム送信・一括送信で共通）
+from datetime import datetime
+from typing import Callable, List, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models_persistent import ReportP, ReportHistoryP
+from app import geo, search, timeline
+
+# commit 成功後に呼ばれるリスナー（メモリ内の索引・キューの同期用）
+_committed_listeners: List[Callable[[List[dict]], None]] = []
+
+def on_committed(fn: Callable[[List[dict]], None]) -> None:
+    if fn not in _committed_listeners:
+        _committed_listeners.append(fn)
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session) -> None:
+    writes = session.info.pop("report_writes", None)
+    if writes:
+        for fn in _committed_listeners:
+            fn(writes)
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session) -> None:
+    session.info.pop("report_writes", None)
+
+def apply_report(db: Session, period_id: str, user_id: str, payload: dict,
+                 rep: Optional[ReportP], updated_at: Optional[datetime] = None) -> ReportP:
+    """
+    報告の upsert（履歴を残して上書き）。commit は呼び出し側で行う。
+    updated_at を渡すとその時刻を最終更新として記録する（オフライン送信の端末時刻）。
+    """
+    now = datetime.utcnow()
+    if rep:
+        hist = ReportHistoryP(period_id=period_id, user_id=user_id, diff=f"updated_at={now.isoformat()}")
+        db.add(hist)
+        for k, v in payload.items():
+            setattr(rep, k, v)
+    else:
+        rep = ReportP(period_id=period_id, user_id=user_id, **payload)
+        db.add(rep)
+        timeline.record_first(db, period_id, user_id, updated_at or now)
+    if updated_at is not None:
+        rep.updated_at = updated_at
+    rep.written_at = now
+    rep.geo_cell = geo.cell_for(rep.shelter_lat, rep.shelter_lng)
+    db.info.setdefault("report_writes", []).append({
+        "period_id": period_id, "user_id": user_id,
+        "status": rep.status, "damage_level": rep.damage_level,
+        "updated_at": updated_at or now,
+    })
+    search.sync(db, period_id, user_id)
+    return rep
@@ -0,0 +1,132 @@
+# app/roster_bulk.py
+# 名簿の一括操作（無効化・有効化・名簿から削除・ユーザー削除・グループ移動）
+# キーを一時表に入れ、突き合わせと更新を集合演算の数文で行う（件数によらず文の数は一定）
+import csv
+import io
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import invalidation, search, tenancy
+from app.utils import normalize_grade
+
+ACTIONS = ("deactivate", "activate", "delete_roster", "delete_user", "move_group")
+KINDS = ("id", "email", "grade_name")
+
+Key = Tuple[str, str, str]   # (kind, k1, k2)  grade_name のときは (grade, name)、それ以外は k2 = ""
+# grade は公開フォームと同じ規則で揃えてから突き合わせる（"m" → "Master" など）
+
+def keys_from(ids: Iterable[str] = (), emails: Iterable[str] = (),
+              members: Iterable[Tuple[str, str]] = ()) -> List[Key]:
+    keys: List[Key] = [("id", i.strip(), "") for i in ids if i and i.strip()]
+    keys += [("email", e.strip(), "") for e in emails if e and e.strip()]
+    keys += [("grade_name", normalize_grade(g), n.strip()) for g, n in members if g and n and g.strip() and n.strip()]
+    return keys
+
+def keys_from_csv(content: str, kinds: Tuple[str, ...] = KINDS) -> List[Key]:
+    """
+    ヘッダーに id(user_id) / email / grade+name のいずれかを持つCSV。
+    1行につき、kinds に含まれる種別のうち最初に見つかったキーを使う
+    """
+    keys: List[Key] = []
+    for row in csv.DictReader(io.StringIO(content)):
+        uid = (row.get("id") or row.get("user_id") or "").strip()
+        email = (row.get("email") or "").strip()
+        grade = (row.get("grade") or "").strip()
+        name = (row.get("name") or "").strip()
+        if uid and "id" in kinds:
+            keys.append(("id", uid, ""))
+        elif email and "email" in kinds:
+            keys.append(("email", email, ""))
+        elif grade and name and "grade_name" in kinds:
+            keys.append(("grade_name", normalize_grade(grade), name))
+    return keys
+
+def topics(action: str) -> Tuple[str, ...]:
+    # commit 後に通知する無効化トピック。ユーザー削除は報告も消えるのでトリアージのキューも捨てさせる
+    if action == "delete_user":
+        return (invalidation.ROSTER, invalidation.TRIAGE)
+    return (invalidation.ROSTER,)
+
+def _key_dict(kind: str, k1: str, k2: str) -> Dict[str, str]:
+    if kind == "grade_name":
+        return {"grade": k1, "name": k2}
+    return {kind: k1}
+
+def apply(db: Session, action: str, keys: List[Key], group_name: Optional[str] = None,
+          org_id: Optional[str] = None) -> dict:
+    """
+    一括操作を呼び出し側のトランザクション内で実行する（commit と topics(action) の通知は呼び出し側）。
+    突き合わせは組織（省略時はこのリクエストの組織）のユーザーに限る。
+    戻り値: 要求数・一致したユーザー数・変更行数・一致しなかったキー
+    """
+    if action not in ACTIONS:
+        raise ValueError(f"unknown action: {action}")
+    org = {"org": org_id or tenancy.current_id()}
+    # Postgres: commit/rollback で消える一時表。SQLite: 接続ごとに残るので使う前に空にする
+    pg = db.get_bind().dialect.name == "postgresql"
+    opts = ("", " ON COMMIT DROP") if pg else (" IF NOT EXISTS", "")
+    db.execute(text(f"CREATE TEMP TABLE{opts[0]} bulk_keys "
+                    f"(pos INTEGER, kind VARCHAR(10), k1 VARCHAR(320), k2 VARCHAR(200)){opts[1]}"))
+    db.execute(text(f"CREATE TEMP TABLE{opts[0]} bulk_matches (pos INTEGER, user_id VARCHAR(36)){opts[1]}"))
+    if not pg:
+        db.execute(text("DELETE FROM temp.bulk_keys"))
+        db.execute(text("DELETE FROM temp.bulk_matches"))
+    try:
+        if keys:
+            db.execute(text("INSERT INTO bulk_keys (pos, kind, k1, k2) VALUES (:pos, :kind, :k1, :k2)"),
+                       [{"pos": i, "kind": k, "k1": a, "k2": b} for i, (k, a, b) in enumerate(keys)])
+        # キー種別ごとに索引で突き合わせ（OR 結合にしない）
+        db.execute(text("""
+            INSERT INTO bulk_matches (pos, user_id)
+            SELECT k.pos, u.id FROM bulk_keys k JOIN users u ON u.id = k.k1
+            WHERE k.kind = 'id' AND u.org_id = :org
+            UNION ALL
+            SELECT k.pos, u.id FROM bulk_keys k JOIN users u ON u.org_id = :org AND u.email = k.k1
+            WHERE k.kind = 'email'
+            UNION ALL
+            SELECT k.pos, u.id FROM bulk_keys k JOIN users u ON u.org_id = :org AND u.grade = k.k1 AND u.name = k.k2
+            WHERE k.kind = 'grade_name'
+        """), org)
+        unmatched = [_key_dict(*r) for r in db.execute(text("""
+            SELECT kind, k1, k2 FROM bulk_keys k
+            WHERE NOT EXISTS (SELECT 1 FROM bulk_matches m WHERE m.pos = k.pos)
+            ORDER BY pos
+        """))]
+        matched = int(db.execute(text("SELECT COUNT(DISTINCT user_id) FROM bulk_matches")).scalar() or 0)
+        targets = "(SELECT user_id FROM bulk_matches)"
+
+        if action in ("activate", "move_group"):
+            # 名簿に行が無いユーザーは名簿へ追加する（単体のトグルと同じ扱い）
+            missing = db.execute(text("""
+                SELECT DISTINCT m.user_id FROM bulk_matches m
+                WHERE NOT EXISTS (SELECT 1 FROM rosters r WHERE r.user_id = m.user_id)
+            """)).scalars().all()
+            if missing:
+                db.execute(text("INSERT INTO rosters (id, org_id, user_id, is_active, group_name) "
+                                "VALUES (:id, :org, :uid, TRUE, NULL)"),
+                           [{"id": str(uuid.uuid4()), "uid": uid, **org} for uid in missing])
+
+        if action == "deactivate":
+            affected = db.execute(text(f"UPDATE rosters SET is_active = FALSE WHERE user_id IN {targets}")).rowcount
+        elif action == "activate":
+            affected = db.execute(text(f"UPDATE rosters SET is_active = TRUE WHERE user_id IN {targets}")).rowcount
+        elif action == "move_group":
+            affected = db.execute(text(f"UPDATE rosters SET group_name = :g WHERE user_id IN {targets}"),
+                                  {"g": group_name or None}).rowcount
+        elif action == "delete_roster":
+            affected = db.execute(text(f"DELETE FROM rosters WHERE user_id IN {targets}")).rowcount
+        else:
+            # Postgres では ON DELETE CASCADE で消えるが、SQLite は外部キー無効のため明示的に消す
+            # （全文検索の表は reports_p の rowid で引くので、報告より先に消す）
+            search.forget_users(db, targets)
+            for child in ("rosters", "reports_p", "reports", "tokens"):
+                db.execute(text(f"DELETE FROM {child} WHERE user_id IN {targets}"))
+            affected = db.execute(text(f"DELETE FROM users WHERE id IN {targets}")).rowcount
+    finally:
+        if not pg:
+            db.execute(text("DELETE FROM temp.bulk_keys"))
+            db.execute(text("DELETE FROM temp.bulk_matches"))
+    return {"action": action, "requested": len(keys), "matched": matched,
+            "affected": affected, "unmatched": unmatched}
@@ -0,0 +1,184 @@
+# app/roster_index.py
+# アクティブ名簿のメモリ内索引（正規化完全一致 / 前方一致 / あいまい検索）
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from app.models import User, Roster
+from app import invalidation, tenancy
+
+# 氏名の比較で無視する区切り文字（NFKC 後の形で列挙）
+_IGNORED = set(" \t　・.-_'’")
+
+def normalize_name(s: str) -> str:
+    """
+    氏名を比較用キーに正規化する。
+    - NFKC（全角英数→半角、半角カナ→全角カナ など）
+    - 大文字小文字の同一視
+    - カタカナ→ひらがな
+    - 空白・中黒などの区切りを除去
+    """
+    s = unicodedata.normalize("NFKC", s or "").casefold()
+    out = []
+    for ch in s:
+        if ch in _IGNORED or ch.isspace():
+            continue
+        o = ord(ch)
+        if 0x30A1 <= o <= 0x30F6:  # ァ..ヶ → ぁ..ゖ
+            ch = chr(o - 0x60)
+        out.append(ch)
+    return "".join(out)
+
+def _bigrams(key: str) -> set:
+    padded = f"^{key}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+class RosterEntry(NamedTuple):
+    user_id: str
+    grade: str
+    name: str
+    key: str
+
+class RosterIndex:
+    def __init__(self, entries: List[RosterEntry], generation: int = 0):
+        self.generation = generation
+        self.entries = entries
+        # (grade, key) → entries（同じキーに正規化される別人は稀だが一応リストで持つ）
+        self._exact: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        # 前方一致用：正規化キーでソートした (key, idx)
+        self._sorted: List[Tuple[str, int]] = []
+        # あいまい検索用：bigram → idx の転置索引と、各エントリの bigram 数
+        self._grams: Dict[str, List[int]] = defaultdict(list)
+        self._gram_counts: List[int] = []
+        for i, e in enumerate(entries):
+            self._exact[(e.grade, e.key)].append(i)
+            self._sorted.append((e.key, i))
+            grams = _bigrams(e.key)
+            self._gram_counts.append(len(grams))
+            for g in grams:
+                self._grams[g].append(i)
+        self._sorted.sort()
+        self._sorted_keys = [k for k, _ in self._sorted]
+        self._by_id: Dict[str, RosterEntry] = {e.user_id: e for e in entries}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, user_id: str) -> Optional[RosterEntry]:
+        return self._by_id.get(user_id)
+
+    def lookup(self, grade: str, name: str) -> Optional[RosterEntry]:
+        """正規化後の完全一致。同じキーが複数ある場合は表記まで一致するものだけ返す"""
+        hits = self._exact.get((grade, normalize_name(name)))
+        if not hits:
+            return None
+        if len(hits) == 1:
+            return self.entries[hits[0]]
+        for i in hits:
+            if self.entries[i].name == name:
+                return self.entries[i]
+        return None
+
+    def prefix(self, q: str, grade: str | None = None, limit: int = 10) -> List[RosterEntry]:
+        key = normalize_name(q)
+        if not key:
+            return []
+        out = []
+        pos = bisect.bisect_left(self._sorted_keys, key)
+        while pos < len(self._sorted) and self._sorted_keys[pos].startswith(key):
+            e = self.entries[self._sorted[pos][1]]
+            if grade is None or e.grade == grade:
+                out.append(e)
+                if len(out) >= limit:
+                    break
+            pos += 1
+        return out
+
+    def fuzzy(self, q: str, grade: str | None = None, limit: int = 10,
+              min_score: float = 0.35) -> List[Tuple[RosterEntry, float]]:
+        key = normalize_name(q)
+        if not key:
+            return []
+        qgrams = _bigrams(key)
+        overlap: Dict[int, int] = defaultdict(int)
+        for g in qgrams:
+            for i in self._grams.get(g, ()):
+                overlap[i] += 1
+        scored = []
+        for i, n in overlap.items():
+            e = self.entries[i]
+            if grade is not None and e.grade != grade:
+                continue
+            score = 2.0 * n / (len(qgrams) + self._gram_counts[i])  # Dice 係数
+            if score >= min_score:
+                scored.append((e, score))
+        scored.sort(key=lambda t: (-t[1], t[0].key))
+        return scored[:limit]
+
+    def search(self, q: str, grade: str | None = None, limit: int = 10) -> List[Tuple[RosterEntry, float]]:
+        """タイプアヘッド用：前方一致（スコア1.0）を優先し、残りをあいまい一致で補う"""
+        out: List[Tuple[RosterEntry, float]] = [(e, 1.0) for e in self.prefix(q, grade, limit)]
+        seen = {e.user_id for e, _ in out}
+        if len(out) < limit:
+            for e, score in self.fuzzy(q, grade, limit):
+                if e.user_id not in seen:
+                    out.append((e, round(score, 3)))
+                    seen.add(e.user_id)
+                    if len(out) >= limit:
+                        break
+        return out
+
+# --- プロセス内で共有する索引（組織ごと。org_id 省略時はこのリクエストの組織） ---
+_lock = threading.Lock()
+_indexes: Dict[str, RosterIndex] = {}
+_generation = 0
+
+def generation() -> int:
+    return _generation
+
+def invalidate() -> None:
+    global _generation
+    with _lock:
+        _indexes.clear()
+        _generation += 1
+
+def build_index(db: Session, generation: int = 0, org_id: Optional[str] = None) -> RosterIndex:
+    rows = db.query(User.id, User.grade, User.name)\
+             .join(Roster, Roster.user_id == User.id)\
+             .filter(Roster.org_id == (org_id or tenancy.current_id()), Roster.is_active == True)\
+             .order_by(User.grade, User.name).all()
+    entries = [RosterEntry(uid, g, n, normalize_name(n)) for uid, g, n in rows]
+    return RosterIndex(entries, generation)
+
+def get_index(db: Session, org_id: Optional[str] = None) -> RosterIndex:
+    invalidation.ensure_fresh()
+    org_id = org_id or tenancy.current_id()
+    idx = _indexes.get(org_id)
+    if idx is not None:
+        return idx
+    with _lock:
+        if org_id not in _indexes:
+            _indexes[org_id] = build_index(db, _generation, org_id)
+        return _indexes[org_id]
+
+def cached(org_id: Optional[str] = None) -> Optional[RosterIndex]:
+    # DB を読まずに使える索引（未構築なら None）。DB 障害時の受付判定用
+    return _indexes.get(org_id or tenancy.current_id())
+
+def resolve_user_id(db: Session, grade: str, name: str, active_only: bool = True,
+                    org_id: Optional[str] = None) -> Optional[str]:
+    # まずメモリ内索引（表記ゆれ吸収）で引き、外れた場合のみDBで完全一致を確認
+    org_id = org_id or tenancy.current_id()
+    entry = get_index(db, org_id).lookup(grade, name)
+    if entry:
+        return entry.user_id
+    q = db.query(User.id).filter(User.org_id == org_id, User.grade == grade, User.name == name)
+    if active_only:
+        q = q.join(Roster, Roster.user_id == User.id).filter(Roster.is_active == True)
+    row = q.one_or_none()
+    return row[0] if row else None
+
+invalidation.subscribe(invalidation.ROSTER, invalidate)
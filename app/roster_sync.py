@@ -0,0 +1,216 @@
+# app/roster_sync.py
+# 名簿CSVと現在の名簿の差分同期（変わった行だけを書き込む）
+# 行ごとにハッシュを取り、現在の状態（1クエリでメモリに載せる）と比較して
+# 追加・変更・削除（置換モードのみ、無効化）を求める。dry_run では差分だけを返す
+import csv
+import hashlib
+import io
+import uuid
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import tenancy
+from app.utils import normalize_grade
+
+# CSVに列があるものだけを比較・更新する（無い列は既存の値を保つ）
+USER_FIELDS = ("grade", "name", "email", "dept", "phone")
+ROSTER_FIELDS = ("group_name", "is_active")
+DEFAULT_GRADE = "Staff"   # 学年/職位の列が無い行（migrations_bootstrap と同じ既定値）
+PREVIEW_LIMIT = 200       # 差分の明細として返す最大件数（件数は全件）
+
+class Incoming(NamedTuple):
+    line: int
+    values: Dict[str, object]
+
+class Current(NamedTuple):
+    user_id: str
+    values: Dict[str, object]
+    has_roster: bool
+
+def _truthy(v: str) -> bool:
+    return str(v).strip().lower() in ("true", "1", "yes", "y", "on")
+
+def _row_hash(values: Dict[str, object], fields: Tuple[str, ...]) -> str:
+    h = hashlib.sha1()
+    for f in fields:
+        h.update(f"{f}={values.get(f)!r}\x00".encode("utf-8"))
+    return h.hexdigest()
+
+def parse_csv(content: str) -> Tuple[List[Incoming], Tuple[str, ...], List[dict]]:
+    """戻り値: (取り込む行, CSVに存在する比較対象の列, 読み飛ばした行)"""
+    reader = csv.DictReader(io.StringIO(content))
+    header = set(reader.fieldnames or [])
+    # 氏名と有効フラグ（列が無ければ有効）は常に比較する
+    fields = tuple(f for f in USER_FIELDS + ROSTER_FIELDS if f in header or f in ("name", "is_active"))
+    rows: List[Incoming] = []
+    skipped: List[dict] = []
+    for i, row in enumerate(reader, start=2):
+        name = (row.get("name") or "").strip()
+        if not name:
+            skipped.append({"line": i, "reason": "name is required"})
+            continue
+        v: Dict[str, object] = {
+            "grade": normalize_grade(row.get("grade") or "") or DEFAULT_GRADE,
+            "name": name,
+            "is_active": _truthy(row.get("is_active") or "true"),
+        }
+        for f in ("email", "dept", "phone", "group_name"):
+            if f in fields:
+                v[f] = (row.get(f) or "").strip() or None
+        rows.append(Incoming(i, v))
+    return rows, fields, skipped
+
+def load_current(db: Session, org_id: str) -> List[Current]:
+    rows = db.execute(text("""
+        SELECT u.id, u.grade, u.name, u.email, u.dept, u.phone,
+               r.group_name, r.is_active, r.user_id IS NOT NULL AS has_roster
+        FROM users u
+        LEFT JOIN rosters r ON r.user_id = u.id
+        WHERE u.org_id = :org
+    """), {"org": org_id}).all()
+    return [
+        Current(uid, {"grade": g, "name": n, "email": e or None, "dept": d or None, "phone": p or None,
+                      "group_name": grp or None, "is_active": bool(act) if has else False}, bool(has))
+        for uid, g, n, e, d, p, grp, act, has in rows
+    ]
+
+def compute_diff(db: Session, content: str, replace: bool, org_id: Optional[str] = None) -> dict:
+    # 組織（省略時はこのリクエストの組織）の名簿と比べる
+    org_id = org_id or tenancy.current_id()
+    incoming, fields, skipped = parse_csv(content)
+    current = load_current(db, org_id)
+    by_email = {c.values["email"]: c for c in current if c.values["email"]}
+    by_grade_name = {(c.values["grade"], c.values["name"]): c for c in current}
+    cur_hash = {c.user_id: _row_hash(c.values, fields) for c in current}
+
+    inserts: List[dict] = []
+    changes: List[dict] = []
+    conflicts: List[dict] = []
+    matched: Dict[str, int] = {}   # user_id -> CSVの行番号
+    referenced = set()             # 衝突で取り込まなかったが、CSVに載っている既存ユーザー
+    new_keys: Dict[Tuple[str, str], int] = {}
+    unchanged = 0
+    for row in incoming:
+        v = row.values
+        gn = (v["grade"], v["name"])
+        # メールがあればメールで、無ければ (学年, 氏名) で既存ユーザーと対応付ける
+        cur = by_email.get(v.get("email")) if v.get("email") else None
+        cur = cur or by_grade_name.get(gn)
+        if cur is None:
+            if gn in new_keys:
+                conflicts.append({"line": row.line, "reason": f"duplicate of line {new_keys[gn]}", **_key(v)})
+                continue
+            new_keys[gn] = row.line
+            inserts.append({"line": row.line, "user_id": str(uuid.uuid4()), "values": v})
+            continue
+        if cur.user_id in matched:
+            conflicts.append({"line": row.line, "reason": f"duplicate of line {matched[cur.user_id]}", **_key(v)})
+            continue
+        other = by_grade_name.get(gn) if "grade" in fields else None
+        if other is not None and other.user_id != cur.user_id:
+            referenced.update((cur.user_id, other.user_id))
+            conflicts.append({"line": row.line, "reason": "grade+name belongs to another user", **_key(v)})
+            continue
+        matched[cur.user_id] = row.line
+        if _row_hash(v, fields) == cur_hash[cur.user_id] and cur.has_roster:
+            unchanged += 1
+            continue
+        diff = {f: [cur.values.get(f), v[f]] for f in fields if cur.values.get(f) != v.get(f)}
+        changes.append({"line": row.line, "user_id": cur.user_id, "values": v, "fields": diff,
+                        "has_roster": cur.has_roster})
+
+    removes: List[dict] = []
+    if replace:
+        # CSVに無い有効な名簿行は無効化（ユーザー・報告は残す）。衝突した行が指す人はCSVに載っているので残す
+        removes = [{"user_id": c.user_id, **_key(c.values)} for c in current
+                   if c.user_id not in matched and c.user_id not in referenced
+                   and c.has_roster and c.values["is_active"]]
+
+    # プレビューと適用の間に名簿が変わっていないかを確かめるための値
+    token = hashlib.sha1(org_id.encode("utf-8"))
+    for d in inserts:
+        token.update(repr(("I", d["line"], sorted(d["values"].items()))).encode("utf-8"))
+    for d in changes:
+        token.update(repr(("C", d["user_id"], sorted(d["fields"].items()))).encode("utf-8"))
+    for d in removes:
+        token.update(repr(("R", d["user_id"])).encode("utf-8"))
+    return {
+        "org_id": org_id,
+        "replace": replace,
+        "fields": list(fields),
+        "inserts": inserts, "changes": changes, "removes": removes,
+        "unchanged": unchanged, "conflicts": conflicts, "skipped": skipped,
+        "diff_token": token.hexdigest(),
+    }
+
+def _key(v: Dict[str, object]) -> dict:
+    return {"grade": v.get("grade"), "name": v.get("name"), "email": v.get("email")}
+
+def apply_diff(db: Session, diff: dict) -> dict:
+    """差分だけを書き込む（commit と ROSTER の通知は呼び出し側）"""
+    fields = diff["fields"]
+    user_cols = [f for f in USER_FIELDS if f in fields]
+    roster_cols = [f for f in ROSTER_FIELDS if f in fields]
+
+    if diff["inserts"]:
+        # 新規ユーザーは grade 必須（列が無ければ既定値）
+        cols = [f for f in USER_FIELDS if f in fields or f == "grade"]
+        db.execute(text(f"""
+            INSERT INTO users (id, org_id, role, {", ".join(cols)})
+            VALUES (:user_id, :org, 'member', {", ".join(":" + c for c in cols)})
+        """), [{"user_id": d["user_id"], "org": diff["org_id"], **{c: d["values"].get(c) for c in cols}}
+               for d in diff["inserts"]])
+
+    new_rosters = diff["inserts"] + [d for d in diff["changes"] if not d["has_roster"]]
+    if new_rosters:
+        db.execute(text("""
+            INSERT INTO rosters (id, org_id, user_id, is_active, group_name)
+            VALUES (:id, :org, :user_id, :is_active, :group_name)
+        """), [{"id": str(uuid.uuid4()), "org": diff["org_id"], "user_id": d["user_id"],
+                "is_active": d["values"]["is_active"],
+                "group_name": d["values"].get("group_name")} for d in new_rosters])
+
+    user_changes = [d for d in diff["changes"] if any(f in d["fields"] for f in user_cols)]
+    if user_changes:
+        db.execute(text(f"""
+            UPDATE users SET {", ".join(f"{c} = :{c}" for c in user_cols)} WHERE id = :user_id
+        """), [{"user_id": d["user_id"], **{c: d["values"].get(c) for c in user_cols}} for d in user_changes])
+
+    roster_changes = [d for d in diff["changes"] if d["has_roster"] and any(f in d["fields"] for f in roster_cols)]
+    if roster_changes:
+        db.execute(text(f"""
+            UPDATE rosters SET {", ".join(f"{c} = :{c}" for c in roster_cols)} WHERE user_id = :user_id
+        """), [{"user_id": d["user_id"], **{c: d["values"].get(c) for c in roster_cols}} for d in roster_changes])
+
+    if diff["removes"]:
+        db.execute(text("UPDATE rosters SET is_active = FALSE WHERE user_id = :user_id"),
+                   [{"user_id": d["user_id"]} for d in diff["removes"]])
+
+    return summarize(diff, applied=True)
+
+def summarize(diff: dict, applied: bool = False, limit: Optional[int] = PREVIEW_LIMIT) -> dict:
+    def rows(items: List[dict]) -> List[dict]:
+        out = []
+        for d in items[:limit]:
+            r = {k: v for k, v in d.items() if k not in ("values", "has_roster")}
+            if "values" in d:
+                r.update(_key(d["values"]))
+            out.append(r)
+        return out
+    return {
+        "applied": applied,
+        "replace": diff["replace"],
+        "counts": {"inserted": len(diff["inserts"]), "changed": len(diff["changes"]),
+                   "removed": len(diff["removes"]), "unchanged": diff["unchanged"],
+                   "conflicts": len(diff["conflicts"]), "skipped": len(diff["skipped"])},
+        "inserts": rows(diff["inserts"]),
+        "changes": rows(diff["changes"]),
+        "removes": rows(diff["removes"]),
+        "conflicts": diff["conflicts"][:limit],
+        "skipped": diff["skipped"][:limit],
+        "diff_token": diff["diff_token"],
+    }
+
+def has_changes(diff: dict) -> bool:
+    return bool(diff["inserts"] or diff["changes"] or diff["removes"])
@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form
+import os
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from starlette.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List, Dict, DefaultDict
-from collections import defaultdict
+from typing import List, Dict
 import csv, io
 
 
 from app.database import get_db
 from app.models import User, Incident, Roster, Report
+from app.utils import default_expiry
 from app.schemas import IncidentCreate, IncidentOut, Absentee, SummaryItem, SummaryOut, UserIn
 from app.deps import require_admin
+from app.summary import compute_summary
+from app import invalidation, magic_links
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
 
 @router.post("/incidents",response_model=IncidentOut)
 def create_incident(payload: IncidentCreate, db: Session = Depends(get_db), _=Depends(require_admin)):
@@ -41,51 +46,39 @@ def absentees(incident_id: str, db: Session = Depends(get_db), _=Depends(require
 
 @router.get("/incidents/{incident_id}/summary", response_model=SummaryOut)
 def summary(incident_id: str, db: Session = Depends(get_db), _=Depends(require_admin)):
-    # total roster
-    total = db.query(Roster).filter(Roster.is_active == True).count()
+    # 総数・状況別・グループ別・属性別・被害レベル別を1クエリで集計
+    s = compute_summary(db, incident_id=incident_id)
 
+    def items(d: Dict[str, int]) -> List[SummaryItem]:
+        return [SummaryItem(status=k, n=v) for k, v in d.items()]
 
-    # status counts including no_report via left join
-    sql = text(
-        """
-        WITH roster AS (
-        SELECT user_id, group_name FROM rosters WHERE is_active = TRUE
-        )
-        SELECT COALESCE(rep.status, 'no_report') AS status, COUNT(*) AS n
-        FROM roster r
-        LEFT JOIN reports rep ON rep.user_id = r.user_id AND rep.incident_id = :incident_id
-        GROUP BY COALESCE(rep.status, 'no_report')
-        ORDER BY status
-        """
-    )
-    counts = [dict(row) for row in db.execute(sql, {"incident_id": incident_id}).mappings().all()]
-
-
-    # by group
-    sql2 = text(
-        """
-        WITH base AS (
-        SELECT rro.group_name, COALESCE(rep.status, 'no_report') AS status
-        FROM rosters rro
-        LEFT JOIN reports rep ON rep.user_id = rro.user_id AND rep.incident_id = :incident_id
-        WHERE rro.is_active = TRUE
-        )
-        SELECT group_name, status, COUNT(*) AS n
-        FROM base
-        GROUP BY group_name, status
-        ORDER BY group_name, status
-        """
+    return SummaryOut(
+        total_roster=s["total_roster"],
+        counts=items(s["counts"]),
+        by_group={g: items(d) for g, d in s["by_group"].items()},
+        by_grade={g: items(d) for g, d in s["by_grade"].items()},
+        by_damage_level={g: items(d) for g, d in s["by_damage_level"].items()},
     )
-    by_group_rows = [dict(row) for row in db.execute(sql2, {"incident_id": incident_id}).mappings().all()]
-    grouped: DefaultDict[str, List[SummaryItem]] = defaultdict(list)
-    for r in by_group_rows:
-        grouped[r["group_name"] or "-"] .append(SummaryItem(status=r["status"], n=int(r["n"])) )
-
 
-    return SummaryOut(
-        total_roster=int(total),
-        counts=[SummaryItem(status=c["status"], n=int(c["n"])) for c in counts],
-        by_group=dict(grouped)
+@router.get("/incidents/{incident_id}/magic_links")
+def magic_links_bulk(incident_id: str, format: str = "json", hours: int | None = None,
+                     db: Session = Depends(get_db), _=Depends(require_admin)):
+    # 名簿全員分の個人用リンクを一括生成（トークンはDBに保存しない）
+    inc = db.query(Incident).filter(Incident.id == incident_id).one_or_none()
+    if not inc:
+        raise HTTPException(status_code=404, detail="Incident not found")
+    expires_at = default_expiry(hours) if hours else None
+    links = magic_links.generate_for_roster(db, inc.id, f"{PUBLIC_BASE_URL}/f/{inc.code}", expires_at)
+    if format != "csv":
+        return links
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=["grade", "name", "email", "group_name", "url", "user_id"])
+    writer.writeheader()
+    writer.writerows(links)
+    return Response(
+        content=buf.getvalue().encode("utf-8-sig"),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="magic_links_{inc.code}.csv"'},
     )
 
 @router.post("/users/import")
@@ -116,4 +109,5 @@ def import_users(csvfile: UploadFile = File(...), db: Session = Depends(get_db),
             user.roster.is_active = is_active
         upserted += 1
     db.commit()
+    invalidation.publish(invalidation.ROSTER)
     return {"upserted": upserted}
\ No newline at end of file
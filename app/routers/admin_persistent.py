@@ -1,16 +1,24 @@
 # app/routers/admin_persistent.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, UploadFile, File, Form, Request
+from starlette.responses import Response, FileResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func
-from typing import List
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from typing import List, Dict
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
-from app.database import get_db
-from app.models import Roster
+from sqlalchemy.engine import Connection
+
+from app.database import get_db, get_read_db, get_read_conn, read_routing_status
+from app.pool_health import status as pool_health_status
+from app.models import Organization
 from app.models_persistent import Period
+from app.queries import get_or_create_current_period
+from app.fastjson import RowEncoder, FORMATS
+from app import invalidation, geo, triage, roster_index, reminders, scheduler, bootstrap, search, roster_bulk, roster_sync, spool, timeline, queries, dashboard, tenancy, archive
 
-from app.deps import require_admin_header_or_session as require_admin
+from app.deps import require_admin_header_or_session as require_admin, admin_responder
 
 class PeriodOut(BaseModel):
     id: str
@@ -25,6 +33,9 @@ class SummaryItem(BaseModel):
 class SummaryOut(BaseModel):
     total_roster: int
     counts: List[SummaryItem]
+    by_group: Dict[str, List[SummaryItem]] = {}
+    by_grade: Dict[str, List[SummaryItem]] = {}
+    by_damage_level: Dict[str, List[SummaryItem]] = {}
 
 class Absentee(BaseModel):
     id: str
@@ -44,21 +55,93 @@ class ReportRow(BaseModel):
     shelter_addr: str | None
     damage_level: str | None
 
+class SearchHit(BaseModel):
+    period_id: str
+    period_seq: int
+    user_id: str
+    name: str
+    grade: str | None
+    status: str
+    damage_level: str | None
+    updated_at: datetime
+    damage_notes: str | None
+    shelter_name: str | None
+    shelter_addr: str | None
+    score: float
+
+class SearchOut(BaseModel):
+    q: str
+    items: List[SearchHit]
+    next_offset: int | None
+
+class GeoCluster(BaseModel):
+    cell: str
+    lat: float
+    lng: float
+    total: int
+    counts: Dict[str, int]
+
+class ShelterAgg(BaseModel):
+    shelter_name: str | None
+    cell: str | None
+    lat: float | None
+    lng: float | None
+    occupancy: int
+    need_help: int
+    counts: Dict[str, int]
+
+class TriageRow(BaseModel):
+    user_id: str
+    name: str | None
+    grade: str | None
+    status: str
+    damage_level: str | None
+    updated_at: datetime
+    score: float
+    claimed_by: str | None
+    claimed_at: datetime | None
+
+class MemberKey(BaseModel):
+    grade: str
+    name: str
+
+class BulkRosterIn(BaseModel):
+    action: str                      # deactivate / activate / delete_roster / delete_user / move_group
+    group_name: str | None = None    # move_group の移動先（空ならグループ解除）
+    ids: List[str] = []
+    emails: List[str] = []
+    members: List[MemberKey] = []
+
+class BulkRosterOut(BaseModel):
+    action: str
+    requested: int
+    matched: int
+    affected: int
+    unmatched: List[Dict[str, str]]
+
+class OrgIn(BaseModel):
+    slug: str = Field(pattern=r"^[a-z0-9][a-z0-9-]{0,49}$")   # /o/<slug>
+    name: str = Field(min_length=1, max_length=200)
+    hosts: List[str] = []
+    max_concurrency: int | None = Field(default=None, ge=1)
+    submit_rate: float | None = Field(default=None, ge=0)
+
+class ReminderIn(BaseModel):
+    subject: str | None = None   # $name / $period_seq / $form_url を置換
+    body: str | None = None
+
 router = APIRouter(prefix="/admin/api", tags=["admin-api"])
 
-def get_or_create_current_period(db: Session) -> Period:
-    cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
-    if cur:
-        return cur
-    max_seq = db.query(func.max(Period.seq)).scalar() or 0
-    cur = Period(seq=int(max_seq) + 1)
-    db.add(cur)
-    db.commit()
-    db.refresh(cur)
-    return cur
+# 一覧系は行タプルを直接エンコードする（format=columnar で {"columns": [...], "rows": [[...]]}）
+_report_rows = RowEncoder(list(ReportRow.model_fields), datetime_columns=["updated_at"])
+_absentee_rows = RowEncoder(list(Absentee.model_fields))
+
+def _check_format(format: str) -> None:
+    if format not in FORMATS:
+        raise HTTPException(400, f"format must be one of {', '.join(FORMATS)}")
 
 @router.get("/periods/current", response_model=PeriodOut)
-def current_period(db: Session = Depends(get_db), _=Depends(require_admin)):
+def current_period(db: Session = Depends(get_read_db), _=Depends(require_admin)):
     cur = get_or_create_current_period(db)
     return PeriodOut(id=cur.id, seq=cur.seq, started_at=cur.started_at, ended_at=cur.ended_at)
 
@@ -68,82 +151,352 @@ def reset_period(db: Session = Depends(get_db), _=Depends(require_admin)):
     cur.ended_at = datetime.utcnow()
     db.add(cur)
     db.flush()
-    new = Period(seq=cur.seq + 1)
+    new = Period(org_id=cur.org_id, seq=cur.seq + 1)
     db.add(new)
     db.commit()
+    invalidation.publish(invalidation.PERIOD)
     db.refresh(new)
     return PeriodOut(id=new.id, seq=new.seq, started_at=new.started_at, ended_at=new.ended_at)
 
+@router.get("/periods/{period_id}/timeline")
+def period_timeline(
+    period_id: str,
+    by: str = Query("all", description="all | group | grade"),
+    step: int | None = Query(None, ge=1, description="間引きの間隔（分）。省略時は points に収まるよう自動"),
+    points: int = Query(120, ge=1, le=timeline.MAX_POINTS),
+    db: Session = Depends(get_read_db), _=Depends(require_admin),
+):
+    # 期間開始からの初回報告数の推移と、初回報告までの時間の p50/p90/p99（分）
+    if by not in timeline.DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"by must be one of {', '.join(timeline.DIMENSIONS)}")
+    period = db.get(Period, period_id)
+    if period is None or period.org_id != tenancy.current_id():
+        raise HTTPException(status_code=404, detail="Period not found")
+    return timeline.build(db, period, dim=by, step=step, max_points=points)
+
+# ダッシュボードの読み取りモデル（app/dashboard.py）。版番号を ETag にし、変わっていなければ 304
+@router.get("/dashboard")
+def dashboard_snapshot(request: Request, db: Session = Depends(get_read_db), _=Depends(require_admin)):
+    cur = get_or_create_current_period(db)
+    snap = dashboard.get(cur.id)
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == snap.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(snap.body, media_type="application/json", headers=headers)
+
 @router.get("/summary", response_model=SummaryOut)
-def summary_current(db: Session = Depends(get_db), _=Depends(require_admin)):
+def summary_current(db: Session = Depends(get_read_db), _=Depends(require_admin)):
     cur = get_or_create_current_period(db)
-    total = db.query(Roster).filter(Roster.is_active == True).count()
-    sql = text("""
-        WITH roster AS ( SELECT user_id FROM rosters WHERE is_active = TRUE )
-        SELECT COALESCE(rp.status, 'no_report') AS status, COUNT(*) AS n
-        FROM roster r
-        LEFT JOIN reports_p rp ON rp.user_id = r.user_id AND rp.period_id = :pid
-        GROUP BY COALESCE(rp.status, 'no_report')
-        ORDER BY status
-    """)
-    rows = db.execute(sql, {"pid": cur.id}).mappings().all()
-    counts = [SummaryItem(status=r["status"], n=int(r["n"])) for r in rows]
-    return SummaryOut(total_roster=int(total), counts=counts)
+    s = dashboard.get(cur.id).doc
+
+    def items(d: Dict[str, int]) -> List[SummaryItem]:
+        return [SummaryItem(status=k, n=v) for k, v in d.items()]
+
+    return SummaryOut(
+        total_roster=s["total_roster"],
+        counts=items(s["counts"]),
+        by_group={g: items(d) for g, d in s["by_group"].items()},
+        by_grade={g: items(d) for g, d in s["by_grade"].items()},
+        by_damage_level={g: items(d) for g, d in s["by_damage_level"].items()},
+    )
 
 @router.get("/absentees", response_model=List[Absentee])
-def absentees_current(db: Session = Depends(get_db), _=Depends(require_admin)):
+def absentees_current(format: str = "records", db: Session = Depends(get_read_db), _=Depends(require_admin)):
+    _check_format(format)
     cur = get_or_create_current_period(db)
-    sql = text("""
-        SELECT u.id, u.name, u.email, rro.group_name
-        FROM rosters rro
-        JOIN users u ON u.id = rro.user_id
-        LEFT JOIN reports_p rp
-          ON rp.user_id = u.id AND rp.period_id = :pid
-        WHERE rro.is_active = TRUE
-          AND rp.user_id IS NULL
-        ORDER BY u.name
-    """)
-    rows = db.execute(sql, {"pid": cur.id}).mappings().all()
-    return [Absentee(**row) for row in rows]
+    snap = dashboard.get(cur.id)
+    cols = _absentee_rows.columns
+    resp = _absentee_rows.response([tuple(a[c] for c in cols) for a in snap.doc["absentees"]], format)
+    resp.headers["X-Snapshot-Version"] = str(snap.version)
+    return resp
 
 @router.get("/reports", response_model=List[ReportRow])
-def list_reports(status: str | None = None, db: Session = Depends(get_db), _=Depends(require_admin)):
-    cur = get_or_create_current_period(db)
-    status_filter = ""
-    params = {"pid": cur.id}
-    if status:
-        status_filter = " AND rp.status = :status "
-        params["status"] = status
+def list_reports(status: str | None = None, format: str = "records",
+                 conn: Connection = Depends(get_read_conn), _=Depends(require_admin)):
+    _check_format(format)
+    cur = queries.current_period_or_create(conn)
+    return _report_rows.response(conn.execute(queries.REPORTS, queries.report_params(cur.id, status)), format)
 
+# 全文検索（被害メモ・避難先名・住所。既定は全期間、period_id で絞り込み）
+@router.get("/reports/search", response_model=SearchOut)
+def search_reports(q: str = Query(..., min_length=1, max_length=200), period_id: str | None = None,
+                   limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0),
+                   db: Session = Depends(get_read_db), _=Depends(require_admin)):
+    rows = search.search(db, q, period_id=period_id, limit=limit + 1, offset=offset,
+                         org_id=tenancy.current_id())
+    return SearchOut(q=q, items=rows[:limit], next_offset=offset + limit if len(rows) > limit else None)
+
+# 詳細（user_id指定）
+@router.get("/reports/{user_id}", response_model=ReportRow | None)
+def get_report(user_id: str, conn: Connection = Depends(get_read_conn), _=Depends(require_admin)):
+    cur = queries.current_period_or_create(conn)
+    row = conn.execute(queries.REPORT_ROW, {"pid": cur.id, "uid": user_id}).mappings().first()
+    return dict(row) if row else None
+
+# ===== 地図：セル単位の事前集計 =====
+def _parse_bbox(bbox: str | None):
+    if not bbox:
+        return None
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(x) for x in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be minLng,minLat,maxLng,maxLat")
+    return min_lng, min_lat, max_lng, max_lat
+
+@router.get("/geo/clusters", response_model=List[GeoCluster])
+def geo_clusters(bbox: str | None = None, zoom: int = 10, db: Session = Depends(get_read_db), _=Depends(require_admin)):
+    cur = get_or_create_current_period(db)
+    p = geo.precision_for_zoom(zoom)
+    params = {"pid": cur.id, "p": p}
+    bbox_filter = ""
+    box = _parse_bbox(bbox)
+    if box:
+        bbox_filter = """
+          AND rp.shelter_lng BETWEEN :min_lng AND :max_lng
+          AND rp.shelter_lat BETWEEN :min_lat AND :max_lat
+        """
+        params.update(min_lng=box[0], min_lat=box[1], max_lng=box[2], max_lat=box[3])
     sql = text(f"""
-        SELECT u.id AS user_id, u.name, u.email, rro.group_name,
-               rp.status, rp.updated_at,
-               rp.shelter_type, rp.shelter_name, rp.shelter_addr,
-               rp.damage_level
+        SELECT substr(rp.geo_cell, 1, :p) AS cell, rp.status, COUNT(*) AS n
         FROM reports_p rp
-        JOIN users u        ON u.id = rp.user_id
-        LEFT JOIN rosters rro ON rro.user_id = u.id
-        WHERE rp.period_id = :pid
-        {status_filter}
-        ORDER BY rp.updated_at DESC
+        WHERE rp.period_id = :pid AND rp.geo_cell IS NOT NULL
+        {bbox_filter}
+        GROUP BY substr(rp.geo_cell, 1, :p), rp.status
     """)
-    rows = [dict(r) for r in db.execute(sql, params).mappings().all()]
-    return rows
+    cells: Dict[str, Dict[str, int]] = {}
+    for cell, status, n in db.execute(sql, params).all():
+        cells.setdefault(cell, {})[status] = int(n)
+    out = []
+    for cell in sorted(cells):
+        lat, lng = geo.decode_center(cell)
+        counts = cells[cell]
+        out.append(GeoCluster(cell=cell, lat=lat, lng=lng, total=sum(counts.values()), counts=counts))
+    return out
 
-# 詳細（user_id指定）
-@router.get("/reports/{user_id}", response_model=ReportRow | None)
-def get_report(user_id: str, db: Session = Depends(get_db), _=Depends(require_admin)):
+# ===== 避難所ごとの集計（名称の表記ゆれ・近接座標をまとめる） =====
+@router.get("/geo/shelters", response_model=List[ShelterAgg])
+def geo_shelters(db: Session = Depends(get_read_db), _=Depends(require_admin)):
     cur = get_or_create_current_period(db)
+    # 名称＋約150mセル×状況で DB 側で畳み込み、名称正規化だけを Python で1パス
     sql = text("""
-        SELECT u.id AS user_id, u.name, u.email, rro.group_name,
-               rp.status, rp.updated_at,
-               rp.shelter_type, rp.shelter_name, rp.shelter_addr,
-               rp.damage_level
+        SELECT rp.shelter_name, substr(rp.geo_cell, 1, 7) AS cell, rp.status,
+               COUNT(*) AS n, AVG(rp.shelter_lat) AS lat, AVG(rp.shelter_lng) AS lng
         FROM reports_p rp
-        JOIN users u        ON u.id = rp.user_id
-        LEFT JOIN rosters rro ON rro.user_id = u.id
-        WHERE rp.period_id = :pid AND rp.user_id = :uid
-        LIMIT 1
+        WHERE rp.period_id = :pid
+          AND (rp.geo_cell IS NOT NULL OR COALESCE(rp.shelter_name, '') <> '')
+        GROUP BY rp.shelter_name, substr(rp.geo_cell, 1, 7), rp.status
     """)
-    row = db.execute(sql, {"pid": cur.id, "uid": user_id}).mappings().first()
-    return dict(row) if row else None
\ No newline at end of file
+    groups: Dict[str, dict] = {}
+    for name, cell, status, n, lat, lng in db.execute(sql, {"pid": cur.id}).all():
+        key = geo.normalize_shelter_name(name) or f"@{cell}"
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {"shelter_name": name or None, "cell": cell, "counts": {},
+                               "lat_sum": 0.0, "lng_sum": 0.0, "n_geo": 0}
+        n = int(n)
+        g["counts"][status] = g["counts"].get(status, 0) + n
+        if lat is not None and lng is not None:
+            g["lat_sum"] += float(lat) * n
+            g["lng_sum"] += float(lng) * n
+            g["n_geo"] += n
+            g["cell"] = g["cell"] or cell
+    out = []
+    for g in groups.values():
+        occupancy = sum(g["counts"].values())
+        out.append(ShelterAgg(
+            shelter_name=g["shelter_name"], cell=g["cell"],
+            lat=g["lat_sum"] / g["n_geo"] if g["n_geo"] else None,
+            lng=g["lng_sum"] / g["n_geo"] if g["n_geo"] else None,
+            occupancy=occupancy, need_help=g["counts"].get("need_help", 0), counts=g["counts"],
+        ))
+    out.sort(key=lambda s: (-s.need_help, -s.occupancy))
+    return out
+
+# ===== トリアージ（要支援・重大被害を優先度順に） =====
+@router.get("/triage", response_model=List[TriageRow])
+def triage_top(limit: int = 20, db: Session = Depends(get_read_db), _=Depends(require_admin)):
+    cur = get_or_create_current_period(db)
+    q = triage.get_queue(db, cur.id)
+    idx = roster_index.get_index(db)
+    out = []
+    for item in q.top(max(1, min(limit, 500))):
+        e = idx.get(item["user_id"])
+        out.append(TriageRow(name=e.name if e else None, grade=e.grade if e else None, **item))
+    return out
+
+def _triage_action(db: Session, user_id: str, fn):
+    cur = get_or_create_current_period(db)
+    try:
+        fn(cur.id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Not in triage queue")
+    except triage.ClaimConflict as e:
+        raise HTTPException(status_code=409, detail=f"Claimed by {e.args[0]}")
+    return {"ok": True, "user_id": user_id}
+
+# 担当者はログイン時の名前（トークンでの API 呼び出しは X-Admin-Responder ヘッダ）
+@router.post("/triage/{user_id}/claim")
+def triage_claim(user_id: str, db: Session = Depends(get_db), responder: str = Depends(admin_responder)):
+    return _triage_action(db, user_id, lambda pid: triage.claim(db, pid, user_id, responder))
+
+@router.post("/triage/{user_id}/release")
+def triage_release(user_id: str, db: Session = Depends(get_db), responder: str = Depends(admin_responder)):
+    return _triage_action(db, user_id, lambda pid: triage.release(db, pid, user_id, responder))
+
+@router.post("/triage/{user_id}/ack")
+def triage_ack(user_id: str, db: Session = Depends(get_db), responder: str = Depends(admin_responder)):
+    return _triage_action(db, user_id, lambda pid: triage.ack(db, pid, user_id, responder))
+
+# ===== 未報告者リマインド =====
+@router.post("/reminders/run", status_code=202)
+def reminders_run(background: BackgroundTasks, payload: ReminderIn | None = None,
+                  db: Session = Depends(get_db), _=Depends(require_admin)):
+    if reminders.is_running():
+        raise HTTPException(status_code=409, detail="Reminder job already running")
+    cur = get_or_create_current_period(db)
+    payload = payload or ReminderIn()
+    background.add_task(reminders.run_reminders, cur.id, cur.seq, payload.subject, payload.body)
+    return {"accepted": True, "period_id": cur.id}
+
+@router.get("/reminders/status")
+def reminders_status(_=Depends(require_admin)):
+    return {"running": reminders.is_running(), "last_run": reminders.last_run()}
+
+# ===== 名簿の一括操作（1トランザクション・集合演算） =====
+def _run_bulk(db: Session, action: str, keys, group_name: str | None) -> BulkRosterOut:
+    if action not in roster_bulk.ACTIONS:
+        raise HTTPException(400, f"action must be one of {', '.join(roster_bulk.ACTIONS)}")
+    res = roster_bulk.apply(db, action, keys, group_name=group_name)
+    db.commit()
+    for topic in roster_bulk.topics(action):
+        invalidation.publish(topic)
+    return BulkRosterOut(**res)
+
+@router.post("/roster/bulk", response_model=BulkRosterOut)
+def roster_bulk_json(payload: BulkRosterIn, db: Session = Depends(get_db), _=Depends(require_admin)):
+    keys = roster_bulk.keys_from(payload.ids, payload.emails, [(m.grade, m.name) for m in payload.members])
+    return _run_bulk(db, payload.action, keys, payload.group_name)
+
+@router.post("/roster/bulk/csv", response_model=BulkRosterOut)
+def roster_bulk_csv(action: str = Form(...), group_name: str | None = Form(default=None),
+                    csvfile: UploadFile = File(...), db: Session = Depends(get_db), _=Depends(require_admin)):
+    keys = roster_bulk.keys_from_csv(csvfile.file.read().decode("utf-8-sig"))
+    return _run_bulk(db, action, keys, group_name)
+
+# ===== 名簿CSVの差分同期（dry_run=true で差分のみ返す） =====
+@router.post("/roster/sync")
+def roster_sync_csv(csvfile: UploadFile = File(...), replace: bool = Form(default=False),
+                    dry_run: bool = Form(default=False), diff_token: str | None = Form(default=None),
+                    db: Session = Depends(get_db), _=Depends(require_admin)):
+    diff = roster_sync.compute_diff(db, csvfile.file.read().decode("utf-8-sig"), replace)
+    if dry_run:
+        return roster_sync.summarize(diff)
+    if diff_token and diff_token != diff["diff_token"]:
+        raise HTTPException(409, "roster changed since the preview; run dry_run again")
+    res = roster_sync.apply_diff(db, diff)
+    db.commit()
+    if roster_sync.has_changes(diff):
+        invalidation.publish(invalidation.ROSTER)
+    return res
+
+# ===== 定期ジョブの状態 =====
+@router.get("/jobs")
+def jobs_status(_=Depends(require_admin)):
+    return scheduler.status()
+
+# ===== 参照系の振り分け状況（リードレプリカ） =====
+@router.get("/db/routing")
+def db_routing(_=Depends(require_admin)):
+    return read_routing_status()
+
+@router.get("/db/pool")
+def db_pool(_=Depends(require_admin)):
+    # 接続プールごとのブレーカーの状態（closed / open / half_open）・連続失敗数・プールの使用状況
+    return pool_health_status()
+
+# ===== 起動処理の段階別所要時間 =====
+@router.get("/startup")
+def startup_report(_=Depends(require_admin)):
+    return bootstrap.report()
+
+@router.get("/spool")
+def spool_status(_=Depends(require_admin)):
+    # DB 障害時に退避した報告の滞留（件数・バイト・最古の受付からの経過）と再生結果
+    return spool.metrics()
+
+# ===== アーカイブ出力（全期間の報告・履歴。gzip NDJSON の分割ファイル＋manifest） =====
+def _archive_manifest(export_id: str) -> dict:
+    m = archive.load_manifest(export_id)
+    if m is None or m["org_id"] != tenancy.current_id():
+        raise HTTPException(status_code=404, detail="Archive not found")
+    return m
+
+@router.get("/archives")
+def archives_list(_=Depends(require_admin)):
+    return archive.list_manifests(tenancy.current_id())
+
+@router.post("/archives", status_code=202)
+def archives_create(background: BackgroundTasks, _=Depends(require_admin)):
+    m = archive.create(tenancy.current_id())
+    background.add_task(archive.run, m["id"])
+    return m
+
+@router.get("/archives/{export_id}")
+def archives_get(export_id: str, _=Depends(require_admin)):
+    m = _archive_manifest(export_id)
+    return {**m, "running": archive.is_running(export_id)}
+
+@router.post("/archives/{export_id}/resume", status_code=202)
+def archives_resume(export_id: str, background: BackgroundTasks, _=Depends(require_admin)):
+    # 中断・失敗した出力を manifest の位置（最後に書き終えたチャンクの次）から続ける
+    m = _archive_manifest(export_id)
+    if m["status"] == "complete":
+        raise HTTPException(status_code=409, detail="Archive already complete")
+    if archive.is_running(export_id):
+        raise HTTPException(status_code=409, detail="Archive export already running")
+    background.add_task(archive.run, export_id)
+    return {"accepted": True, "id": export_id, "cursor": m["cursor"]}
+
+@router.get("/archives/{export_id}/files/{name}")
+def archives_file(export_id: str, name: str, _=Depends(require_admin)):
+    # Range 要求に対応（途中から再ダウンロードできる）。sha256 は manifest に記載
+    path = archive.segment_path(_archive_manifest(export_id), name)
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="File not found")
+    media = "application/json" if name == archive.MANIFEST else "application/gzip"
+    return FileResponse(path, media_type=media, filename=name)
+
+# ===== 組織（テナント） =====
+@router.get("/orgs")
+def list_orgs(_=Depends(require_admin)):
+    # 登録済みの組織と、このワーカーでの組織ごとの同時処理数・送信レートの状況
+    budgets = tenancy.budgets()
+    return [{**o._asdict(), "path": tenancy.path_prefix(o) or "/", "budget": budgets.get(o.id)}
+            for o in tenancy.all_orgs()]
+
+@router.post("/orgs", status_code=201)
+def create_org(payload: OrgIn, db: Session = Depends(get_db), _=Depends(require_admin)):
+    if db.query(Organization.id).filter(Organization.slug == payload.slug).first():
+        raise HTTPException(status_code=409, detail="slug already exists")
+    org = Organization(slug=payload.slug, name=payload.name,
+                       hosts=",".join(h.strip().lower() for h in payload.hosts if h.strip()) or None,
+                       max_concurrency=payload.max_concurrency, submit_rate=payload.submit_rate)
+    try:
+        db.add(org)
+        db.flush()
+        # 最初の期間も作っておく（公開フォームがすぐ使えるように）
+        db.add(Period(org_id=org.id, seq=1))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        if db.query(Organization.id).filter(Organization.slug == payload.slug).first():
+            raise HTTPException(status_code=409, detail="slug already exists")
+        # 組織導入前の SQLite を置き換えずに更新した DB は、periods.seq の全体一意が残っている
+        # （SQLite では制約を外せない。migrations_bootstrap 参照）
+        raise HTTPException(status_code=409, detail=(
+            "cannot create the first period for a new organization: this database still has the "
+            "pre-multi-organization UNIQUE(seq) on periods; recreate the SQLite database or migrate to Postgres"))
+    invalidation.publish(invalidation.ORG)
+    invalidation.publish(invalidation.PERIOD)
+    return {"id": org.id, "slug": org.slug, "path": f"{tenancy.PATH_PREFIX}{org.slug}"}
+
@@ -3,22 +3,21 @@ import os
 from typing import Optional
 from fastapi import APIRouter, Depends, Request, Form, UploadFile, File
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
-from sqlalchemy import text, func
-from pathlib import Path
-import csv, io
+from sqlalchemy.engine import Connection
 from datetime import datetime
 
-from app.database import get_db
+from app.database import get_db, get_read_db, get_read_conn
 from app.models import User, Roster
 from app.models_persistent import Period, ReportP, ReportHistoryP
+from app import invalidation, roster_bulk, roster_sync, queries, dashboard, tenancy
+from app.queries import get_or_create_current_period
+from app.streaming import stream_rows_template
+from app.templating import templates
 
 from starlette.responses import Response
 
 router = APIRouter(prefix="", tags=["admin-web"])
-TEMPLATE_DIR = Path(__file__).resolve().parents[1] / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATE_DIR))
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "changeme")
 
 # --- helpers ---
@@ -31,27 +30,9 @@ def require_admin(request: Request) -> Optional[RedirectResponse]:
         return RedirectResponse(url=f"/admin/login?next={next_url}", status_code=303)
     return None
 
-def get_or_create_current_period(db: Session) -> Period:
-    cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
-    if cur:
-        return cur
-    max_seq = db.query(func.max(Period.seq)).scalar() or 0
-    cur = Period(seq=int(max_seq) + 1)
-    db.add(cur)
-    db.commit()
-    db.refresh(cur)
-    return cur
-
-def _normalize_grade(s: str) -> str:
-    if not s: return ""
-    x = s.strip().lower()
-    m = {
-        "staff":"Staff","doctor":"Doctor",
-        "master":"Master","m":"Master",
-        "bachelor":"Bachelor","bacholar":"Bachelor","bachelar":"Bachelor","b":"Bachelor",
-        "researcher":"Researcher", "r":"Researcher"
-    }
-    return m.get(x, s.strip().title())
+def _users(db: Session):
+    # 名簿の編集はこの組織のユーザーだけが対象
+    return db.query(User).filter(User.org_id == tenancy.current_id())
 
 # --- auth pages ---
 @router.get("/admin/login", response_class=HTMLResponse)
@@ -59,10 +40,16 @@ async def admin_login_page(request: Request):
     return templates.TemplateResponse("admin_login.html", {"request": request, "error": request.query_params.get("e")})
 
 @router.post("/admin/login")
-async def admin_login(request: Request, token: str = Form(...), next: str = Form(default="/admin")):
+async def admin_login(request: Request, token: str = Form(...), name: str = Form(default=""),
+                      next: str = Form(default="/admin")):
     if token != ADMIN_TOKEN:
         return RedirectResponse(url="/admin/login?e=1", status_code=303)
+    name = name.strip()[:120]
+    if not name:
+        return RedirectResponse(url="/admin/login?e=2", status_code=303)
     request.session["is_admin"] = True
+    request.session["responder"] = name   # トリアージの担当者名
+    request.session["org"] = tenancy.current_id()   # 以降は /o/<slug> を付けなくてもこの組織の管理画面
     return RedirectResponse(url=next or "/admin", status_code=303)
 
 @router.get("/admin/logout")
@@ -72,25 +59,20 @@ async def admin_logout(request: Request):
 
 # --- dashboard ---
 @router.get("/admin", response_class=HTMLResponse)
-async def admin_home(request: Request, db: Session = Depends(get_db)):
+async def admin_home(request: Request, db: Session = Depends(get_read_db)):
     guard = require_admin(request)
     if guard:
         return guard
     cur = get_or_create_current_period(db)
-    total = db.query(Roster).filter(Roster.is_active == True).count()
-    sql = text("""
-        WITH roster AS ( SELECT user_id FROM rosters WHERE is_active = TRUE )
-        SELECT COALESCE(rp.status, 'no_report') AS status, COUNT(*) AS n
-        FROM roster r
-        LEFT JOIN reports_p rp ON rp.user_id = r.user_id AND rp.period_id = :pid
-        GROUP BY COALESCE(rp.status, 'no_report')
-        ORDER BY status
-    """)
-    rows = db.execute(sql, {"pid": cur.id}).mappings().all()
-    counts = {r["status"]: int(r["n"]) for r in rows}
+    # 総数・状況別・グループ/属性/被害レベル別・最近の更新はスナップショット文書から
+    snap = dashboard.get(cur.id)
+    s = snap.doc
     return templates.TemplateResponse(
         "admin_home.html",
-        {"request": request, "period": cur, "total": int(total), "counts": counts,
+        {"request": request, "period": cur, "total": s["total_roster"], "counts": s["counts"],
+         "by_group": s["by_group"], "by_grade": s["by_grade"],
+         "by_damage_level": s["by_damage_level"], "recent": s["recent"],
+         "version": snap.version, "built_at": s["built_at"],
          "just_reset": request.query_params.get("reset") == "1"}
     )
 
@@ -103,41 +85,21 @@ async def admin_reset_period(request: Request, db: Session = Depends(get_db)):
     cur.ended_at = datetime.utcnow()
     db.add(cur)
     db.flush()
-    new = Period(seq=cur.seq + 1)
+    new = Period(org_id=cur.org_id, seq=cur.seq + 1)
     db.add(new)
     db.commit()
+    invalidation.publish(invalidation.PERIOD)
     return RedirectResponse(url="/admin?reset=1", status_code=303)
 
 # --- absentees ---
 @router.get("/admin/absentees", response_class=HTMLResponse)
-async def admin_absentees(request: Request, db: Session = Depends(get_db)):
+async def admin_absentees(request: Request, conn: Connection = Depends(get_read_conn)):
     guard = require_admin(request)
     if guard:
         return guard
-    cur = get_or_create_current_period(db)
-    sql = text(
-        """
-        SELECT u.id,
-               u.name,
-               u.email,
-               u.dept,
-               u.phone,
-               rro.group_name,
-               rro.is_active
-        FROM rosters rro
-        JOIN users u ON u.id = rro.user_id
-        LEFT JOIN reports_p rp
-          ON rp.user_id = u.id AND rp.period_id = :pid
-        WHERE rro.is_active = TRUE
-          AND rp.user_id IS NULL
-        ORDER BY u.name
-        """
-    )
-    rows = [dict(r) for r in db.execute(sql, {"pid": cur.id}).mappings().all()]
-    return templates.TemplateResponse("admin_absentees.html", {
-        "request": request,
+    cur = queries.current_period_or_create(conn)
+    return stream_rows_template(templates, "admin_absentees.html", request, queries.ABSENTEES_DETAIL, {"pid": cur.id}, {
         "period": cur,
-        "rows": rows,
         "ok": request.query_params.get("ok"),
         "err": request.query_params.get("err"),
     })
@@ -163,9 +125,9 @@ async def admin_users_create_one(
         return RedirectResponse(url="/admin/absentees?err=required", status_code=303)
 
     # 既存メールがあれば更新、なければ作成（upsert運用）
-    user = db.query(User).filter(User.email == email).one_or_none()
+    user = _users(db).filter(User.email == email).one_or_none()
     if not user:
-        user = User(email=email, name=name, dept=dept or None, phone=phone or None)
+        user = User(org_id=tenancy.current_id(), email=email, name=name, dept=dept or None, phone=phone or None)
         db.add(user)
         db.flush()  # get id
     else:
@@ -175,12 +137,13 @@ async def admin_users_create_one(
 
     # roster upsert
     if not user.roster:
-        user.roster = Roster(user_id=user.id)
+        user.roster = Roster(org_id=user.org_id, user_id=user.id)
 
     user.roster.group_name = group_name or user.roster.group_name
     user.roster.is_active = str(is_active).lower() in ("true", "1", "yes", "y", "on")
 
     db.commit()
+    invalidation.publish(invalidation.ROSTER)
     return RedirectResponse(url="/admin/absentees?ok=created", status_code=303)
 
 
@@ -201,13 +164,13 @@ async def admin_users_update_one(
     if guard:
         return guard
 
-    user = db.query(User).filter(User.id == user_id).one_or_none()
+    user = _users(db).filter(User.id == user_id).one_or_none()
     if not user:
         return RedirectResponse(url="/admin/absentees?err=nouser", status_code=303)
 
     # メール重複チェック
     email = email.strip()
-    other = db.query(User).filter(User.email == email, User.id != user_id).one_or_none()
+    other = _users(db).filter(User.email == email, User.id != user_id).one_or_none()
     if other:
         return RedirectResponse(url="/admin/absentees?err=dupemail", status_code=303)
 
@@ -217,13 +180,14 @@ async def admin_users_update_one(
     user.phone = phone or None
 
     if not user.roster:
-        user.roster = Roster(user_id=user.id)
+        user.roster = Roster(org_id=user.org_id, user_id=user.id)
 
     user.roster.group_name = group_name or None
     if is_active is not None:
         user.roster.is_active = str(is_active).lower() in ("true", "1", "yes", "y", "on")
 
     db.commit()
+    invalidation.publish(invalidation.ROSTER)
     return RedirectResponse(url="/admin/absentees?ok=updated", status_code=303)
 
 
@@ -238,14 +202,15 @@ async def admin_users_toggle_active(
     if guard:
         return guard
 
-    user = db.query(User).filter(User.id == user_id).one_or_none()
+    user = _users(db).filter(User.id == user_id).one_or_none()
     if not user:
         return RedirectResponse(url="/admin/absentees?err=nouser", status_code=303)
 
     if not user.roster:
-        user.roster = Roster(user_id=user.id, is_active=True)
+        user.roster = Roster(org_id=user.org_id, user_id=user.id, is_active=True)
     user.roster.is_active = not bool(user.roster.is_active)
     db.commit()
+    invalidation.publish(invalidation.ROSTER)
     return RedirectResponse(url="/admin/absentees?ok=toggle", status_code=303)
 
 
@@ -261,7 +226,7 @@ async def admin_users_delete(
     if guard:
         return guard
 
-    user = db.query(User).filter(User.id == user_id).one_or_none()
+    user = _users(db).filter(User.id == user_id).one_or_none()
     if not user:
         return RedirectResponse(url="/admin/absentees?err=nouser", status_code=303)
 
@@ -272,6 +237,7 @@ async def admin_users_delete(
         if user.roster:
             db.delete(user.roster)
     db.commit()
+    invalidation.publish(invalidation.ROSTER)
     return RedirectResponse(url="/admin/absentees?ok=deleted", status_code=303)
 
 # --- roster upload ---
@@ -280,139 +246,75 @@ async def admin_users_page(request: Request):
     guard = require_admin(request)
     if guard:
         return guard
-    return templates.TemplateResponse("admin_users.html", {"request": request, "ok": request.query_params.get("ok")})
+    return templates.TemplateResponse("admin_users.html", {
+        "request": request, "ok": request.query_params.get("ok"), "q": request.query_params,
+        "actions": roster_bulk.ACTIONS,
+    })
 
 @router.post("/admin/users/upload")
 async def admin_users_upload(
     request: Request,
-    csvfile: UploadFile = File(...),
-    replace: bool = Form(default=False),   # ← 置換モード
+    csvfile: UploadFile | None = File(default=None),
+    csvtext: str | None = Form(default=None),     # プレビュー画面から確定するときの本文
+    replace: bool = Form(default=False),          # ← 置換モード（CSVに無い人を無効化）
+    dry_run: bool = Form(default=False),          # 差分のプレビューのみ
+    diff_token: str | None = Form(default=None),  # プレビュー時の差分と同じか確認
     db: Session = Depends(get_db),
 ):
     guard = require_admin(request)
     if guard:
         return guard
 
-    content = csvfile.file.read().decode('utf-8-sig')
-    reader = csv.DictReader(io.StringIO(content))
-
-    # 置換モードなら、まず全Rosterを is_active=False に落とす
-    if replace:
-        db.query(Roster).update({Roster.is_active: False})
-
-    seen_user_ids = set()
-    for row in reader:
-        email = (row.get('email') or '').strip()
-        name  = (row.get('name')  or '').strip()
-        if not email or not name:
-            continue
-        user = db.query(User).filter(User.email == email).one_or_none()
-        if not user:
-            user = User(email=email, name=name)
-            db.add(user)
-            db.flush()
-        # upsert
-        group_name = row.get('group_name') or None
-        is_active = (str(row.get('is_active', 'true')).lower() in ('true','1','yes','y'))
-        if not user.roster:
-            user.roster = Roster(user_id=user.id, group_name=group_name, is_active=is_active)
-        else:
-            user.roster.group_name = group_name
-            user.roster.is_active = is_active
-        seen_user_ids.add(user.id)
-
+    if csvfile is not None and csvfile.filename:
+        content = csvfile.file.read().decode('utf-8-sig')
+    else:
+        content = csvtext or ""
+    if not content.strip():
+        return RedirectResponse(url="/admin/users?err=nofile", status_code=303)
+
+    # 現在の名簿と比較し、追加・変更・（置換モードでは）無効化の行だけを書き込む
+    diff = roster_sync.compute_diff(db, content, replace)
+    if dry_run:
+        return templates.TemplateResponse("admin_users.html", {
+            "request": request, "ok": None, "q": request.query_params, "actions": roster_bulk.ACTIONS,
+            "preview": roster_sync.summarize(diff), "csvtext": content, "replace": replace,
+        })
+    if diff_token and diff_token != diff["diff_token"]:
+        # プレビュー後に名簿が変わった
+        return RedirectResponse(url="/admin/users?err=stale", status_code=303)
+
+    res = roster_sync.apply_diff(db, diff)
     db.commit()
-    return RedirectResponse(url="/admin/users?ok=1", status_code=303)
+    if roster_sync.has_changes(diff):
+        invalidation.publish(invalidation.ROSTER)
+    c = res["counts"]
+    return RedirectResponse(
+        url=f"/admin/users?ok=sync&inserted={c['inserted']}&changed={c['changed']}"
+            f"&removed={c['removed']}&unchanged={c['unchanged']}&conflicts={c['conflicts']}",
+        status_code=303,
+    )
 
 # ===== Reports list (HTML) =====
 @router.get("/admin/reports", response_class=HTMLResponse)
-async def admin_reports(request: Request, status: str | None = None, db: Session = Depends(get_db)):
+async def admin_reports(request: Request, status: str | None = None, conn: Connection = Depends(get_read_conn)):
     guard = require_admin(request)
     if guard:
         return guard
-    cur = get_or_create_current_period(db)
+    cur = queries.current_period_or_create(conn)
 
     # フィルタ（safe/evacuating/need_help/unknown のいずれか、空なら全件）
-    status_filter = ""
-    params = {"pid": cur.id}
-    if status:
-        status_filter = " AND rp.status = :status "
-        params["status"] = status
-
-    sql = text(f"""
-        SELECT u.id AS user_id, u.name, u.email, rro.group_name,
-               rp.status, rp.updated_at,
-               rp.shelter_type, rp.shelter_name, rp.shelter_addr,
-               rp.damage_level
-        FROM reports_p rp
-        JOIN users u        ON u.id = rp.user_id
-        LEFT JOIN rosters rro ON rro.user_id = u.id
-        WHERE rp.period_id = :pid
-        {status_filter}
-        ORDER BY rp.updated_at DESC
-    """)
-    rows = [dict(r) for r in db.execute(sql, params).mappings().all()]
-
-    return templates.TemplateResponse(
-        "admin_reports.html",
-        {"request": request, "period": cur, "rows": rows, "status": status}
-    )
-
-# ===== Report detail (HTML) =====
-@router.get("/admin/reports/{user_id}", response_class=HTMLResponse)
-async def admin_report_detail(user_id: str, request: Request, db: Session = Depends(get_db)):
-    guard = require_admin(request)
-    if guard:
-        return guard
-    cur = get_or_create_current_period(db)
-    sql = text("""
-        SELECT u.id AS user_id, u.name, u.email, rro.group_name,
-               rp.status, rp.updated_at,
-               rp.shelter_type, rp.shelter_name, rp.shelter_addr,
-               rp.shelter_lat, rp.shelter_lng,
-               rp.damage_level, rp.damage_notes
-        FROM reports_p rp
-        JOIN users u        ON u.id = rp.user_id
-        LEFT JOIN rosters rro ON rro.user_id = u.id
-        WHERE rp.period_id = :pid AND rp.user_id = :uid
-        LIMIT 1
-    """)
-    row = db.execute(sql, {"pid": cur.id, "uid": user_id}).mappings().first()
-    if not row:
-        # 未報告の場合は404相当で一覧へ戻す
-        return RedirectResponse(url="/admin/reports", status_code=303)
-    return templates.TemplateResponse("admin_report_detail.html", {"request": request, "period": cur, "r": dict(row)})
+    params = queries.report_params(cur.id, status)
+    return stream_rows_template(templates, "admin_reports.html", request, queries.REPORTS, params,
+                                {"period": cur, "status": status})
 
 # ===== CSV export (HTML操作からDL) =====
 @router.get("/admin/reports/export")
-async def admin_reports_export(request: Request, status: str | None = None, db: Session = Depends(get_db)):
+async def admin_reports_export(request: Request, status: str | None = None, conn: Connection = Depends(get_read_conn)):
     guard = require_admin(request)
     if guard:
         return guard
-    cur = get_or_create_current_period(db)
-
-    status_filter = ""
-    params = {"pid": cur.id}
-    if status:
-        status_filter = " AND rp.status = :status "
-        params["status"] = status
-
-    sql = text(f"""
-        SELECT u.name, u.email, COALESCE(rro.group_name,'') AS group_name,
-               rp.status, rp.updated_at,
-               COALESCE(rp.shelter_type,'') AS shelter_type,
-               COALESCE(rp.shelter_name,'') AS shelter_name,
-               COALESCE(rp.shelter_addr,'') AS shelter_addr,
-               COALESCE(rp.damage_level,'') AS damage_level,
-               COALESCE(rp.damage_notes,'') AS damage_notes
-        FROM reports_p rp
-        JOIN users u        ON u.id = rp.user_id
-        LEFT JOIN rosters rro ON rro.user_id = u.id
-        WHERE rp.period_id = :pid
-        {status_filter}
-        ORDER BY rp.updated_at DESC
-    """)
-    rows = [dict(r) for r in db.execute(sql, params).mappings().all()]
+    cur = queries.current_period_or_create(conn)
+    rows = [dict(r) for r in conn.execute(queries.REPORTS_EXPORT, queries.report_params(cur.id, status)).mappings().all()]
 
     # CSV生成
     import csv, io
@@ -432,6 +334,19 @@ async def admin_reports_export(request: Request, status: str | None = None, db:
         headers={"Content-Disposition": f'attachment; filename="reports_period_{cur.seq}.csv"'}
     )
 
+# ===== Report detail (HTML) =====
+@router.get("/admin/reports/{user_id}", response_class=HTMLResponse)
+async def admin_report_detail(user_id: str, request: Request, conn: Connection = Depends(get_read_conn)):
+    guard = require_admin(request)
+    if guard:
+        return guard
+    cur = queries.current_period_or_create(conn)
+    row = conn.execute(queries.REPORT_DETAIL, {"pid": cur.id, "uid": user_id}).mappings().first()
+    if not row:
+        # 未報告の場合は404相当で一覧へ戻す
+        return RedirectResponse(url="/admin/reports", status_code=303)
+    return templates.TemplateResponse("admin_report_detail.html", {"request": request, "period": cur, "r": dict(row)})
+
 @router.get("/admin/users/template.csv")
 async def download_roster_template(request: Request):
     guard = require_admin(request)
@@ -461,10 +376,11 @@ async def admin_users_delete_by_email(
     guard = require_admin(request)
     if guard:
         return guard
-    user = db.query(User).filter(User.email == email).one_or_none()
+    user = _users(db).filter(User.email == email).one_or_none()
     if user and user.roster:
         db.delete(user.roster)  # Rosterだけ削除
         db.commit()
+        invalidation.publish(invalidation.ROSTER)
         return RedirectResponse(url="/admin/users?ok=del1", status_code=303)
     return RedirectResponse(url="/admin/users?err=notfound", status_code=303)
 
@@ -479,15 +395,33 @@ async def admin_users_delete_csv(
         return guard
 
     content = csvfile.file.read().decode("utf-8-sig")
-    reader = csv.DictReader(io.StringIO(content))
-    n = 0
-    for row in reader:
-        email = (row.get("email") or "").strip()
-        if not email:
-            continue
-        user = db.query(User).filter(User.email == email).one_or_none()
-        if user and user.roster:
-            db.delete(user.roster)
-            n += 1
+    keys = roster_bulk.keys_from_csv(content, kinds=("email",))
+    res = roster_bulk.apply(db, "delete_roster", keys)
+    db.commit()
+    invalidation.publish(invalidation.ROSTER)
+    return RedirectResponse(url=f"/admin/users?ok=del{res['affected']}", status_code=303)
+
+# ===== 一括操作（CSV: id / email / grade+name のいずれかの列） =====
+@router.post("/admin/users/bulk")
+async def admin_users_bulk(
+    request: Request,
+    action: str = Form(...),
+    group_name: str | None = Form(default=None),
+    csvfile: UploadFile = File(...),
+    db: Session = Depends(get_db),
+):
+    guard = require_admin(request)
+    if guard:
+        return guard
+    if action not in roster_bulk.ACTIONS:
+        return RedirectResponse(url="/admin/users?err=action", status_code=303)
+    keys = roster_bulk.keys_from_csv(csvfile.file.read().decode("utf-8-sig"))
+    res = roster_bulk.apply(db, action, keys, group_name=group_name)
     db.commit()
-    return RedirectResponse(url=f"/admin/users?ok=del{n}", status_code=303)
\ No newline at end of file
+    for topic in roster_bulk.topics(action):
+        invalidation.publish(topic)
+    return RedirectResponse(
+        url=f"/admin/users?ok=bulk&action={action}&matched={res['matched']}"
+            f"&affected={res['affected']}&unmatched={len(res['unmatched'])}",
+        status_code=303,
+    )
\ No newline at end of file
@@ -3,31 +3,45 @@ from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 from datetime import datetime
-from pathlib import Path
-from fastapi.templating import Jinja2Templates   # ← これが必要
 
 from app.database import get_db
 from app.models import User, Incident, Roster, Report, ReportHistory
 from app.schemas import ReportIn, ReportOut
+from app import magic_links
+from app.templating import templates
 
-# テンプレートの絶対パス（uvicornのカレントに依存しない）
-TEMPLATE_DIR = Path(__file__).resolve().parents[1] / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATE_DIR))
 router = APIRouter(prefix="", tags=["public"])
 
 
+def _user_id_from_token(db: Session, t: str, incident_id: str, redeem: bool = False) -> str:
+    # 署名検証のみで本人を確定（users を引かない）。1回限りモードは使用記録を見る／付ける
+    try:
+        user_id = magic_links.verify(t, incident_id)
+        if magic_links.ONE_TIME:
+            if redeem:
+                magic_links.redeem(db, t, incident_id)
+            elif magic_links.is_used(db, t, incident_id):
+                raise magic_links.InvalidToken("already used")
+        return user_id
+    except magic_links.InvalidToken as e:
+        raise HTTPException(status_code=401, detail=f"Invalid link: {e}")
+
+
 @router.get("/f/{incident_code}", response_class=HTMLResponse)
-def public_form(incident_code: str, request: Request, db: Session = Depends(get_db)):
+def public_form(incident_code: str, request: Request, t: Optional[str] = None, db: Session = Depends(get_db)):
     inc = db.query(Incident).filter(Incident.code == incident_code).one_or_none()
     if not inc or inc.status != 'open':
         raise HTTPException(status_code=404, detail="Incident not found or closed")
-    return templates.TemplateResponse("public_form.html", {"request": request, "incident": inc})
+    if t:
+        _user_id_from_token(db, t, inc.id)  # 期限切れ等はフォーム表示前に知らせる
+    return templates.TemplateResponse("public_form.html", {"request": request, "incident": inc, "token": t})
 
 
 @router.post("/public/report/{incident_code}")
 def submit_report(
     incident_code: str,
     email: str = Form(default=None),
+    t: Optional[str] = Form(default=None),  # マジックリンクのトークン（あればメール不要）
     status: str = Form(...),
     shelter_name: Optional[str] = Form(default=None),
     shelter_type: Optional[str] = Form(default=None),
@@ -42,16 +56,21 @@ def submit_report(
     if not inc or inc.status != 'open':
         raise HTTPException(status_code=404, detail="Incident not found or closed")
 
-    if not email:
-        raise HTTPException(status_code=400, detail="Email required for identification")
+    if t:
+        # 1回限りモードでは報告と同じトランザクションで使用を記録する（重複なら 401）
+        user_id = _user_id_from_token(db, t, inc.id, redeem=True)
+    else:
+        if not email:
+            raise HTTPException(status_code=400, detail="Email required for identification")
 
-    user = db.query(User).filter(User.email == email).one_or_none()
-    if not user or not user.roster or user.roster.is_active is False:
-        raise HTTPException(status_code=400, detail="Email not in active roster")
+        user = db.query(User).filter(User.email == email).one_or_none()
+        if not user or not user.roster or user.roster.is_active is False:
+            raise HTTPException(status_code=400, detail="Email not in active roster")
+        user_id = user.id
 
 
     # upsert latest report
-    rep = db.query(Report).filter(Report.incident_id == inc.id, Report.user_id == user.id).one_or_none()
+    rep = db.query(Report).filter(Report.incident_id == inc.id, Report.user_id == user_id).one_or_none()
     payload = dict(status=status, shelter_name=shelter_name, shelter_type=shelter_type,
         shelter_addr=shelter_addr, shelter_lat=shelter_lat, shelter_lng=shelter_lng,
         damage_level=damage_level, damage_notes=damage_notes)
@@ -59,27 +78,34 @@ def submit_report(
 
     if rep:
     # history snapshot
-        hist = ReportHistory(incident_id=inc.id, user_id=user.id, diff=f"updated_at={datetime.utcnow().isoformat()}")
+        hist = ReportHistory(incident_id=inc.id, user_id=user_id, diff=f"updated_at={datetime.utcnow().isoformat()}")
         db.add(hist)
         for k, v in payload.items():
             setattr(rep, k, v)
     else:
-        rep = Report(incident_id=inc.id, user_id=user.id, **payload)
+        rep = Report(incident_id=inc.id, user_id=user_id, **payload)
         db.add(rep)
+    if magic_links.ONE_TIME:
+        t = None
     db.commit()
 
-    return RedirectResponse(url=f"/f/{incident_code}?ok=1", status_code=303)
+    suffix = f"&t={t}" if t else ""
+    return RedirectResponse(url=f"/f/{incident_code}?ok=1{suffix}", status_code=303)
 
 
 @router.get("/public/me/{incident_code}", response_model=ReportOut)
-def my_latest(incident_code: str, email: str, db: Session = Depends(get_db)):
+def my_latest(incident_code: str, email: Optional[str] = None, t: Optional[str] = None, db: Session = Depends(get_db)):
     inc = db.query(Incident).filter(Incident.code == incident_code).one_or_none()
     if not inc:
         raise HTTPException(status_code=404, detail="Incident not found")
-    user = db.query(User).filter(User.email == email).one_or_none()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    rep = db.query(Report).filter(Report.incident_id == inc.id, Report.user_id == user.id).one_or_none()
+    if t:
+        user_id = _user_id_from_token(db, t, inc.id)
+    else:
+        user = db.query(User).filter(User.email == email).one_or_none() if email else None
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_id = user.id
+    rep = db.query(Report).filter(Report.incident_id == inc.id, Report.user_id == user_id).one_or_none()
     if not rep:
         raise HTTPException(status_code=404, detail="No report yet")
     return ReportOut(incident_id=rep.incident_id, user_id=rep.user_id, status=rep.status, updated_at=rep.updated_at)
\ No newline at end of file
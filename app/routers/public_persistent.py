@@ -1,44 +1,80 @@
 # app/routers/public_persistent.py
 from fastapi import APIRouter, Depends, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from typing import Optional
-from datetime import datetime
+from sqlalchemy.exc import IntegrityError, OperationalError, TimeoutError as PoolTimeoutError
+from typing import Optional, List
+from datetime import datetime, timezone
+from pydantic import BaseModel, Field
 from pathlib import Path
+import logging
+import uuid
 
 from app.database import get_db
-from app.models import User, Roster
-from app.models_persistent import Period, ReportP, ReportHistoryP
+from app.models_persistent import Period, ReportP, SubmissionKeyP
+from app.reporting import apply_report
+from app import roster_index, public_cache, spool, tenancy
+from app.templating import templates
+from app.utils import normalize_grade
 
+log = logging.getLogger(__name__)
 router = APIRouter(prefix="", tags=["public-persistent"])
-TEMPLATE_DIR = Path(__file__).resolve().parents[1] / "templates"
-templates = Jinja2Templates(directory=str(TEMPLATE_DIR))
+STATIC_DIR = Path(__file__).resolve().parents[1] / "static"
 
-def _normalize_grade(s: str) -> str:
-    s = (s or "").strip().lower()
-    m = {"staff":"Staff","doctor":"Doctor","master":"Master","m":"Master",
-         "bachelor":"Bachelor","bacholar":"Bachelor","bachelar":"Bachelor","b":"Bachelor",
-         "researcher":"Researcher", "r":"Researcher"}
-    return m.get(s, (s or "").title())
+VALID_STATUSES = {"safe", "evacuating", "need_help", "unknown"}
+BATCH_MAX = 50
+
+class QueuedReport(BaseModel):
+    idempotency_key: str = Field(min_length=8, max_length=64)
+    client_updated_at: datetime
+    grade: str
+    name: str
+    email: str
+    status: str
+    shelter_name: Optional[str] = None
+    shelter_type: Optional[str] = None
+    shelter_addr: Optional[str] = None
+    shelter_lat: Optional[float] = None
+    shelter_lng: Optional[float] = None
+    damage_level: Optional[str] = None
+    damage_notes: Optional[str] = None
+
+class BatchIn(BaseModel):
+    reports: List[QueuedReport] = Field(max_length=BATCH_MAX)
 
 @router.get("/public/roster")
-def public_roster(db: Session = Depends(get_db)):
-    # 現在アクティブな名簿（属性→氏名リスト）
-    rows = db.query(User.grade, User.name)\
-             .join(Roster, Roster.user_id == User.id)\
-             .filter(Roster.is_active == True)\
-             .order_by(User.grade, User.name).all()
-    grouped = {}
-    for g, n in rows:
-        grouped.setdefault(g, []).append(n)
-    return grouped
+def public_roster(request: Request, db: Session = Depends(get_db)):
+    # 現在アクティブな名簿（属性→氏名リスト）。名簿世代ごとに事前圧縮して保持
+    idx = roster_index.get_index(db)
+
+    def grouped():
+        out = {}
+        for e in idx.entries:
+            out.setdefault(e.grade, []).append(e.name)
+        return out
+
+    return public_cache.respond(request, public_cache.roster_payload(idx.generation, grouped))
+
+_resolve_user_id = roster_index.resolve_user_id
+
+@router.get("/public/roster/search")
+def public_roster_search(q: str, grade: Optional[str] = None, limit: int = 10, db: Session = Depends(get_db)):
+    # 氏名のタイプアヘッド（前方一致 → あいまい一致）。DBは索引構築時のみ参照
+    idx = roster_index.get_index(db)
+    g = normalize_grade(grade) if grade else None
+    hits = idx.search(q, grade=g, limit=max(1, min(limit, 50)))
+    return [{"grade": e.grade, "name": e.name, "score": score} for e, score in hits]
 
 @router.get("/f", response_class=HTMLResponse)
 def public_form(request: Request, db: Session = Depends(get_db)):
-    cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
-    return templates.TemplateResponse("public_form_persistent.html", {"request": request, "period": cur})
+    # ページ内容は現在の期間のみに依存するため、期間ごとに1回だけレンダリング・圧縮する
+    cur = public_cache.current_period(db)
+    payload = public_cache.form_payload(
+        cur, lambda: templates.get_template("public_form_persistent.html").render(
+            period=cur, prefix=tenancy.prefix())
+    )
+    return public_cache.respond(request, payload)
 
 @router.post("/public/report")
 def submit_report(
@@ -55,46 +91,147 @@ def submit_report(
     damage_notes: Optional[str] = Form(default=None),
     db: Session = Depends(get_db)
 ):
-    cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
-    if not cur:
-        raise HTTPException(status_code=503, detail="Reporting period is not open")
-
-    g = _normalize_grade(grade)
-    user = db.query(User).join(Roster, Roster.user_id == User.id)\
-            .filter(User.grade == g, User.name == name, Roster.is_active == True)\
-            .one_or_none()
-    if not user:
-        raise HTTPException(status_code=400, detail="Selected user not in active roster")
-
-    rep = db.query(ReportP).filter(ReportP.period_id == cur.id, ReportP.user_id == user.id).one_or_none()
+    if status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    g = normalize_grade(grade)
     payload = dict(
-        contact_email=email,  # ← 連絡用メールとして保存
         status=status, shelter_name=shelter_name, shelter_type=shelter_type,
         shelter_addr=shelter_addr, shelter_lat=shelter_lat, shelter_lng=shelter_lng,
         damage_level=damage_level, damage_notes=damage_notes
     )
+    try:
+        cur = _open_period(db)
+        if not cur:
+            raise HTTPException(status_code=503, detail="Reporting period is not open")
+
+        user_id = _resolve_user_id(db, g, name)
+        if not user_id:
+            raise HTTPException(status_code=400, detail="Selected user not in active roster")
 
-    if rep:
-        hist = ReportHistoryP(period_id=cur.id, user_id=user.id, diff=f"updated_at={datetime.utcnow().isoformat()}")
-        db.add(hist)
-        for k, v in payload.items():
-            setattr(rep, k, v)
-    else:
-        rep = ReportP(period_id=cur.id, user_id=user.id, **payload)
-        db.add(rep)
+        rep = db.query(ReportP).filter(ReportP.period_id == cur.id, ReportP.user_id == user_id).one_or_none()
+        apply_report(db, cur.id, user_id, dict(payload, contact_email=email), rep)  # ← 連絡用メールとして保存
+        db.commit()
+    except (OperationalError, PoolTimeoutError) as e:
+        _spool_report(db, e, g, name, email, payload)
+        return RedirectResponse(url=f"{tenancy.prefix()}/f?ok=spooled", status_code=303)
+    return RedirectResponse(url=f"{tenancy.prefix()}/f?ok=1", status_code=303)
+
+def _open_period(db: Session) -> Optional[Period]:
+    return db.query(Period).filter(Period.org_id == tenancy.current_id(),
+                                   Period.ended_at.is_(None)).one_or_none()
+
+def _spool_report(db: Session, error: Exception, grade: str, name: str, email: str, payload: dict) -> None:
+    """
+    DB に書けない（接続不可・プールの待ち切れ）ときはローカルの退避ファイルに fsync してから受付とする。
+    名簿索引がメモリにあれば名簿外はその場で断る。適用は spool_replay ジョブが復旧後に行う
+    """
+    try:
+        db.rollback()
+    except Exception:
+        pass
+    if not spool.ENABLED:
+        raise HTTPException(status_code=503, detail="Database unavailable") from error
+    idx = roster_index.cached()
+    if idx is not None and idx.lookup(grade, name) is None:
+        raise HTTPException(status_code=400, detail="Selected user not in active roster")
+    cur = public_cache.cached_period()
+    try:
+        spool.append(str(uuid.uuid4()), cur.id if cur else None, grade, name, email, payload)
+    except OSError as e:
+        log.error("spool append failed: %s", e)
+        raise HTTPException(status_code=503, detail="Database unavailable") from error
+    log.warning("database unavailable, report spooled: %s", error)
+
+def _to_utc_naive(dt: datetime) -> datetime:
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+@router.post("/public/report/batch")
+def submit_report_batch(body: BatchIn, db: Session = Depends(get_db)):
+    """
+    オフラインキューに溜まった報告をまとめて適用する（1トランザクション）。
+    - idempotency_key が適用済みなら "duplicate"
+    - 既存報告の updated_at の方が新しければ "stale"（後勝ち）
+    - 名簿外・不正な値は "rejected"
+    """
+    cur = _open_period(db)
+    if not cur:
+        raise HTTPException(status_code=503, detail="Reporting period is not open")
+    try:
+        results = _apply_batch(db, cur, body.reports)
+    except IntegrityError:
+        # ページと Service Worker が同じキューを同時に送ると、同じキー（や同じ人の初回報告）を挿入し合う。
+        # 先に確定した側を読み直してやり直す（そのキーは "duplicate" になる）
+        db.rollback()
+        results = _apply_batch(db, cur, body.reports)
+    return {"results": [{"idempotency_key": k, "result": v} for k, v in results.items()]}
+
+def _apply_batch(db: Session, cur: Period, reports: List[QueuedReport]) -> dict:
+    now = datetime.utcnow()
+    keys = [r.idempotency_key for r in reports]
+    seen = {k for (k,) in db.query(SubmissionKeyP.key).filter(SubmissionKeyP.key.in_(keys)).all()}
+
+    results = {}
+    resolved = []
+    for r in reports:
+        if r.idempotency_key in seen or r.idempotency_key in results:
+            results[r.idempotency_key] = "duplicate"
+            continue
+        if r.status not in VALID_STATUSES:
+            results[r.idempotency_key] = "rejected"
+            continue
+        user_id = _resolve_user_id(db, normalize_grade(r.grade), r.name)
+        if not user_id:
+            results[r.idempotency_key] = "rejected"
+            continue
+        # 端末時計が進んでいても未来時刻にはしない
+        ts = min(_to_utc_naive(r.client_updated_at), now)
+        resolved.append((ts, r, user_id))
+        results[r.idempotency_key] = None
+
+    user_ids = {uid for _, _, uid in resolved}
+    reps = {
+        rep.user_id: rep
+        for rep in db.query(ReportP).filter(ReportP.period_id == cur.id, ReportP.user_id.in_(user_ids)).all()
+    } if user_ids else {}
+
+    # 端末時刻順に適用し、同一ユーザーは後勝ち
+    for ts, r, user_id in sorted(resolved, key=lambda t: t[0]):
+        rep = reps.get(user_id)
+        if rep is not None and rep.updated_at and rep.updated_at >= ts:
+            result = "stale"
+        else:
+            payload = r.model_dump(exclude={"idempotency_key", "client_updated_at", "grade", "name", "email"})
+            payload["contact_email"] = r.email
+            reps[user_id] = apply_report(db, cur.id, user_id, payload, rep, updated_at=ts)
+            result = "applied"
+        results[r.idempotency_key] = result
+        db.add(SubmissionKeyP(key=r.idempotency_key, period_id=cur.id, user_id=user_id, result=result))
     db.commit()
-    return RedirectResponse(url="/f?ok=1", status_code=303)
+    return results
+
+@router.get("/sw.js")
+def service_worker():
+    # スコープを / にするためルート直下で配信
+    return FileResponse(STATIC_DIR / "sw.js", media_type="application/javascript",
+                        headers={"Cache-Control": "no-cache", "Service-Worker-Allowed": "/"})
+
+@router.get("/outbox.js")
+def outbox_script():
+    return FileResponse(STATIC_DIR / "outbox.js", media_type="application/javascript",
+                        headers={"Cache-Control": "no-cache"})
 
 @router.get("/public/me")
 def my_latest(grade: str, name: str, db: Session = Depends(get_db)):
-    cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
+    cur = _open_period(db)
     if not cur:
         raise HTTPException(status_code=404, detail="No open period")
-    g = _normalize_grade(grade)
-    user = db.query(User).filter(User.grade == g, User.name == name).one_or_none()
-    if not user:
+    g = normalize_grade(grade)
+    user_id = _resolve_user_id(db, g, name, active_only=False)
+    if not user_id:
         raise HTTPException(status_code=404, detail="User not found")
-    rep = db.query(ReportP).filter(ReportP.period_id == cur.id, ReportP.user_id == user.id).one_or_none()
+    rep = db.query(ReportP).filter(ReportP.period_id == cur.id, ReportP.user_id == user_id).one_or_none()
     if not rep:
         raise HTTPException(status_code=404, detail="No report yet")
     return {"period_id": rep.period_id, "user_id": rep.user_id, "status": rep.status, "updated_at": rep.updated_at, "contact_email": rep.contact_email}
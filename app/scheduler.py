@@ -0,0 +1,173 @@
+# app/scheduler.py
+# プロセス内の定期ジョブ実行（asyncio）。複数ワーカー時は DB のリース行で1台だけがリーダーになる
+# - リースの更新は専用のタスクで行い、ジョブもそれぞれ別タスク（スレッド）で動かす
+#   （LEASE_TTL より長いジョブの間もリースが切れない）
+# - 更新に失敗し続けてリースの期限を過ぎたら、DB の結果を待たずにリーダーを降りる。
+#   書き込みを伴うジョブは確定の直前に still_leader() で確かめる
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+
+ENABLED = os.getenv("SCHEDULER_ENABLED", "1").lower() in ("1", "true", "yes")
+LEASE_NAME = "scheduler"
+LEASE_TTL = timedelta(seconds=int(os.getenv("SCHEDULER_LEASE_TTL", "30")))
+TICK_SEC = 1.0
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+class Job:
+    def __init__(self, name: str, interval_sec: float, fn: Callable[[], Optional[dict]], leader_only: bool):
+        self.name = name
+        self.interval_sec = interval_sec
+        self.fn = fn
+        self.leader_only = leader_only   # False: 各ワーカーのメモリ内キャッシュ向け（全ワーカーで実行）
+        self.next_run = time.monotonic()
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at: Optional[datetime] = None
+        self.last_finished_at: Optional[datetime] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_status: Optional[str] = None
+        self.last_error: Optional[str] = None
+        self.last_result: Optional[dict] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name, "interval_sec": self.interval_sec, "leader_only": self.leader_only,
+            "running": self.running, "runs": self.runs, "failures": self.failures,
+            "last_started_at": self.last_started_at, "last_finished_at": self.last_finished_at,
+            "last_duration_ms": self.last_duration_ms, "last_status": self.last_status,
+            "last_error": self.last_error, "last_result": self.last_result,
+            "next_run_in_sec": round(max(0.0, self.next_run - time.monotonic()), 1),
+        }
+
+_jobs: Dict[str, Job] = {}
+_task: Optional[asyncio.Task] = None
+_lease_task: Optional[asyncio.Task] = None
+_job_tasks: set = set()
+_is_leader = False
+_lease_until = 0.0   # このワーカーのリースが確実に有効な期限（monotonic。取得を試みた時点 + TTL）
+
+def register(name: str, interval_sec: float, fn: Callable[[], Optional[dict]], leader_only: bool = True) -> None:
+    _jobs[name] = Job(name, interval_sec, fn, leader_only)
+
+def jobs() -> List[Job]:
+    return list(_jobs.values())
+
+def status() -> dict:
+    return {
+        "enabled": ENABLED,
+        "running": _task is not None and not _task.done(),
+        "holder_id": HOLDER_ID,
+        "is_leader": still_leader(),
+        "jobs": [j.as_dict() for j in _jobs.values()],
+    }
+
+# --- リース（scheduler_leases 行） ---
+def _try_acquire_lease() -> bool:
+    now = datetime.utcnow()
+    exp = now + LEASE_TTL
+    with SessionLocal() as db:
+        n = db.execute(text("""
+            UPDATE scheduler_leases SET holder = :me, expires_at = :exp
+            WHERE name = :name AND (holder = :me OR expires_at < :now)
+        """), {"me": HOLDER_ID, "exp": exp, "now": now, "name": LEASE_NAME}).rowcount
+        if n:
+            db.commit()
+            return True
+        try:
+            db.execute(text("INSERT INTO scheduler_leases (name, holder, expires_at) VALUES (:name, :me, :exp)"),
+                       {"me": HOLDER_ID, "exp": exp, "name": LEASE_NAME})
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+
+def still_leader() -> bool:
+    """リースを保持しているか（リーダー専用ジョブが DB を書き換える直前に確かめる）"""
+    return _is_leader and time.monotonic() < _lease_until
+
+def _release_lease() -> None:
+    with SessionLocal() as db:
+        db.execute(text("DELETE FROM scheduler_leases WHERE name = :name AND holder = :me"),
+                   {"name": LEASE_NAME, "me": HOLDER_ID})
+        db.commit()
+
+async def _run_job(job: Job) -> None:
+    job.last_started_at = datetime.utcnow()
+    t0 = time.perf_counter()
+    try:
+        job.last_result = await asyncio.to_thread(job.fn)
+        job.last_status = "ok"
+        job.last_error = None
+    except Exception as e:  # noqa: BLE001  ジョブの失敗でループを止めない
+        job.failures += 1
+        job.last_status = "error"
+        job.last_error = f"{type(e).__name__}: {e}"
+    finally:
+        job.running = False
+    job.runs += 1
+    job.last_duration_ms = round((time.perf_counter() - t0) * 1000, 2)
+    job.last_finished_at = datetime.utcnow()
+    job.next_run = time.monotonic() + job.interval_sec
+
+async def _lease_loop() -> None:
+    # リースは TTL の 1/3 ごとに更新（ジョブの実行時間に左右されない）
+    global _is_leader, _lease_until
+    while True:
+        t0 = time.monotonic()
+        try:
+            _is_leader = await asyncio.to_thread(_try_acquire_lease)
+            if _is_leader:
+                _lease_until = t0 + LEASE_TTL.total_seconds()
+        except Exception:  # noqa: BLE001  DB不調時は期限までは保持、以降は still_leader() が False
+            pass
+        await asyncio.sleep(LEASE_TTL.total_seconds() / 3)
+
+async def _loop() -> None:
+    while True:
+        for job in list(_jobs.values()):
+            if job.running or job.next_run > time.monotonic():
+                continue
+            if job.leader_only and not still_leader():
+                continue
+            job.running = True
+            t = asyncio.get_running_loop().create_task(_run_job(job))
+            _job_tasks.add(t)
+            t.add_done_callback(_job_tasks.discard)
+        await asyncio.sleep(TICK_SEC)
+
+def start() -> None:
+    global _task, _lease_task
+    if not ENABLED or (_task is not None and not _task.done()):
+        return
+    loop = asyncio.get_running_loop()
+    _lease_task = loop.create_task(_lease_loop())
+    _task = loop.create_task(_loop())
+
+async def stop() -> None:
+    global _task, _lease_task, _is_leader
+    if _task is None:
+        return
+    for t in (_task, _lease_task, *_job_tasks):
+        if t is not None:
+            t.cancel()
+    for t in (_task, _lease_task):
+        try:
+            await t
+        except asyncio.CancelledError:
+            pass
+    _task = _lease_task = None
+    if _is_leader:
+        _is_leader = False
+        await asyncio.to_thread(_release_lease)
@@ -63,4 +63,6 @@ class SummaryItem(BaseModel):
 class SummaryOut(BaseModel):
     total_roster: int
     counts: List[SummaryItem]
-    by_group: Dict[str, List[SummaryItem]]
\ No newline at end of file
+    by_group: Dict[str, List[SummaryItem]]
+    by_grade: Dict[str, List[SummaryItem]] = {}
+    by_damage_level: Dict[str, List[SummaryItem]] = {}
\ No newline at end of file
@@ -0,0 +1,151 @@
+# app/search.py
+# 報告の全文検索（被害メモ・避難先名・避難先住所）
+# - SQLite: FTS5 の trigram トークナイザ（日本語も部分一致で引ける）。rowid を reports_p と揃え、apply_report で同期
+# - Postgres: pg_trgm の GIN 索引（式索引なので同期処理は不要）に ILIKE、word_similarity で順位付け
+# どちらも使えない環境では reports_p への LIKE 検索にフォールバックする
+import logging
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+log = logging.getLogger(__name__)
+
+FTS_TABLE = "reports_fts"
+TRGM_INDEX = "ix_reports_p_search_trgm"
+MIN_TRIGRAM = 3   # これより短い語は trigram 索引に乗らない（LIKE で絞る）
+# Postgres の式索引と検索で同じ式を使う（違うと索引が効かない）
+_DOC = "(COALESCE(rp.damage_notes, '') || ' ' || COALESCE(rp.shelter_name, '') || ' ' || COALESCE(rp.shelter_addr, ''))"
+_FIELDS = ("damage_notes", "shelter_name", "shelter_addr")
+
+_available: dict = {}   # dialect名 -> 索引が使えるか
+
+# --- スキーマ（migrations_bootstrap から呼ぶ） ---
+def setup(conn: Connection, engine: Engine) -> None:
+    name = engine.dialect.name
+    try:
+        with conn.begin_nested():
+            if name == "sqlite":
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"), {"n": FTS_TABLE}).first()
+                if not exists:
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                        "damage_notes, shelter_name, shelter_addr, tokenize = 'trigram')"))
+                    conn.execute(text(f"""
+                        INSERT INTO {FTS_TABLE} (rowid, damage_notes, shelter_name, shelter_addr)
+                        SELECT rowid, COALESCE(damage_notes, ''), COALESCE(shelter_name, ''), COALESCE(shelter_addr, '')
+                        FROM reports_p
+                    """))
+            elif name == "postgresql":
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON reports_p USING gin "
+                    f"({_DOC.replace('rp.', '')} gin_trgm_ops)"))
+    except SQLAlchemyError as e:  # FTS5/trigram 非対応・拡張の作成権限なし → LIKE 検索で動かす
+        log.warning("full-text index unavailable, falling back to LIKE search: %s", e)
+    _available.pop(name, None)
+
+def _has_index(db, name: str) -> bool:
+    if name not in _available:
+        if name == "sqlite":
+            sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :n"
+            params = {"n": FTS_TABLE}
+        elif name == "postgresql":
+            sql = "SELECT 1 FROM pg_extension WHERE extname = :n"
+            params = {"n": "pg_trgm"}
+        else:
+            _available[name] = False
+            return False
+        _available[name] = db.execute(text(sql), params).first() is not None
+    return _available[name]
+
+# --- 書き込み側の同期（SQLite の FTS 表のみ。呼び出し側のトランザクション内） ---
+def sync(db: Session, period_id: str, user_id: str) -> None:
+    if db.get_bind().dialect.name != "sqlite" or not _has_index(db, "sqlite"):
+        return
+    db.flush()
+    db.execute(text(f"""
+        INSERT OR REPLACE INTO {FTS_TABLE} (rowid, damage_notes, shelter_name, shelter_addr)
+        SELECT rowid, COALESCE(damage_notes, ''), COALESCE(shelter_name, ''), COALESCE(shelter_addr, '')
+        FROM reports_p WHERE period_id = :pid AND user_id = :uid
+    """), {"pid": period_id, "uid": user_id})
+
+def forget_users(db: Session, user_ids: str, params: Optional[dict] = None) -> None:
+    # user_ids（user_id を返す副問い合わせ）の報告を FTS 表から消す。reports_p の削除より先に呼ぶ
+    if db.get_bind().dialect.name != "sqlite" or not _has_index(db, "sqlite"):
+        return
+    db.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+                    f"(SELECT rowid FROM reports_p WHERE user_id IN {user_ids})"), params or {})
+
+# --- 検索 ---
+def _like(term: str) -> str:
+    esc = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{esc}%"
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+_SELECT = """
+    SELECT rp.period_id, p.seq AS period_seq, rp.user_id, u.name, u.grade,
+           rp.status, rp.damage_level, rp.updated_at,
+           rp.damage_notes, rp.shelter_name, rp.shelter_addr, {score} AS score
+"""
+
+def search(db: Session, q: str, period_id: Optional[str] = None,
+           limit: int = 20, offset: int = 0, org_id: Optional[str] = None) -> List[dict]:
+    """
+    空白区切りの語を全て含む報告を関連度順に返す（全期間。period_id・組織で絞り込み可）。
+    次ページの有無を判定できるよう、呼び出し側は limit+1 件を要求すること。
+    """
+    terms = [t for t in q.split() if t]
+    if not terms:
+        return []
+    params: dict = {"limit": limit, "offset": offset}
+    where: List[str] = []
+    if org_id:
+        where.append("p.org_id = :org")
+        params["org"] = org_id
+    if period_id:
+        where.append("rp.period_id = :pid")
+        params["pid"] = period_id
+    dialect = db.get_bind().dialect.name
+    indexed = _has_index(db, dialect)
+
+    if dialect == "sqlite" and indexed:
+        long_terms = [t for t in terms if len(t) >= MIN_TRIGRAM]
+        if long_terms:
+            where.append(f"{FTS_TABLE} MATCH :match")
+            params["match"] = " AND ".join(_phrase(t) for t in long_terms)
+            # bm25 は小さいほど関連が高い。被害メモ > 避難先名 > 住所 の重み
+            score = f"-bm25({FTS_TABLE}, 3.0, 2.0, 1.0)"
+        else:
+            score = "0.0"
+        for i, t in enumerate(t for t in terms if len(t) < MIN_TRIGRAM):
+            where.append("(" + " OR ".join(f"f.{c} LIKE :s{i} ESCAPE '\\'" for c in _FIELDS) + ")")
+            params[f"s{i}"] = _like(t)
+        sql = _SELECT.format(score=score) + f"""
+            FROM {FTS_TABLE} f
+            JOIN reports_p rp ON rp.rowid = f.rowid
+        """
+    else:
+        op = "ILIKE" if dialect == "postgresql" else "LIKE"
+        for i, t in enumerate(terms):
+            where.append(f"{_DOC} {op} :t{i} ESCAPE '\\'")
+            params[f"t{i}"] = _like(t)
+        if dialect == "postgresql" and indexed:
+            score = f"word_similarity(:q, {_DOC})"
+            params["q"] = q
+        else:
+            score = "0.0"
+        sql = _SELECT.format(score=score) + " FROM reports_p rp "
+
+    sql += f"""
+        JOIN users u ON u.id = rp.user_id
+        JOIN periods p ON p.id = rp.period_id
+        WHERE {" AND ".join(where)}
+        ORDER BY score DESC, rp.updated_at DESC
+        LIMIT :limit OFFSET :offset
+    """
+    return [dict(r) for r in db.execute(text(sql), params).mappings()]
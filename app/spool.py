@@ -0,0 +1,365 @@
+# app/spool.py
+# DB に書けないときの報告の退避先（ローカルの追記専用ファイル）と、復旧後の再生
+#
+# - 1行1件: "<crc32 8桁>\t<JSON>\n"。書きかけ・破損行はチェックサムで検出して読み飛ばす
+# - fsync はまとめて行う（同時に来た送信は1回の fsync で永続化し、その後に応答する）
+# - セグメントファイル単位で追記し、再生済みの位置は <segment>.ckpt に保存する
+# - 再生は受付順・冪等（idempotency_key を submission_keys_p に記録）で、後勝ちの規則はオフライン一括送信と同じ
+# - DB が使えない間は止めて次回に持ち越す。レコード固有の失敗は rejected として記録し、後続の再生を止めない
+import json
+import logging
+import os
+import threading
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from sqlalchemy.exc import DisconnectionError, IntegrityError, OperationalError, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models_persistent import Period, ReportP, SubmissionKeyP
+from app.reporting import apply_report
+from app import roster_index, tenancy
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.getenv("SPOOL_ENABLED", "1").lower() in ("1", "true", "yes")
+SPOOL_DIR = Path(os.getenv("SPOOL_DIR") or Path(__file__).resolve().parents[1] / "spool")
+SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+REPLAY_BATCH = int(os.getenv("SPOOL_REPLAY_BATCH", "100"))
+# DB が使えない（次回に持ち越す）とみなす例外。それ以外の失敗はそのレコード固有として rejected にする
+UNAVAILABLE = (OperationalError, DisconnectionError, PoolTimeoutError)
+
+class _Writer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_cond = threading.Condition()
+        self._fh = None
+        self._path: Optional[Path] = None
+        self._written = 0      # 現セグメントに書いたバイト数
+        self._synced = 0       # fsync 済みのバイト数
+        self._syncing = False
+
+    @property
+    def active_path(self) -> Optional[Path]:
+        return self._path
+
+    def _open(self) -> None:
+        SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+        name = f"spool-{datetime.utcnow():%Y%m%d%H%M%S%f}-{os.getpid()}-{uuid.uuid4().hex[:6]}.log"
+        self._path = SPOOL_DIR / name
+        self._fh = open(self._path, "ab", buffering=0)
+        self._written = self._synced = 0
+
+    def rotate(self) -> None:
+        with self._lock:
+            self._close()
+
+    def _close(self) -> None:
+        if self._fh is not None:
+            os.fsync(self._fh.fileno())
+            self._fh.close()
+        self._fh = None
+        self._path = None
+
+    def append(self, record: dict) -> None:
+        body = json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+        line = b"%08x\t%s\n" % (zlib.crc32(body), body)
+        with self._lock:
+            # 書き込み中のセグメントが（手作業などで）消されていたら、消えたファイルに書き続けない
+            if self._fh is None or self._written >= SEGMENT_BYTES or os.fstat(self._fh.fileno()).st_nlink == 0:
+                self._close()
+                self._open()
+            fh = self._fh
+            fh.write(line)
+            self._written += len(line)
+            end = self._written
+        self._sync_upto(fh, end)
+
+    def _sync_upto(self, fh, end: int) -> None:
+        # グループコミット: 先に fsync を始めたスレッドの結果で足りれば待つだけ
+        with self._sync_cond:
+            while True:
+                if fh is not self._fh or self._synced >= end:
+                    return   # セグメントが切り替わった（閉じる時に fsync 済み）か、同期済み
+                if not self._syncing:
+                    break
+                self._sync_cond.wait()
+            self._syncing = True
+            target = self._written
+        try:
+            os.fsync(fh.fileno())
+        finally:
+            with self._sync_cond:
+                self._syncing = False
+                self._synced = max(self._synced, target)
+                self._sync_cond.notify_all()
+
+_writer = _Writer()
+
+# --- メトリクス（プロセス内） ---
+_metrics = {
+    "spooled": 0, "replayed": 0, "duplicate": 0, "stale": 0, "rejected": 0, "corrupt": 0,
+    "replay_errors": 0, "last_spooled_at": None, "last_replay_at": None, "last_error": None,
+}
+
+def append(key: str, period_id: Optional[str], grade: str, name: str, email: str,
+           payload: dict, client_updated_at: Optional[datetime] = None) -> None:
+    """検証済みの報告を退避する（このリクエストの組織として）。戻った時点で fsync 済み"""
+    now = datetime.utcnow()
+    _writer.append({
+        "key": key, "org_id": tenancy.current_id(), "period_id": period_id,
+        "grade": grade, "name": name, "email": email,
+        "payload": payload, "ts": (client_updated_at or now).isoformat(), "received_at": now.isoformat(),
+    })
+    _metrics["spooled"] += 1
+    _metrics["last_spooled_at"] = now
+
+# --- 読み出し ---
+def _segments() -> List[Path]:
+    if not SPOOL_DIR.exists():
+        return []
+    return sorted(SPOOL_DIR.glob("spool-*.log"))
+
+def _ckpt_path(seg: Path) -> Path:
+    return seg.with_suffix(".ckpt")
+
+def _load_ckpt(seg: Path) -> int:
+    try:
+        return int(_ckpt_path(seg).read_text().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def _save_ckpt(seg: Path, offset: int) -> None:
+    tmp = _ckpt_path(seg).with_suffix(".ckpt.tmp")
+    tmp.write_text(str(offset))
+    os.replace(tmp, _ckpt_path(seg))
+
+def _read(seg: Path, offset: int, limit: int) -> Tuple[List[Tuple[int, dict]], int]:
+    """offset から完全な行を最大 limit 件読む。戻り値: ([(次の位置, レコード)], 読めた末尾)"""
+    out: List[Tuple[int, dict]] = []
+    with open(seg, "rb") as fh:
+        fh.seek(offset)
+        pos = offset
+        for raw in fh:
+            if not raw.endswith(b"\n"):
+                break   # 書きかけ（次回に回す）
+            pos += len(raw)
+            crc, _, body = raw.rstrip(b"\n").partition(b"\t")
+            try:
+                ok = int(crc, 16) == zlib.crc32(body)
+                rec = json.loads(body) if ok else None
+            except ValueError:
+                rec = None
+            if rec is None:
+                _metrics["corrupt"] += 1
+                log.error("spool: corrupt record skipped in %s at %d", seg.name, pos - len(raw))
+            out.append((pos, rec))
+            if len(out) >= limit:
+                break
+    return out, pos
+
+def pending() -> dict:
+    depth_bytes = 0
+    records = 0
+    oldest: Optional[str] = None
+    for seg in _segments():
+        offset = _load_ckpt(seg)
+        try:
+            size = seg.stat().st_size
+        except OSError:
+            continue
+        if size <= offset:
+            continue
+        depth_bytes += size - offset
+        with open(seg, "rb") as fh:
+            fh.seek(offset)
+            for raw in fh:
+                if raw.endswith(b"\n"):
+                    records += 1
+                    if oldest is None:
+                        try:
+                            oldest = json.loads(raw.partition(b"\t")[2])["received_at"]
+                        except (ValueError, KeyError):
+                            pass
+    return {"records": records, "bytes": depth_bytes, "oldest_received_at": oldest}
+
+def metrics() -> dict:
+    p = pending()
+    lag = None
+    if p["oldest_received_at"]:
+        lag = round((datetime.utcnow() - datetime.fromisoformat(p["oldest_received_at"])).total_seconds(), 1)
+    return {
+        "enabled": ENABLED, "dir": str(SPOOL_DIR),
+        "depth_records": p["records"], "depth_bytes": p["bytes"],
+        "replay_lag_sec": lag,   # 未再生の最古の報告の受付からの経過
+        "segments": len(_segments()),
+        **_metrics,
+    }
+
+# --- 再生 ---
+def _apply_one(db: Session, r: dict, open_periods: dict) -> str:
+    org_id = r.get("org_id") or tenancy.DEFAULT_ORG_ID   # 組織導入前の退避分は既定の組織
+    period_id = r.get("period_id") or open_periods.get(org_id)
+    user_id = roster_index.resolve_user_id(db, r["grade"], r["name"], org_id=org_id)
+    if not period_id or not user_id:
+        db.add(SubmissionKeyP(key=r["key"], period_id=period_id or "", user_id=user_id or "",
+                              result="rejected"))
+        db.flush()
+        return "rejected"
+    ts = datetime.fromisoformat(r["ts"])
+    rep = db.query(ReportP).filter(ReportP.period_id == period_id, ReportP.user_id == user_id).one_or_none()
+    if rep is not None and rep.updated_at and rep.updated_at >= ts:
+        result = "stale"
+    else:
+        payload = dict(r["payload"], contact_email=r["email"])
+        apply_report(db, period_id, user_id, payload, rep, updated_at=ts)
+        result = "replayed"
+    db.add(SubmissionKeyP(key=r["key"], period_id=period_id, user_id=user_id,
+                          result="applied" if result == "replayed" else result))
+    db.flush()
+    return result
+
+def _reject(db: Session, r: dict, e: Exception) -> str:
+    # 何度やり直しても同じ結果になる失敗（不正な値・制約違反など）。記録して先へ進む
+    log.error("spool: record %s rejected: %s: %s", r.get("key"), type(e).__name__, e)
+    _metrics["last_error"] = f"{type(e).__name__}: {e}"
+    key = r.get("key")
+    if not isinstance(key, str):
+        return "rejected"   # キーが無い（壊れた）レコードは記録できない。チェックポイントで読み飛ばす
+    try:
+        with db.begin_nested():
+            if db.get(SubmissionKeyP, key) is None:
+                db.add(SubmissionKeyP(key=key, period_id=str(r.get("period_id") or ""), user_id="",
+                                      result="rejected"))
+    except UNAVAILABLE:
+        raise
+    except SQLAlchemyError as e2:
+        log.error("spool: could not record rejection of %s: %s", key, e2)
+    return "rejected"
+
+def _apply_batch(records: List[dict]) -> None:
+    results = []
+    with SessionLocal() as db:
+        # 期間が記録されていない（退避時に未取得だった）ものは、その組織の現在の期間に入れる
+        open_periods = dict(db.query(Period.org_id, Period.id).filter(Period.ended_at.is_(None)).all())
+        keys = [r.get("key") for r in records]
+        seen = {k for (k,) in db.query(SubmissionKeyP.key).filter(SubmissionKeyP.key.in_(keys)).all()}
+        for r in records:
+            if r.get("key") in seen:
+                results.append("duplicate")
+                continue
+            seen.add(r.get("key"))
+            # 1件ごとにセーブポイント。失敗したレコードだけを巻き戻し、バッチの残りは続ける
+            try:
+                with db.begin_nested():
+                    result = _apply_one(db, r, open_periods)
+            except UNAVAILABLE:
+                raise
+            except IntegrityError as e:
+                # 一括送信と同じキーが同時に確定した場合は重複。それ以外の制約違反はこのレコード固有
+                key = r.get("key")
+                dup = isinstance(key, str) and db.get(SubmissionKeyP, key) is not None
+                result = "duplicate" if dup else _reject(db, r, e)
+            except (SQLAlchemyError, KeyError, TypeError, ValueError) as e:
+                result = _reject(db, r, e)
+            results.append(result)
+        db.commit()
+    for result in results:
+        _metrics[result] += 1
+
+def replay() -> dict:
+    """スケジューラから呼ぶ。DBが使えなければ次回に持ち越す"""
+    if not _segments():
+        return {"replayed": 0}
+    with _replay_lock() as locked:
+        if not locked:
+            return {"skipped": "another process is replaying"}
+        return _replay()
+
+@contextmanager
+def _replay_lock():
+    # 同じディレクトリを共有する複数ワーカーのうち1つだけが再生する
+    if fcntl is None:
+        yield True
+        return
+    with open(SPOOL_DIR / "replay.lock", "a") as fh:
+        try:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+def _replay() -> dict:
+    done = 0
+    for seg in _segments():
+        offset = _load_ckpt(seg)
+        while True:
+            batch, _ = _read(seg, offset, REPLAY_BATCH)
+            if not batch:
+                break
+            records = [rec for _, rec in batch if rec is not None]
+            try:
+                if records:
+                    _apply_batch(records)
+            except UNAVAILABLE as e:
+                _metrics["replay_errors"] += 1
+                _metrics["last_error"] = f"{type(e).__name__}: {e}"
+                return {"replayed": done, "stopped": "database unavailable"}
+            offset = batch[-1][0]
+            _save_ckpt(seg, offset)
+            done += len(records)
+            _metrics["last_replay_at"] = datetime.utcnow()
+        _cleanup(seg, offset)
+    return {"replayed": done}
+
+def _owner_pid(seg: Path) -> Optional[int]:
+    # spool-<時刻>-<pid>-<乱数>.log
+    try:
+        return int(seg.name.split("-")[2])
+    except (IndexError, ValueError):
+        return None
+
+def _alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True   # 確かめられない環境では生きているものとして扱う（消さない）
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _cleanup(seg: Path, offset: int) -> None:
+    try:
+        st = seg.stat()
+    except OSError:
+        return
+    if offset < st.st_size:
+        return
+    if seg == _writer.active_path:
+        # 自分の書き込み中セグメントは、再生し終えたら切り替えて次回削除
+        if st.st_size > 0:
+            _writer.rotate()
+        return
+    # 他プロセスのセグメントは、そのプロセスが終了している（もう書かない）場合だけ消す。
+    # 生きているプロセスのものは、書き込み中かもしれないので本人が切り替えた後に本人が消す
+    pid = _owner_pid(seg)
+    if pid is not None and pid != os.getpid() and _alive(pid):
+        return
+    seg.unlink(missing_ok=True)
+    _ckpt_path(seg).unlink(missing_ok=True)
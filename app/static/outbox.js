@@ -0,0 +1,48 @@
+// app/static/outbox.js
+// 送信待ちの安否報告キュー（IndexedDB）。ページと Service Worker の両方から読み込む
+const OUTBOX_DB = 'safety-check';
+const OUTBOX_STORE = 'outbox';
+
+function outboxOpen() {
+  return new Promise((resolve, reject) => {
+    const req = indexedDB.open(OUTBOX_DB, 1);
+    req.onupgradeneeded = () => req.result.createObjectStore(OUTBOX_STORE, {keyPath: 'idempotency_key'});
+    req.onsuccess = () => resolve(req.result);
+    req.onerror = () => reject(req.error);
+  });
+}
+
+async function outboxTx(mode, fn) {
+  const db = await outboxOpen();
+  return new Promise((resolve, reject) => {
+    const tx = db.transaction(OUTBOX_STORE, mode);
+    const req = fn(tx.objectStore(OUTBOX_STORE));
+    tx.oncomplete = () => resolve(req ? req.result : undefined);
+    tx.onerror = () => reject(tx.error);
+  });
+}
+
+function outboxPut(item) { return outboxTx('readwrite', s => s.put(item)); }
+function outboxAll() { return outboxTx('readonly', s => s.getAll()); }
+function outboxDelete(keys) { return outboxTx('readwrite', s => { keys.forEach(k => s.delete(k)); }); }
+
+// 溜まっている報告を組織（item.base = '/o/<slug>' または ''）ごとに1リクエストでまとめて送る。
+// 戻り値: {idempotency_key: result}
+async function outboxFlush() {
+  const items = await outboxAll();
+  if (!items.length) return {};
+  const base = items[0].base || '';
+  const batch = items.filter(it => (it.base || '') === base).slice(0, 50);
+  const res = await fetch(base + '/public/report/batch', {
+    method: 'POST',
+    headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify({reports: batch}),
+  });
+  if (!res.ok) throw new Error('batch failed: ' + res.status);
+  const data = await res.json();
+  const done = {};
+  data.results.forEach(r => { done[r.idempotency_key] = r.result; });
+  await outboxDelete(Object.keys(done));
+  if (items.length > batch.length) Object.assign(done, await outboxFlush());
+  return done;
+}
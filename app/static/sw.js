@@ -0,0 +1,37 @@
+// app/static/sw.js
+// 回線混雑時のための Service Worker：フォームをキャッシュし、送信キューをバックグラウンドで再送する
+importScripts('/outbox.js');
+
+const CACHE = 'safety-check-v1';
+const OFFLINE_PATHS = ['/f', '/public/roster', '/outbox.js'];
+// 組織ごとのページ（/o/<slug>/f など）も同じくキャッシュする
+const ORG_PATH = /^\/o\/[^/]+(\/f|\/public\/roster)$/;
+
+self.addEventListener('install', (event) => {
+  event.waitUntil(caches.open(CACHE).then(c => c.addAll(OFFLINE_PATHS)));
+  self.skipWaiting();
+});
+
+self.addEventListener('activate', (event) => {
+  event.waitUntil(self.clients.claim());
+});
+
+// ネットワーク優先、失敗時のみキャッシュ
+self.addEventListener('fetch', (event) => {
+  const url = new URL(event.request.url);
+  if (event.request.method !== 'GET' || url.origin !== location.origin) return;
+  if (!OFFLINE_PATHS.includes(url.pathname) && !ORG_PATH.test(url.pathname)) return;
+  event.respondWith(
+    fetch(event.request).then(res => {
+      if (res.ok) {
+        const copy = res.clone();
+        caches.open(CACHE).then(c => c.put(url.pathname, copy));
+      }
+      return res;
+    }).catch(() => caches.match(url.pathname))
+  );
+});
+
+self.addEventListener('sync', (event) => {
+  if (event.tag === 'flush-reports') event.waitUntil(outboxFlush());
+});
@@ -0,0 +1,39 @@
+# app/streaming.py
+# 大きな一覧ページを Jinja の generate() で逐次送信する（全行をメモリに載せない）
+from typing import Iterator
+from fastapi import Request
+from fastapi.templating import Jinja2Templates
+from starlette.responses import StreamingResponse
+from sqlalchemy.sql import Executable
+
+from app.database import read_bind
+
+FETCH_ROWS = 500        # サーバ側カーソルから一度に取り出す行数
+FLUSH_BYTES = 16 * 1024 # この程度たまったら送る（Jinja の細かい断片をまとめる）
+
+def stream_rows_template(templates: Jinja2Templates, name: str, request: Request,
+                         sql: Executable, params: dict, context: dict) -> StreamingResponse:
+    """
+    sql の結果を context["rows"] として遅延イテレータで渡し、描画しながら送る。
+    リクエストのセッションは応答開始前に閉じられるため、接続はジェネレータ内で自前で開く。
+    テンプレート側は {% for r in rows %}…{% else %}…{% endfor %} で空表示を書くこと。
+    """
+    template = templates.get_template(name)
+    bind = read_bind()
+
+    def body() -> Iterator[bytes]:
+        with bind.connect() as conn:
+            # Postgres ではサーバ側カーソルになり、FETCH_ROWS 行ずつ取り出す
+            result = conn.execution_options(stream_results=True, yield_per=FETCH_ROWS).execute(sql, params)
+            buf, size = [], 0
+            for chunk in template.generate(request=request, rows=result.mappings(), **context):
+                data = chunk.encode("utf-8")
+                buf.append(data)
+                size += len(data)
+                if size >= FLUSH_BYTES:
+                    yield b"".join(buf)
+                    buf, size = [], 0
+            if buf:
+                yield b"".join(buf)
+
+    return StreamingResponse(body(), media_type="text/html; charset=utf-8")
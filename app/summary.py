@@ -0,0 +1,104 @@
+# app/summary.py
+from collections import defaultdict
+from typing import Dict
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# 集計対象（旧インシデント方式 / 期間方式）ごとのテーブル・スコープ列・名簿の絞り込み
+# 期間方式の名簿は期間と同じ組織のもの
+_SCOPES = {
+    "incident": ("reports", "incident_id", ""),
+    "period": ("reports_p", "period_id", "AND rro.org_id = (SELECT p.org_id FROM periods p WHERE p.id = :scope_id)"),
+}
+
+# 名簿（アクティブ）× 最新報告 を1行ずつ並べたベース集合
+_BASE_SQL = """
+    SELECT rro.group_name AS group_name,
+           u.grade AS grade,
+           COALESCE(rep.status, 'no_report') AS status,
+           rep.damage_level AS damage_level
+    FROM rosters rro
+    JOIN users u ON u.id = rro.user_id
+    LEFT JOIN {table} rep ON rep.user_id = rro.user_id AND rep.{scope_col} = :scope_id
+    WHERE rro.is_active = TRUE {roster_filter}
+"""
+
+# Postgres: GROUPING SETS で全体/グループ別/属性別/被害レベル別を1スキャンで
+_PG_SQL = """
+    WITH base AS ({base})
+    SELECT GROUPING(group_name) AS g_group,
+           GROUPING(grade) AS g_grade,
+           GROUPING(damage_level) AS g_damage,
+           group_name, grade, damage_level, status, COUNT(*) AS n
+    FROM base
+    GROUP BY GROUPING SETS (
+        (status),
+        (group_name, status),
+        (grade, status),
+        (damage_level, status)
+    )
+"""
+
+# SQLite: GROUPING SETS が無いので最細粒度で1回だけ集計し、Python側でロールアップ
+_FLAT_SQL = """
+    WITH base AS ({base})
+    SELECT group_name, grade, damage_level, status, COUNT(*) AS n
+    FROM base
+    GROUP BY group_name, grade, damage_level, status
+"""
+
+def _key(v) -> str:
+    return v if v else "-"
+
+def _sorted(d: Dict[str, int]) -> Dict[str, int]:
+    return {k: d[k] for k in sorted(d)}
+
+def _nested_sorted(d) -> Dict[str, Dict[str, int]]:
+    return {k: _sorted(d[k]) for k in sorted(d)}
+
+def compute_summary(db: Session, *, period_id: str | None = None, incident_id: str | None = None) -> dict:
+    """
+    ダッシュボード用の集計を1クエリで返す。
+    戻り値: {"total_roster", "counts", "by_group", "by_grade", "by_damage_level"}
+    （counts 以外は {キー: {status: n}} のクロス集計。キーが空の場合は "-"）
+    """
+    if (period_id is None) == (incident_id is None):
+        raise ValueError("Specify exactly one of period_id / incident_id")
+    scope, scope_id = ("period", period_id) if period_id is not None else ("incident", incident_id)
+    table, scope_col, roster_filter = _SCOPES[scope]
+    base = _BASE_SQL.format(table=table, scope_col=scope_col, roster_filter=roster_filter)
+
+    counts: Dict[str, int] = defaultdict(int)
+    by_group = defaultdict(lambda: defaultdict(int))
+    by_grade = defaultdict(lambda: defaultdict(int))
+    by_damage = defaultdict(lambda: defaultdict(int))
+
+    if db.get_bind().dialect.name == "postgresql":
+        rows = db.execute(text(_PG_SQL.format(base=base)), {"scope_id": scope_id}).mappings().all()
+        for r in rows:
+            n = int(r["n"])
+            if not r["g_group"]:
+                by_group[_key(r["group_name"])][r["status"]] += n
+            elif not r["g_grade"]:
+                by_grade[_key(r["grade"])][r["status"]] += n
+            elif not r["g_damage"]:
+                by_damage[_key(r["damage_level"])][r["status"]] += n
+            else:
+                counts[r["status"]] += n
+    else:
+        rows = db.execute(text(_FLAT_SQL.format(base=base)), {"scope_id": scope_id}).mappings().all()
+        for r in rows:
+            n = int(r["n"])
+            st = r["status"]
+            counts[st] += n
+            by_group[_key(r["group_name"])][st] += n
+            by_grade[_key(r["grade"])][st] += n
+            by_damage[_key(r["damage_level"])][st] += n
+
+    return {
+        "total_roster": sum(counts.values()),
+        "counts": _sorted(counts),
+        "by_group": _nested_sorted(by_group),
+        "by_grade": _nested_sorted(by_grade),
+        "by_damage_level": _nested_sorted(by_damage),
+    }
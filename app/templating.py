@@ -0,0 +1,55 @@
+# app/templating.py
+# 全ルーターで共有するテンプレート環境（バイトコードキャッシュ・起動時の事前コンパイル）
+import logging
+import os
+import stat
+import time
+from pathlib import Path
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from fastapi.templating import Jinja2Templates
+
+log = logging.getLogger(__name__)
+
+TEMPLATE_DIR = Path(__file__).resolve().parent / "templates"
+# 開発時のみ 1（テンプレート編集を即反映）。本番ではファイルの更新確認を行わない
+AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "0").lower() in ("1", "true", "yes")
+PRECOMPILE = os.getenv("TEMPLATE_PRECOMPILE", "1").lower() in ("1", "true", "yes")
+# コンパイル済みバイトコードの保存先（再起動・他ワーカーと共有）。
+# 未指定なら Jinja 既定のユーザー専用ディレクトリ（/tmp/_jinja2-cache-<uid>、0700・所有者を確認して作る）。
+# 読み込んだバイトコードはそのまま実行されるため、指定する場合も自分の所有で 0700 のディレクトリに限る
+CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR")
+
+def _private_dir(path: str) -> bool:
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)
+    return (stat.S_ISDIR(st.st_mode) and st.st_uid == os.getuid()
+            and stat.S_IMODE(st.st_mode) & 0o077 == 0)
+
+def _bytecode_cache() -> FileSystemBytecodeCache | None:
+    try:
+        if not CACHE_DIR:
+            return FileSystemBytecodeCache()
+        if not _private_dir(CACHE_DIR):
+            log.warning("template bytecode cache disabled: %s must be owned by this user with mode 0700", CACHE_DIR)
+            return None
+        return FileSystemBytecodeCache(CACHE_DIR)
+    except (OSError, RuntimeError):  # 書き込めない・他人のディレクトリが先にある環境ではキャッシュ無しで動かす
+        log.warning("template bytecode cache disabled: %s is not usable", CACHE_DIR or "default cache directory")
+        return None
+
+env = Environment(
+    loader=FileSystemLoader(str(TEMPLATE_DIR)),
+    autoescape=True,
+    auto_reload=AUTO_RELOAD,
+    bytecode_cache=_bytecode_cache(),
+    cache_size=-1,   # テンプレート数は少ないので全て保持
+)
+templates = Jinja2Templates(env=env)
+
+def precompile() -> dict:
+    """app/templates 以下を全てコンパイルしてメモリに載せる（最初のリクエストでの遅延を無くす）"""
+    t0 = time.perf_counter()
+    names = env.list_templates(extensions=["html"])
+    for name in names:
+        env.get_template(name)
+    return {"templates": len(names), "elapsed_ms": round((time.perf_counter() - t0) * 1000, 2)}
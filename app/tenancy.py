@@ -0,0 +1,213 @@
+# app/tenancy.py
+# 複数の組織（研究室・部署）を1つのデプロイで扱うためのテナント解決と、テナントごとの予算
+#
+# - 組織は organizations 表にあり、起動時と ORG の無効化通知のときだけ読み込む（リクエストごとの問い合わせは無い）
+# - リクエストの組織は パス（/o/<slug>/...）→ Host ヘッダ → 管理画面のセッション → 既定の組織 の順に決める。
+#   パスで指定された場合は root_path に /o/<slug> を足し、ルーティングは従来のパスのまま動く
+# - 決めた組織は contextvar に置く（同期エンドポイントのスレッドにも引き継がれる）
+# - ワーカーごと・組織ごとに同時処理数（DB 接続の取り合いを抑える）と、報告送信のレート（トークンバケット）を制限する
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import text
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.database import SessionLocal, POOL_SIZE, MAX_OVERFLOW
+from app.models import DEFAULT_ORG_ID
+from app import invalidation
+
+log = logging.getLogger(__name__)
+
+PATH_PREFIX = "/o/"
+# 組織ごとの同時処理数の既定（DB 接続プールの半分。1つの組織の訓練で他の組織の接続が尽きないように）
+MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", str(max(1, (POOL_SIZE + MAX_OVERFLOW) // 2))))
+QUEUE_TIMEOUT = float(os.getenv("TENANT_QUEUE_TIMEOUT", "5"))
+# 報告送信（POST /public/report*）の毎秒の上限の既定（0 で無制限）。瞬間的には2秒分まで許す
+SUBMIT_RATE = float(os.getenv("TENANT_SUBMIT_RATE", "0"))
+# 予算の対象外（静的ファイル）
+_UNMETERED = ("/sw.js", "/outbox.js", "/static/")
+
+class Org(NamedTuple):
+    id: str
+    slug: str
+    name: str
+    hosts: Tuple[str, ...] = ()
+    max_concurrency: Optional[int] = None
+    submit_rate: Optional[float] = None
+
+DEFAULT_ORG = Org(DEFAULT_ORG_ID, "default", "Default")
+
+_by_id: Dict[str, Org] = {DEFAULT_ORG_ID: DEFAULT_ORG}
+_by_slug: Dict[str, Org] = {DEFAULT_ORG.slug: DEFAULT_ORG}
+_by_host: Dict[str, Org] = {}
+_current: ContextVar[Org] = ContextVar("org", default=DEFAULT_ORG)
+_prefix: ContextVar[str] = ContextVar("org_prefix", default="")
+
+def current() -> Org:
+    return _current.get()
+
+def current_id() -> str:
+    return _current.get().id
+
+def prefix() -> str:
+    """このリクエストのURLの組織部分（パスで指定されたときだけ /o/<slug>）"""
+    return _prefix.get()
+
+def path_prefix(org: Org) -> str:
+    # メール等に載せるURL用（既定の組織は接頭辞なし）
+    return "" if org.id == DEFAULT_ORG_ID else f"{PATH_PREFIX}{org.slug}"
+
+@contextmanager
+def use(org: Org) -> Iterator[Org]:
+    """バックグラウンド処理で組織を明示する"""
+    token = _current.set(org)
+    try:
+        yield org
+    finally:
+        _current.reset(token)
+
+def all_orgs() -> List[Org]:
+    return list(_by_id.values())
+
+def get(org_id: str) -> Optional[Org]:
+    return _by_id.get(org_id)
+
+def by_slug(slug: str) -> Optional[Org]:
+    return _by_slug.get(slug)
+
+def load() -> None:
+    try:
+        with SessionLocal() as db:
+            rows = db.execute(text(
+                "SELECT id, slug, name, hosts, max_concurrency, submit_rate FROM organizations")).all()
+    except Exception:  # noqa: BLE001  表の作成前（初回起動）は既定の組織だけで動く
+        log.exception("failed to load organizations")
+        return
+    orgs = [Org(i, s, n, tuple(h.strip().lower() for h in (hosts or "").split(",") if h.strip()), mc, sr)
+            for i, s, n, hosts, mc, sr in rows]
+    if not any(o.id == DEFAULT_ORG_ID for o in orgs):
+        orgs.append(DEFAULT_ORG)
+    _by_id.clear(); _by_id.update({o.id: o for o in orgs})
+    _by_slug.clear(); _by_slug.update({o.slug: o for o in orgs})
+    _by_host.clear(); _by_host.update({h: o for o in orgs for h in o.hosts})
+
+def resolve(path: str, host: str, session: Optional[dict]) -> Tuple[Optional[Org], str]:
+    """戻り値: (組織。未知の slug なら None, root_path に足す接頭辞)"""
+    if path.startswith(PATH_PREFIX):
+        slug = path[len(PATH_PREFIX):].split("/", 1)[0]
+        return _by_slug.get(slug), f"{PATH_PREFIX}{slug}"
+    org = _by_host.get(host.split(":", 1)[0].lower()) if host else None
+    if org is None and session:
+        org = _by_id.get(session.get("org") or "")
+    return org or DEFAULT_ORG, ""
+
+# --- 組織ごとの予算（ワーカー内） ---
+class _Budget:
+    def __init__(self, org: Org):
+        self.limit = org.max_concurrency or MAX_CONCURRENCY
+        self.sem = asyncio.Semaphore(self.limit)
+        self.in_flight = 0   # 枠を取って処理中のリクエスト数
+        self.rate = org.submit_rate if org.submit_rate is not None else SUBMIT_RATE
+        self.tokens = self.rate * 2
+        self.updated = time.monotonic()
+        self.rejected = 0
+        self.throttled = 0
+
+    def take_submit(self) -> bool:
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self.tokens = min(self.rate * 2, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+_budgets: Dict[str, _Budget] = {}
+
+def _budget(org: Org) -> _Budget:
+    b = _budgets.get(org.id)
+    if b is None:
+        b = _budgets[org.id] = _Budget(org)
+    return b
+
+def budgets() -> Dict[str, dict]:
+    return {oid: {"max_concurrency": b.limit, "in_flight": b.in_flight,
+                  "submit_rate": b.rate, "rejected": b.rejected, "throttled": b.throttled}
+            for oid, b in _budgets.items()}
+
+async def _plain(send: Send, status: int, body: bytes, headers: List[Tuple[bytes, bytes]] = ()) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+class TenantMiddleware:
+    """セッションより内側に置く（管理画面のセッションに保存した組織を参照するため）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        host = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"host"), "")
+        org, pfx = resolve(path, host, scope.get("session"))
+        if org is None:
+            await _plain(send, 404, b"Unknown organization")
+            return
+        if pfx:
+            scope = dict(scope, root_path=scope.get("root_path", "") + pfx)
+        org_token, pfx_token = _current.set(org), _prefix.set(pfx)
+        try:
+            route = path[len(pfx):] or "/"
+            if route.startswith(_UNMETERED):
+                await self.app(scope, receive, send)
+                return
+            b = _budget(org)
+            if scope["method"] == "POST" and route.startswith("/public/report") and not b.take_submit():
+                b.throttled += 1
+                await _plain(send, 429, b"Too many submissions, retry shortly", [(b"retry-after", b"1")])
+                return
+            try:
+                await asyncio.wait_for(b.sem.acquire(), QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                b.rejected += 1
+                await _plain(send, 503, b"Busy, retry shortly", [(b"retry-after", b"2")])
+                return
+            b.in_flight += 1
+            # 枠は応答を送り終えた時点で返す（BackgroundTasks は応答の後に同じ呼び出しの中で動くため、
+            # 終わるまで待つと後処理の間も組織の同時処理数を占有してしまう）
+            released = False
+
+            def release() -> None:
+                nonlocal released
+                if not released:
+                    released = True
+                    b.in_flight -= 1
+                    b.sem.release()
+
+            async def send_and_release(message) -> None:
+                await send(message)
+                if message["type"] == "http.response.body" and not message.get("more_body", False):
+                    release()
+
+            try:
+                await self.app(scope, receive, send_and_release)
+            finally:
+                release()
+        finally:
+            _current.reset(org_token)
+            _prefix.reset(pfx_token)
+
+def _on_changed() -> None:
+    load()
+    _budgets.clear()
+
+invalidation.subscribe(invalidation.ORG, _on_changed)
@@ -0,0 +1,151 @@
+# app/timeline.py
+# 期間開始からの「初回報告」の分単位の件数（全体・グループ別・属性別）
+# reports_p は最終更新時刻しか持たないため、初回報告の時点で report_timeline_p に加算しておく。
+# 参照時は分ごとの件数を累積和にして、間引き（step 分ごとの合計）とパーセンタイルを求める
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime
+from itertools import accumulate
+from math import ceil
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.models_persistent import Period
+
+DIMENSIONS = ("all", "group", "grade")
+PERCENTILES = (50, 90, 99)
+MAX_POINTS = 500
+
+# (期間, 分, 次元, キー) ごとの件数を加算（SQLite 3.24+ / Postgres 共通の upsert）
+_UPSERT = text("""
+    INSERT INTO report_timeline_p (period_id, minute, dim, key, n)
+    VALUES (:pid, :minute, :dim, :key, :n)
+    ON CONFLICT (period_id, minute, dim, key) DO UPDATE SET n = report_timeline_p.n + excluded.n
+""")
+
+_MEMBER = text("""
+    SELECT u.grade, r.group_name
+    FROM users u LEFT JOIN rosters r ON r.user_id = u.id
+    WHERE u.id = :uid
+""")
+
+def _key(v: Optional[str]) -> str:
+    return v if v else "-"
+
+def minute_of(started_at: datetime, at: datetime) -> int:
+    return max(0, int((at - started_at).total_seconds() // 60))
+
+def record_first(db: Session, period_id: str, user_id: str, at: datetime) -> None:
+    """初回報告を1件加算する（apply_report から、報告の新規作成時のみ。commit は呼び出し側）"""
+    period = db.get(Period, period_id)
+    if period is None:
+        return
+    member = db.execute(_MEMBER, {"uid": user_id}).first()
+    grade, group = member if member else (None, None)
+    minute = minute_of(period.started_at, at)
+    db.execute(_UPSERT, [
+        {"pid": period_id, "minute": minute, "dim": "all", "key": "", "n": 1},
+        {"pid": period_id, "minute": minute, "dim": "group", "key": _key(group), "n": 1},
+        {"pid": period_id, "minute": minute, "dim": "grade", "key": _key(grade), "n": 1},
+    ])
+
+def backfill(conn: Connection) -> int:
+    """
+    集計行の無い期間を既存の報告から埋める（その場マイグレーションから）。
+    初回の時刻は残っていないため、最終更新と最古の更新履歴の早い方で近似する
+    """
+    rows = conn.execute(text("""
+        SELECT rp.period_id, p.started_at, u.grade, r.group_name, rp.updated_at, h.first_changed
+        FROM reports_p rp
+        JOIN periods p ON p.id = rp.period_id
+        JOIN users u ON u.id = rp.user_id
+        LEFT JOIN rosters r ON r.user_id = rp.user_id
+        LEFT JOIN (
+            SELECT period_id, user_id, MIN(changed_at) AS first_changed
+            FROM report_history_p GROUP BY period_id, user_id
+        ) h ON h.period_id = rp.period_id AND h.user_id = rp.user_id
+        WHERE NOT EXISTS (SELECT 1 FROM report_timeline_p t WHERE t.period_id = rp.period_id)
+    """)).all()
+    counts: Counter = Counter()
+    for pid, started, grade, group, updated, first_changed in rows:
+        at = min(_dt(updated), _dt(first_changed)) if first_changed else _dt(updated)
+        minute = minute_of(_dt(started), at)
+        counts[(pid, minute, "all", "")] += 1
+        counts[(pid, minute, "group", _key(group))] += 1
+        counts[(pid, minute, "grade", _key(grade))] += 1
+    if counts:
+        conn.execute(_UPSERT, [{"pid": pid, "minute": m, "dim": d, "key": k, "n": n}
+                               for (pid, m, d, k), n in counts.items()])
+    return len(rows)
+
+def _dt(v) -> datetime:
+    # SQLite の生SQLでは文字列で返る
+    return v if isinstance(v, datetime) else datetime.fromisoformat(str(v))
+
+def load(db: Session, period_id: str, dim: str) -> Dict[str, Dict[int, int]]:
+    """{キー: {分: 件数}}"""
+    out: Dict[str, Dict[int, int]] = {}
+    for key, minute, n in db.execute(text("""
+        SELECT key, minute, n FROM report_timeline_p
+        WHERE period_id = :pid AND dim = :dim
+    """), {"pid": period_id, "dim": dim}):
+        out.setdefault(key, {})[int(minute)] = int(n)
+    return out
+
+def _dense(buckets: Dict[int, int], span: int) -> List[int]:
+    counts = [0] * span
+    for minute, n in buckets.items():
+        if minute < span:
+            counts[minute] += n
+    return counts
+
+def downsample(counts: List[int], step: int) -> List[int]:
+    return [sum(counts[i:i + step]) for i in range(0, len(counts), step)]
+
+def percentiles(cumulative: List[int], ps: Iterable[int] = PERCENTILES) -> Dict[str, Optional[int]]:
+    """
+    分ごとの累積件数から、初回報告までの時間のパーセンタイル（分、バケットの上端）を求める。
+    最近接順位法: 全体 N 件のうち ceil(p/100*N) 件目が入る分
+    """
+    total = cumulative[-1] if cumulative else 0
+    out: Dict[str, Optional[int]] = {}
+    for p in ps:
+        if not total:
+            out[f"p{p}"] = None
+            continue
+        rank = max(1, ceil(p / 100 * total))
+        out[f"p{p}"] = bisect_left(cumulative, rank) + 1
+    return out
+
+def build(db: Session, period: Period, dim: str = "all", step: Optional[int] = None,
+          max_points: int = 120, now: Optional[datetime] = None) -> dict:
+    data = load(db, period.id, dim)
+    end = period.ended_at or now or datetime.utcnow()
+    last = max((m for b in data.values() for m in b), default=-1)
+    span = max(last, minute_of(period.started_at, end)) + 1
+    max_points = max(1, min(max_points, MAX_POINTS))
+    step = max(step or 1, ceil(span / max_points))
+
+    series = {}
+    for key in sorted(data):
+        counts = _dense(data[key], span)
+        cumulative = list(accumulate(counts))
+        series[key] = {
+            "counts": downsample(counts, step),
+            # 各区間の終わりの時点での累計
+            "cumulative": cumulative[step - 1::step] + ([cumulative[-1]] if span % step else []),
+            "total": cumulative[-1],
+            "time_to_report_min": percentiles(cumulative),
+        }
+    return {
+        "period_id": period.id,
+        "seq": period.seq,
+        "started_at": period.started_at,
+        "ended_at": period.ended_at,
+        "dim": dim,
+        "step_minutes": step,
+        "minutes": span,
+        "series": series,
+    }
@@ -0,0 +1,338 @@
+# app/triage.py
+# 要支援・重大被害の報告を優先度順に並べるトリアージキュー（期間ごと）
+#
+# - 並び順（ヒープ）はプロセス内。担当・対応済みの状態は triage_claims_p に置き、条件付き UPDATE で取り合う
+#   （--workers N でも同じ報告を2人が担当できない。再起動しても対応済みは残る）
+# - キューは最初の参照時に1回だけ DB から構築し、以後は差分で更新する（作り直さない）
+#   - このワーカーで確定した報告: commit 直後に upsert
+#   - 他ワーカーで確定した報告: REFRESH_SEC ごとに written_at（サーバーの書き込み時刻）が新しい行だけ読んで upsert
+#   - 担当・対応済みの変更: 無効化バス（invalidation.TRIAGE）を受けたワーカーが担当表だけ読み直して set_state
+#   差分の取り込みに失敗したキュー（担当の変更を取りこぼした可能性がある）だけ、次の参照時に全件を読み直す
+# - 期限切れの担当の解除（DB）はリーダーの定期ジョブで行う（expire_claims）
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy import DateTime, String, and_, bindparam, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal, engine
+from app.models_persistent import ReportP, TriageClaimP
+from app import invalidation, reporting
+
+STATUS_WEIGHT = {"need_help": 100.0, "unknown": 20.0, "evacuating": 10.0, "safe": 0.0}
+DAMAGE_WEIGHT = {"severe": 80.0, "moderate": 30.0, "minor": 5.0, "none": 0.0}
+AGE_WEIGHT_PER_MIN = 1.0          # 最終更新から1分ごとに +1（放置されている報告を浮かせる）
+CLAIM_TTL = timedelta(minutes=15)  # 担当の自動解除までの時間
+REFRESH_SEC = float(os.getenv("TRIAGE_REFRESH_SEC", "5"))
+# 差分の取り込みで遡る幅（ワーカー間の時計のずれと、書き込みから commit までの遅れを吸収する）
+SYNC_MARGIN = timedelta(seconds=float(os.getenv("TRIAGE_SYNC_MARGIN_SEC", "30")))
+
+log = logging.getLogger(__name__)
+
+_EPOCH = datetime(1970, 1, 1)
+
+reports = ReportP.__table__
+claims = TriageClaimP.__table__
+
+def base_score(status: str | None, damage_level: str | None) -> float:
+    return STATUS_WEIGHT.get(status or "", 0.0) + DAMAGE_WEIGHT.get(damage_level or "", 0.0)
+
+def score_at(base: float, updated_at: datetime, now: datetime) -> float:
+    return base + AGE_WEIGHT_PER_MIN * max(0.0, (now - updated_at).total_seconds()) / 60.0
+
+class TriageItem(NamedTuple):
+    user_id: str
+    status: str
+    damage_level: str | None
+    updated_at: datetime
+    base: float
+    seq: int
+
+class ClaimConflict(Exception):
+    pass
+
+class TriageQueue:
+    """
+    優先度 = base(状況, 被害) + 経過分 × AGE_WEIGHT_PER_MIN。
+    経過時間の項は全件に同じ速度で加算されるため、順序は
+    base - AGE_WEIGHT_PER_MIN × updated_at(分) だけで決まり、時間経過で並べ替える必要がない。
+    これをキーにした二分ヒープ（遅延削除）で更新 O(log n)、上位K件の参照 O(K log K)。
+    担当・対応済みは DB の写し（変更は claim / ack など経由で DB に書き、set_state で反映する）。
+    """
+
+    def __init__(self, period_id: str = ""):
+        self.period_id = period_id
+        self._lock = threading.Lock()
+        self._heap: List[Tuple[float, int, str]] = []
+        self._items: Dict[str, TriageItem] = {}
+        self._claims: Dict[str, Tuple[str, datetime]] = {}
+        self._acked: Dict[str, datetime] = {}   # user_id → 対応済みにした時点の updated_at
+        self._seq = itertools.count()
+        self.sync_lock = threading.Lock()       # 差分の取り込みは1スレッドだけ（他は今のキューを返す）
+        self.synced_at = datetime.utcnow()      # ここまでに書き込まれた報告は取り込み済み（DB の written_at と比べる）
+        self.checked = time.monotonic()
+        self.stale = False                      # 差分を取りこぼした可能性がある → 全件を読み直す
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @staticmethod
+    def _key(base: float, updated_at: datetime) -> float:
+        minutes = (updated_at - _EPOCH).total_seconds() / 60.0
+        return AGE_WEIGHT_PER_MIN * minutes - base   # 小さいほど優先（min-heap）
+
+    def set_state(self, user_id: str, claimed_by: str | None, claimed_at: datetime | None,
+                  acked_at: datetime | None) -> None:
+        # DB の担当・対応済みで置き換える（解除・対応済みも反映する）
+        with self._lock:
+            if claimed_by and claimed_at:
+                self._claims[user_id] = (claimed_by, claimed_at)
+            else:
+                self._claims.pop(user_id, None)
+            if acked_at:
+                self._acked[user_id] = acked_at
+                it = self._items.get(user_id)
+                if it is not None and it.updated_at <= acked_at:
+                    self._items.pop(user_id)   # ヒープ側は遅延削除
+            else:
+                self._acked.pop(user_id, None)
+
+    def upsert(self, user_id: str, status: str, damage_level: str | None, updated_at: datetime) -> None:
+        base = base_score(status, damage_level)
+        with self._lock:
+            acked = self._acked.get(user_id)
+            if acked is not None:
+                if updated_at <= acked:
+                    return
+                del self._acked[user_id]   # 対応後に再報告があれば再びキューへ
+            cur = self._items.get(user_id)
+            if cur is not None and (cur.updated_at > updated_at or
+                                    (cur.updated_at, cur.status, cur.damage_level) == (updated_at, status, damage_level)):
+                return   # 取り込み済み（差分は遡って読むので同じ行が何度か来る）か、手元の方が新しい
+            if base <= 0:
+                self._remove_locked(user_id)
+                return
+            seq = next(self._seq)
+            self._items[user_id] = TriageItem(user_id, status, damage_level, updated_at, base, seq)
+            heapq.heappush(self._heap, (self._key(base, updated_at), seq, user_id))
+            self._maybe_compact_locked()
+
+    def _remove_locked(self, user_id: str) -> Optional[TriageItem]:
+        self._claims.pop(user_id, None)
+        return self._items.pop(user_id, None)   # ヒープ側は遅延削除
+
+    def _maybe_compact_locked(self) -> None:
+        if len(self._heap) > 2 * len(self._items) + 64:
+            self._heap = [(self._key(it.base, it.updated_at), it.seq, it.user_id) for it in self._items.values()]
+            heapq.heapify(self._heap)
+
+    def _valid(self, entry: Tuple[float, int, str]) -> bool:
+        it = self._items.get(entry[2])
+        return it is not None and it.seq == entry[1]
+
+    def top(self, k: int, now: datetime | None = None) -> List[dict]:
+        # ヒープ配列を親→子の順に最良優先で辿り、上位K件だけ取り出す（ヒープ自体は壊さない）
+        now = now or datetime.utcnow()
+        with self._lock:
+            out = []
+            frontier = [(self._heap[0], 0)] if self._heap else []
+            while frontier and len(out) < k:
+                entry, i = heapq.heappop(frontier)
+                if self._valid(entry):
+                    it = self._items[entry[2]]
+                    claim = self._claims.get(it.user_id)
+                    if claim and now - claim[1] > CLAIM_TTL:
+                        claim = None
+                    out.append({
+                        "user_id": it.user_id,
+                        "status": it.status,
+                        "damage_level": it.damage_level,
+                        "updated_at": it.updated_at,
+                        "score": round(score_at(it.base, it.updated_at, now), 2),
+                        "claimed_by": claim[0] if claim else None,
+                        "claimed_at": claim[1] if claim else None,
+                    })
+                for c in (2 * i + 1, 2 * i + 2):
+                    if c < len(self._heap):
+                        heapq.heappush(frontier, (self._heap[c], c))
+            return out
+
+# --- 期間ごとのキュー ---
+_lock = threading.Lock()
+_queues: Dict[str, TriageQueue] = {}
+
+_pid = bindparam("pid", type_=String)
+_since = bindparam("since", type_=DateTime)
+_COLUMNS = (reports.c.user_id, reports.c.status, reports.c.damage_level, reports.c.updated_at,
+            claims.c.claimed_by, claims.c.claimed_at, claims.c.acked_at)
+_with_claims = reports.outerjoin(claims, and_(claims.c.period_id == reports.c.period_id,
+                                              claims.c.user_id == reports.c.user_id))
+
+# ix_reports_p_triage を使って対象行だけを読み、担当・対応済みを突き合わせる
+_LOAD = (
+    select(*_COLUMNS).select_from(_with_claims)
+    .where(reports.c.period_id == _pid,
+           or_(reports.c.status.in_(("need_help", "unknown", "evacuating")),
+               reports.c.damage_level.in_(("severe", "moderate", "minor"))))
+)
+
+# 差分: 前回の取り込み以降に書き込まれた行（ix_reports_p_written）。対象外になった報告を外すため絞り込まない
+_DELTA = select(*_COLUMNS).select_from(_with_claims).where(reports.c.period_id == _pid, reports.c.written_at >= _since)
+
+_CLAIMS = select(claims.c.user_id, claims.c.claimed_by, claims.c.claimed_at, claims.c.acked_at).where(
+    claims.c.period_id == _pid)
+
+def _apply_rows(q: TriageQueue, rows) -> None:
+    for uid, status, dmg, ts, claimed_by, claimed_at, acked_at in rows:
+        q.set_state(uid, claimed_by, claimed_at, acked_at)
+        q.upsert(uid, status, dmg, ts)
+
+def _load(db: Session, period_id: str) -> TriageQueue:
+    q = TriageQueue(period_id)   # synced_at は読む前の時刻
+    _apply_rows(q, db.execute(_LOAD, {"pid": period_id}).all())
+    return q
+
+def _sync(db: Session, q: TriageQueue) -> None:
+    # 他ワーカーで確定した報告を取り込む
+    started = datetime.utcnow()
+    _apply_rows(q, db.execute(_DELTA, {"pid": q.period_id, "since": q.synced_at - SYNC_MARGIN}).all())
+    q.synced_at = started
+    q.checked = time.monotonic()
+
+def _sync_claims(db: Session, q: TriageQueue) -> None:
+    for uid, claimed_by, claimed_at, acked_at in db.execute(_CLAIMS, {"pid": q.period_id}).all():
+        q.set_state(uid, claimed_by, claimed_at, acked_at)
+
+def get_queue(db: Session, period_id: str) -> TriageQueue:
+    invalidation.ensure_fresh()
+    q = _queues.get(period_id)
+    if q is None or q.stale:
+        with _lock:
+            q = _queues.get(period_id)
+            if q is None or q.stale:
+                q = _load(db, period_id)
+                _queues[period_id] = q
+        return q
+    if time.monotonic() - q.checked >= REFRESH_SEC and q.sync_lock.acquire(blocking=False):
+        try:
+            _sync(db, q)
+        finally:
+            q.sync_lock.release()
+    return q
+
+# --- 担当・対応済み（DB が正。変更後は全ワーカーが担当表を読み直す） ---
+def _where(period_id: str, user_id: str):
+    return and_(claims.c.period_id == period_id, claims.c.user_id == user_id)
+
+def _queued_report(db: Session, period_id: str, user_id: str):
+    # キューに載る報告か（要支援・被害あり、かつ対応済み以降に更新がある）。載らなければ KeyError
+    rep = db.execute(
+        select(reports.c.status, reports.c.damage_level, reports.c.updated_at)
+        .where(reports.c.period_id == period_id, reports.c.user_id == user_id)
+    ).first()
+    if rep is None or base_score(rep.status, rep.damage_level) <= 0:
+        raise KeyError(user_id)
+    acked_at = db.execute(select(claims.c.acked_at).where(_where(period_id, user_id))).scalar()
+    if acked_at is not None and rep.updated_at <= acked_at:
+        raise KeyError(user_id)
+    return rep
+
+def _take(db: Session, period_id: str, user_id: str, responder: str, now: datetime, values: dict) -> None:
+    # 担当が空き・自分・期限切れのときだけ書く条件付き UPDATE。行が無ければ作る（同時作成は UPDATE でやり直す）
+    free = or_(claims.c.claimed_by.is_(None), claims.c.claimed_by == responder,
+               claims.c.claimed_at < now - CLAIM_TTL)
+    stmt = update(claims).where(_where(period_id, user_id), free).values(**values)
+    if db.execute(stmt).rowcount:
+        return
+    holder = db.execute(select(claims.c.claimed_by).where(_where(period_id, user_id))).first()
+    if holder is None:
+        try:
+            db.execute(insert(claims).values(period_id=period_id, user_id=user_id, **values))
+            return
+        except IntegrityError:
+            db.rollback()
+            if db.execute(stmt).rowcount:
+                return
+            holder = db.execute(select(claims.c.claimed_by).where(_where(period_id, user_id))).first()
+    db.rollback()   # 条件付き UPDATE で取った書き込みロックをすぐ返す
+    raise ClaimConflict(holder[0] if holder else None)
+
+def _changed(db: Session) -> None:
+    db.commit()
+    invalidation.publish(invalidation.TRIAGE)
+
+def claim(db: Session, period_id: str, user_id: str, responder: str, now: datetime | None = None) -> None:
+    now = now or datetime.utcnow()
+    _queued_report(db, period_id, user_id)
+    _take(db, period_id, user_id, responder, now, {"claimed_by": responder, "claimed_at": now})
+    _changed(db)
+
+def release(db: Session, period_id: str, user_id: str, responder: str) -> None:
+    n = db.execute(
+        update(claims).where(_where(period_id, user_id), claims.c.claimed_by == responder)
+        .values(claimed_by=None, claimed_at=None)
+    ).rowcount
+    if n:
+        _changed(db)
+
+def ack(db: Session, period_id: str, user_id: str, responder: str, now: datetime | None = None) -> None:
+    now = now or datetime.utcnow()
+    rep = _queued_report(db, period_id, user_id)
+    _take(db, period_id, user_id, responder, now, {
+        "claimed_by": None, "claimed_at": None, "acked_by": responder, "acked_at": rep.updated_at,
+    })
+    _changed(db)
+
+def evict(keep_period_ids) -> int:
+    # 現在の期間（組織ごと）以外のキューを捨てる（各ワーカー）
+    keep = set(keep_period_ids)
+    with _lock:
+        stale = [pid for pid in _queues if pid not in keep]
+        for pid in stale:
+            del _queues[pid]
+    return len(stale)
+
+def expire_claims(now: datetime | None = None) -> int:
+    # 期限切れの担当を DB で解除する（リーダーの定期ジョブ。表示上は top() が期限切れを空きとして扱う）
+    now = now or datetime.utcnow()
+    with engine.begin() as conn:
+        expired = conn.execute(
+            update(claims).where(claims.c.claimed_at < now - CLAIM_TTL).values(claimed_by=None, claimed_at=None)
+        ).rowcount
+    if expired:
+        invalidation.publish(invalidation.TRIAGE)
+    return expired
+
+def _on_report_committed(writes: List[dict]) -> None:
+    for w in writes:
+        q = _queues.get(w["period_id"])
+        if q is not None:   # 未構築ならDBから遅延構築されるので何もしない
+            q.upsert(w["user_id"], w["status"], w["damage_level"], w["updated_at"])
+
+def _on_claims_changed() -> None:
+    # どの担当が変わったかは通知に載らないので、手元のキューの期間の担当表を読み直す（報告は読まない）
+    qs = list(_queues.values())
+    if not qs:
+        return
+    try:
+        with SessionLocal() as db:
+            for q in qs:
+                _sync_claims(db, q)
+    except Exception:  # noqa: BLE001  読めなければ次の参照時に全件を読み直す
+        log.exception("triage claim sync failed")
+        for q in qs:
+            q.stale = True
+
+def _drop_all() -> None:
+    with _lock:
+        _queues.clear()
+
+reporting.on_committed(_on_report_committed)
+invalidation.subscribe(invalidation.PERIOD, _drop_all)
+invalidation.subscribe(invalidation.TRIAGE, _on_claims_changed)
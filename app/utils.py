@@ -7,4 +7,16 @@ def new_token() -> str:
 
 
 def default_expiry(hours: int = 48) -> datetime:
-    return datetime.utcnow() + timedelta(hours=hours)
\ No newline at end of file
+    return datetime.utcnow() + timedelta(hours=hours)
+
+
+# 学年/職位の表記ゆれ（略記・つづり誤り・大文字小文字）を名簿の表記に揃える
+# 公開フォーム・名簿CSVの取り込み・一括操作のキーで同じ規則を使う
+_GRADES = {"staff": "Staff", "doctor": "Doctor", "master": "Master", "m": "Master",
+           "bachelor": "Bachelor", "bacholar": "Bachelor", "bachelar": "Bachelor", "b": "Bachelor",
+           "researcher": "Researcher", "r": "Researcher"}
+
+
+def normalize_grade(s: str) -> str:
+    s = (s or "").strip().lower()
+    return _GRADES.get(s, s.title())
@@ -0,0 +1,72 @@
+# bench/bench_cold_start.py
+# 新しいプロセスで起動し、/f と /admin の初回アクセスの応答時間を測る
+#   python -m bench.bench_cold_start
+# 事前コンパイルの有無・バイトコードキャッシュの有無（空/温まり済み）を比較する
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+CHILD = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+from fastapi.testclient import TestClient
+from app.main import app
+imported = time.perf_counter()
+c = TestClient(app)
+c.__enter__()   # startup イベント（事前コンパイルを含む）
+started = time.perf_counter()
+out = {"import_ms": (imported - t0) * 1000, "startup_ms": (started - imported) * 1000}
+for key, path in (("first_f_ms", "/f"), ("second_f_ms", "/f")):
+    t = time.perf_counter(); assert c.get(path).status_code == 200; out[key] = (time.perf_counter() - t) * 1000
+assert c.post("/admin/login", data={"token": os.environ.get("ADMIN_TOKEN", "changeme")},
+              follow_redirects=False).status_code == 303
+for key in ("first_admin_ms", "second_admin_ms"):
+    t = time.perf_counter(); assert c.get("/admin").status_code == 200; out[key] = (time.perf_counter() - t) * 1000
+c.__exit__(None, None, None)
+print(json.dumps(out))
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run(workdir: str, precompile: bool, cache_dir: str) -> dict:
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               TEMPLATE_PRECOMPILE="1" if precompile else "0",
+               TEMPLATE_CACHE_DIR=cache_dir,
+               SCHEDULER_ENABLED="0",
+               PYTHONPATH=ROOT)
+    p = subprocess.run([sys.executable, "-c", CHILD], env=env, cwd=ROOT,
+                       capture_output=True, text=True, check=True)
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    workdir = tempfile.mkdtemp(prefix="bench_cold_")
+    try:
+        cache = os.path.join(workdir, "jinja")
+        run(workdir, True, cache)   # DB作成分を除外するための空打ち
+        cases = [
+            ("lazy, empty cache", False, None),
+            ("precompile, empty cache", True, None),
+            ("precompile, warm cache", True, cache),
+        ]
+        cols = ["import_ms", "startup_ms", "first_f_ms", "second_f_ms", "first_admin_ms", "second_admin_ms"]
+        print(f"{'case':<26}" + "".join(f"{c:>16}" for c in cols))
+        for name, precompile, cache_dir in cases:
+            samples = []
+            for _ in range(repeat):
+                d = cache_dir
+                if d is None:
+                    d = os.path.join(workdir, "jinja_empty")
+                    shutil.rmtree(d, ignore_errors=True)
+                samples.append(run(workdir, precompile, d))
+            best = {c: min(s[c] for s in samples) for c in cols}
+            print(f"{name:<26}" + "".join(f"{best[c]:>16.1f}" for c in cols))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# bench/bench_pool_breaker.py
+# 接続プールの pre-ping と、死活確認＋サーキットブレーカー（app/pool_health.py）の比較
+#   python -m bench.bench_pool_breaker [往復遅延ms] [接続タイムアウトms] [障害中のリクエスト数]
+# DB は「落とせる」スタンドイン（SQLite に往復遅延を足し、drop() で既存接続を切って新規接続をタイムアウトさせる）
+#  1. 平常時: 1リクエスト（貸し出し + SELECT 1）あたりの時間
+#  2. 障害時: 各リクエストが失敗するまでの時間（pre-ping は毎回タイムアウト待ち、ブレーカーは開いた後は即失敗）
+#  3. 復旧後: ブレーカーが閉じるまでの時間
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.pool import NullPool, QueuePool
+
+from app import pool_health
+
+class _Cursor:
+    def __init__(self, cur, rtt: float):
+        self._cur, self._rtt = cur, rtt
+
+    def execute(self, *a, **kw):
+        time.sleep(self._rtt)
+        return self._cur.execute(*a, **kw)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+class _Conn:
+    def __init__(self, conn, rtt: float):
+        self._conn, self._rtt = conn, rtt
+
+    def cursor(self, *a, **kw):
+        return _Cursor(self._conn.cursor(*a, **kw), self._rtt)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class StandIn:
+    """落とせる DB のスタンドイン"""
+
+    def __init__(self, path: str, rtt: float, connect_timeout: float):
+        self.path, self.rtt, self.connect_timeout = path, rtt, connect_timeout
+        self.down = False
+        self._conns = []
+        self._lock = threading.Lock()
+
+    def connect(self):
+        if self.down:
+            time.sleep(self.connect_timeout)   # フェイルオーバー中はタイムアウトまで待たされる
+            raise sqlite3.OperationalError("connection timed out")
+        time.sleep(self.rtt)
+        c = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conns.append(c)
+        return _Conn(c, self.rtt)
+
+    def drop(self) -> None:
+        self.down = True
+        with self._lock:
+            for c in self._conns:
+                c.close()   # 以後の操作は "Cannot operate on a closed database."（切断として扱われる）
+            self._conns.clear()
+
+    def restore(self) -> None:
+        self.down = False
+
+def _use(eng, stand_in: StandIn):
+    @event.listens_for(eng, "do_connect")
+    def _connect(dialect, conn_rec, cargs, cparams):
+        return stand_in.connect()
+
+    return eng
+
+def make_engine(stand_in: StandIn, pre_ping: bool, breaker: bool):
+    # creator= だと do_connect イベントが呼ばれないため、接続は do_connect で差し替える（ブレーカーの判定が先）
+    eng = create_engine("sqlite://", poolclass=QueuePool, pool_size=5, max_overflow=0, pool_pre_ping=pre_ping)
+    # 死活確認も同じスタンドインに、プールを通さずつなぐ
+    probe = _use(create_engine("sqlite://", poolclass=NullPool), stand_in)
+    health = pool_health.attach(eng, "bench", threshold=3, interval=0.5, backoff_base=0.2,
+                                backoff_max=2.0, probe_engine=probe) if breaker else None
+    return _use(eng, stand_in), health
+
+def request(eng) -> None:
+    with eng.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def timed(eng, n: int):
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        ok = True
+        try:
+            request(eng)
+        except DBAPIError:   # 切断（既存接続）・接続失敗・ブレーカーの拒否
+            ok = False
+        out.append((time.perf_counter() - t0, ok))
+    return out
+
+def ms(xs) -> str:
+    return f"p50 {statistics.median(xs) * 1000:7.2f} ms  max {max(xs) * 1000:7.2f} ms"
+
+def main() -> None:
+    rtt = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.002
+    timeout = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.5
+    n_outage = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+    path = os.path.join(tempfile.mkdtemp(prefix="bench_pool_"), "standin.db")
+
+    old_db, new_db = StandIn(path, rtt, timeout), StandIn(path, rtt, timeout)
+    old, _ = make_engine(old_db, pre_ping=True, breaker=False)
+    new, health = make_engine(new_db, pre_ping=False, breaker=True)
+    logging.getLogger(pool_health.__name__).setLevel(logging.CRITICAL)
+    pool_health.start()
+    print(f"rtt={rtt * 1000:.1f}ms connect_timeout={timeout * 1000:.0f}ms")
+
+    for eng in (old, new):
+        timed(eng, 5)   # 接続を張っておく
+    print("healthy (200 requests)")
+    print(f"  pre-ping           {ms([t for t, _ in timed(old, 200)])}")
+    print(f"  health + breaker   {ms([t for t, _ in timed(new, 200)])}")
+
+    old_db.drop(); new_db.drop()
+    print(f"outage ({n_outage} requests)")
+    for label, eng in (("health + breaker", new), ("pre-ping        ", old)):
+        t0 = time.perf_counter()
+        res = timed(eng, n_outage)
+        assert not any(ok for _, ok in res)
+        print(f"  {label}   {ms([t for t, _ in res])}  total {time.perf_counter() - t0:6.2f} s")
+    print(f"  breaker state={health.state} opened={health.counters['opened']} rejected={health.counters['rejected']}")
+
+    new_db.restore()
+    t0 = time.perf_counter()
+    while health.state != pool_health.CLOSED and time.perf_counter() - t0 < 10:
+        time.sleep(0.01)
+    print(f"recovery: breaker closed after {time.perf_counter() - t0:.2f} s "
+          f"(checks={health.counters['checks']}, failed={health.counters['check_failures']})")
+    request(new)
+    pool_health.stop()
+
+if __name__ == "__main__":
+    main()
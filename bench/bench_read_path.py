@@ -0,0 +1,92 @@
+# bench/bench_read_path.py
+# 参照系1リクエストあたりのオーバーヘッド比較（一時的な SQLite に名簿と報告を作って計測）
+#   python -m bench.bench_read_path [名簿の人数] [繰り返し回数]
+# 従来: ORM セッション + 期間を ORM で取得 + f-string で組み立てた text()
+# 新  : 接続のみ + app/queries.py のコンパイル済み Core 文（絞り込みはバインド変数）
+import os
+import sys
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_read_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+
+from datetime import datetime, timedelta  # noqa: E402
+from sqlalchemy import DateTime, text  # noqa: E402
+
+from app.database import engine, SessionLocal  # noqa: E402
+from app.models import Base, User, Roster  # noqa: E402
+from app.models_persistent import Period, ReportP  # noqa: E402
+from app import queries  # noqa: E402
+
+STATUSES = ["safe", "evacuating", "need_help", "unknown"]
+
+def seed(n: int) -> str:
+    Base.metadata.create_all(bind=engine)
+    base = datetime(2024, 1, 1, 9, 0, 0)
+    with SessionLocal() as db:
+        period = Period(seq=1, started_at=base)
+        db.add(period)
+        db.flush()
+        for i in range(n):
+            u = User(id=f"u{i:06d}", grade="Staff", name=f"利用者 {i}", email=f"user{i}@example.com")
+            db.add(u)
+            db.add(Roster(user_id=u.id, group_name=f"Lab-{i % 7}", is_active=True))
+            if i % 3:
+                db.add(ReportP(period_id=period.id, user_id=u.id, contact_email=u.email,
+                               status=STATUSES[i % 4], updated_at=base + timedelta(seconds=i)))
+        db.commit()
+        return period.id
+
+def legacy(status):
+    # 変更前の list_reports と同じ組み立て方（updated_at は日時に変換）
+    with SessionLocal() as db:
+        cur = db.query(Period).filter(Period.ended_at.is_(None)).one_or_none()
+        status_filter = ""
+        params = {"pid": cur.id}
+        if status:
+            status_filter = " AND rp.status = :status "
+            params["status"] = status
+        sql = text(f"""
+            SELECT u.id AS user_id, u.name, u.email, rro.group_name,
+                   rp.status, rp.updated_at,
+                   rp.shelter_type, rp.shelter_name, rp.shelter_addr,
+                   rp.damage_level
+            FROM reports_p rp
+            JOIN users u        ON u.id = rp.user_id
+            LEFT JOIN rosters rro ON rro.user_id = u.id
+            WHERE rp.period_id = :pid
+            {status_filter}
+            ORDER BY rp.updated_at DESC
+        """).columns(updated_at=DateTime)
+        return db.execute(sql, params).all()
+
+def core(status):
+    with engine.connect() as conn:
+        cur = queries.current_period(conn)
+        return conn.execute(queries.REPORTS, queries.report_params(cur.id, status)).all()
+
+def timeit(fn, status, repeat: int) -> float:
+    fn(status)   # 初回のコンパイル・接続確立を除外
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(status)
+    return (time.perf_counter() - t0) / repeat
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    seed(n)
+    for status in (None, "need_help"):
+        assert legacy(status) == core(status)
+
+    print(f"roster={n} repeat={repeat}")
+    for status in (None, "need_help"):
+        old = timeit(legacy, status, repeat)
+        new = timeit(core, status, repeat)
+        label = f"status={status or '(all)'}"
+        print(f"  {label:<18} session+text(f) {old * 1e6:8.0f} us   connection+Core {new * 1e6:8.0f} us"
+              f"   x{old / new:4.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# bench/bench_serialization.py
+# /admin/api/reports の直列化コスト比較（DB は使わず、行タプルを合成して計測）
+#   python -m bench.bench_serialization [行数]
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app import fastjson
+from app.fastjson import RowEncoder
+from app.routers.admin_persistent import ReportRow
+
+STATUSES = ["safe", "minor_injury", "need_help", "unknown"]
+
+def make_rows(n: int) -> List[tuple]:
+    base = datetime(2024, 1, 1, 9, 0, 0)
+    return [
+        (f"u{i:06d}", f"利用者 {i}", f"user{i}@example.com", f"Lab-{i % 7}",
+         STATUSES[i % 4], base + timedelta(seconds=i, microseconds=i % 1000),
+         "shelter" if i % 3 else None, f"避難所{i % 50}" if i % 3 else None, None,
+         "none" if i % 5 else "partial")
+        for i in range(n)
+    ]
+
+def legacy(rows) -> bytes:
+    # 従来の経路: dict 化 → List[ReportRow] で検証 → jsonable_encoder → json.dumps
+    cols = list(ReportRow.model_fields)
+    dicts = [dict(zip(cols, r)) for r in rows]
+    validated = TypeAdapter(List[ReportRow]).validate_python(dicts)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False,
+                      separators=(",", ":")).encode("utf-8")
+
+def timeit(fn, rows, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rows = make_rows(n)
+    enc = RowEncoder(list(ReportRow.model_fields), datetime_columns=["updated_at"])
+    assert json.loads(enc.records(rows)) == json.loads(legacy(rows))
+
+    orj = fastjson.orjson
+    cases = [("pydantic + jsonable_encoder", legacy, orj),
+             ("RowEncoder records", enc.records, orj),
+             ("RowEncoder columnar", enc.columnar, orj)]
+    if orj is not None:
+        # orjson が無い環境（標準 json へのフォールバック）の速度も測る
+        cases += [("RowEncoder records (stdlib json)", enc.records, None),
+                  ("RowEncoder columnar (stdlib json)", enc.columnar, None)]
+    results = []
+    for name, fn, backend in cases:
+        fastjson.orjson = backend
+        results.append((name, timeit(fn, rows), len(fn(rows))))
+    fastjson.orjson = orj
+
+    print(f"rows={n} orjson={'yes' if orj is not None else 'no'}")
+    base = results[0][1]
+    for name, sec, size in results:
+        print(f"  {name:<36} {sec * 1000:8.1f} ms  {size / 1024:8.0f} KiB  x{base / sec:5.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# tests/conftest.py
+# テストは一時ディレクトリの SQLite で動かす（app は import 時に DATABASE_URL を読むので、その前に設定する）
+import os
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+
+_TMP = tempfile.mkdtemp(prefix="safety_check_test_")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TMP}/test.db"
+os.environ.setdefault("INVALIDATION_POLL_INTERVAL", "0.2")
+os.environ.setdefault("SCHEDULER_ENABLED", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pytest
+
+from app import bootstrap, tenancy
+from app.database import SessionLocal, engine
+from app.models import Organization, Roster, User
+from app.models_persistent import Period
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    bootstrap.ensure_schema(engine)
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+    with TestClient(app) as c:
+        yield c
+
+@pytest.fixture
+def org_period():
+    """
+    テストごとに別の組織と開いている期間を作る。members(*(name, email)) で名簿に載せる。
+    組織は path（/o/<slug>）で使える
+    """
+    org_id = str(uuid.uuid4())
+    slug = f"t-{org_id[:8]}"
+    with SessionLocal() as db:
+        db.add(Organization(id=org_id, slug=slug, name="test"))
+        period = Period(org_id=org_id, seq=1)
+        db.add(period)
+        db.commit()
+        period_id = period.id
+    tenancy.load()
+
+    def members(*people):
+        ids = []
+        with SessionLocal() as db:
+            for name, email in people:
+                u = User(org_id=org_id, grade="Staff", name=name, email=email)
+                db.add(u)
+                db.flush()
+                db.add(Roster(org_id=org_id, user_id=u.id, is_active=True))
+                ids.append(u.id)
+            db.commit()
+        return ids
+
+    return {"org_id": org_id, "slug": slug, "path": f"{tenancy.PATH_PREFIX}{slug}",
+            "period_id": period_id, "members": members}
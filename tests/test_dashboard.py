@@ -0,0 +1,49 @@
+# tests/test_dashboard.py
+# ダッシュボードのスナップショット（app/dashboard.py）: 古い版を載せない・捨てるのは版の進んだ期間だけ・再構築は1ワーカー
+from datetime import datetime
+
+from sqlalchemy import text
+
+from app import dashboard, invalidation
+from app.database import SessionLocal, engine
+from app.models_persistent import Period
+
+def _bump_elsewhere(period_id: str) -> None:
+    # 別ワーカーの再構築（版番号だけ進める）
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE dashboard_snapshots SET version = version + 1 WHERE period_id = :pid"),
+                     {"pid": period_id})
+
+def test_an_older_version_never_replaces_a_newer_one(org_period):
+    pid = org_period["period_id"]
+    dashboard.rebuild(pid)
+    new = dashboard.rebuild(pid)
+    old = dashboard.Snapshot(pid, new.version - 1, {}, b"{}")
+    assert dashboard._install(old) is new
+    assert dashboard.get(pid) is new
+
+def test_drop_discards_only_periods_rebuilt_elsewhere(org_period):
+    pid = org_period["period_id"]
+    with SessionLocal() as db:
+        past = Period(org_id=org_period["org_id"], seq=0, ended_at=datetime.utcnow())
+        db.add(past)
+        db.commit()
+        past_id = past.id
+    kept, changed = dashboard.rebuild(past_id), dashboard.rebuild(pid)
+
+    _bump_elsewhere(pid)
+    dashboard._drop()
+    assert pid not in dashboard._snapshots
+    assert dashboard._snapshots[past_id] is kept
+    # 次の参照はプライマリの表から新しい版を読む
+    assert dashboard.get(pid).version == changed.version + 1
+
+def test_roster_changes_are_rebuilt_only_by_the_publishing_worker(org_period, monkeypatch):
+    marked = []
+    monkeypatch.setattr(dashboard, "mark_dirty", marked.append)
+
+    invalidation._fire(invalidation.ROSTER)   # 他ワーカーの変更を受信
+    assert marked == []
+
+    invalidation.publish(invalidation.ROSTER)
+    assert len(marked) == 1 and dashboard.CURRENT in marked[0]
@@ -0,0 +1,66 @@
+# tests/test_invalidation.py
+# ワーカー間のキャッシュ無効化（app/invalidation.py）。他プロセスの publish が POLL_INTERVAL 以内に届くこと
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from app import invalidation
+
+ROOT = Path(__file__).resolve().parents[1]
+
+def _publish_from_other_worker(topic: str) -> None:
+    # 別プロセス（= 別ワーカー・別エンジン）から同じ DB に publish する
+    subprocess.run(
+        [sys.executable, "-c", f"from app import invalidation; invalidation.publish({topic!r})"],
+        cwd=ROOT, env=dict(os.environ), check=True, timeout=60,
+    )
+
+@pytest.fixture
+def bus():
+    invalidation.start()
+    yield
+    invalidation.stop()
+    time.sleep(invalidation.POLL_INTERVAL * 2)   # 停止を待つ（次のテストで二重に動かさない）
+
+@pytest.fixture
+def listen():
+    # テスト用の購読者は終了時に必ず外す（後続のテストの publish で呼ばれないように）
+    added = []
+
+    def _listen(topic: str) -> threading.Event:
+        fired = threading.Event()
+        invalidation.subscribe(topic, fired.set)
+        added.append((topic, fired.set))
+        return fired
+
+    yield _listen
+    for topic, fn in added:
+        invalidation.unsubscribe(topic, fn)
+
+def test_publish_from_other_worker_arrives_within_poll_interval(bus, listen):
+    fired = listen(invalidation.ROSTER)
+
+    _publish_from_other_worker(invalidation.ROSTER)
+    t0 = time.monotonic()
+    # 別プロセスの publish は確定済み。次のポーリング（POLL_INTERVAL 以内）で購読者が呼ばれる
+    assert fired.wait(invalidation.POLL_INTERVAL + 0.1)
+    assert time.monotonic() - t0 <= invalidation.POLL_INTERVAL + 0.1
+
+def test_ensure_fresh_bounds_staleness_without_the_poller(bus, listen, monkeypatch):
+    fired = listen(invalidation.PERIOD)
+    # ポーリングスレッドが止まっていても、MAX_STALENESS を過ぎていれば読み出し側で確認する
+    monkeypatch.setattr(invalidation, "POLL_INTERVAL", 3600.0)
+    invalidation.poll()
+
+    _publish_from_other_worker(invalidation.PERIOD)
+    invalidation.ensure_fresh()
+    assert not fired.is_set()   # まだ MAX_STALENESS 以内（手元のキャッシュを使う）
+
+    monkeypatch.setattr(invalidation, "_last_checked", time.monotonic() - invalidation.MAX_STALENESS - 0.01)
+    invalidation.ensure_fresh()
+    assert fired.is_set()
@@ -0,0 +1,71 @@
+# tests/test_pool_breaker.py
+# DB のサーキットブレーカー（app/pool_health.py）: 閾値で開く・開いている間は即 503・半開の確認で閉じる
+import os
+import tempfile
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+
+from app import pool_health
+from app.main import circuit_open
+from bench.bench_pool_breaker import StandIn, make_engine, request
+
+CONNECT_TIMEOUT = 0.3
+
+@pytest.fixture
+def breaker():
+    db = StandIn(os.path.join(tempfile.mkdtemp(prefix="test_pool_"), "standin.db"), 0.0, CONNECT_TIMEOUT)
+    eng, health = make_engine(db, pre_ping=False, breaker=True)
+    yield db, eng, health
+    pool_health._monitors.pop("bench", None)
+    eng.dispose()
+
+def _client(eng) -> TestClient:
+    app = FastAPI()
+    app.add_exception_handler(pool_health.CircuitOpenError, circuit_open)
+
+    @app.get("/ping")
+    def ping():
+        request(eng)
+        return {"ok": True}
+
+    return TestClient(app, raise_server_exceptions=False)
+
+def test_opens_at_threshold_fails_fast_and_closes_after_probe(breaker):
+    db, eng, health = breaker
+    client = _client(eng)
+    assert client.get("/ping").status_code == 200
+
+    db.drop()
+    for _ in range(health.threshold):
+        assert health.state == pool_health.CLOSED
+        with pytest.raises(DBAPIError):
+            request(eng)
+    assert health.state == pool_health.OPEN
+
+    # 開いている間は接続を試さずに 503（接続タイムアウトを待たない）
+    t0 = time.perf_counter()
+    r = client.get("/ping")
+    assert r.status_code == 503 and "Retry-After" in r.headers
+    assert time.perf_counter() - t0 < CONNECT_TIMEOUT
+    assert health.counters["rejected"] >= 1
+
+    # 復旧後、半開の確認が成功すると閉じてリクエストが通る
+    db.restore()
+    assert health.check()
+    assert health.state == pool_health.CLOSED
+    assert client.get("/ping").status_code == 200
+
+def test_exhausted_pool_is_not_a_database_failure(breaker):
+    db, eng, health = breaker
+    held = [eng.connect() for _ in range(eng.pool.size())]   # プールを使い切る
+    try:
+        assert health.check()   # 確認はプールを通らない
+        health.record_failure(PoolTimeoutError("QueuePool limit reached"))
+        assert health.failures == 0 and health.state == pool_health.CLOSED
+    finally:
+        for c in held:
+            c.close()
@@ -0,0 +1,87 @@
+# tests/test_public_batch.py
+# オフラインキューの一括送信（POST /public/report/batch）: 後勝ち・未来時刻の切り詰め・冪等キー・同時送信
+import uuid
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal
+from app.models_persistent import ReportP, SubmissionKeyP
+from app.routers import public_persistent as pp
+
+def _item(name: str, status: str, at: datetime, key: str | None = None, **kw) -> dict:
+    return {"idempotency_key": key or uuid.uuid4().hex, "client_updated_at": at.isoformat(),
+            "grade": "staff", "name": name, "email": f"{name}@example.com", "status": status, **kw}
+
+def _post(client, org_period, *items) -> dict:
+    r = client.post(f"{org_period['path']}/public/report/batch", json={"reports": list(items)})
+    assert r.status_code == 200, r.text
+    return {x["idempotency_key"]: x["result"] for x in r.json()["results"]}
+
+def _report(org_period, user_id: str) -> ReportP:
+    with SessionLocal() as db:
+        return db.query(ReportP).filter(ReportP.period_id == org_period["period_id"],
+                                        ReportP.user_id == user_id).one()
+
+def test_last_writer_wins_on_client_updated_at(client, org_period):
+    (uid,) = org_period["members"](("alice", "alice@example.com"))
+    t0 = datetime.utcnow() - timedelta(minutes=10)
+    newer, older = _item("alice", "safe", t0 + timedelta(minutes=5)), _item("alice", "need_help", t0)
+
+    # 同じ送信内では端末時刻順に適用する（並び順によらず新しい方が残る）
+    res = _post(client, org_period, newer, older)
+    assert set(res.values()) == {"applied"}
+    rep = _report(org_period, uid)
+    assert rep.status == "safe" and rep.updated_at == t0 + timedelta(minutes=5)
+
+    # 後から届いた古い報告も上書きしない
+    late = _item("alice", "evacuating", t0 + timedelta(minutes=1))
+    assert _post(client, org_period, late) == {late["idempotency_key"]: "stale"}
+    assert _report(org_period, uid).status == "safe"
+
+def test_client_timestamp_is_capped_at_now(client, org_period):
+    (uid,) = org_period["members"](("bob", "bob@example.com"))
+    future = _item("bob", "need_help", datetime.utcnow() + timedelta(days=1))
+    before = datetime.utcnow()
+    assert _post(client, org_period, future)[future["idempotency_key"]] == "applied"
+    assert _report(org_period, uid).updated_at <= datetime.utcnow()
+
+    # 未来時刻で固定されないので、その後の通常の更新が勝つ
+    fix = _item("bob", "safe", datetime.utcnow() + timedelta(seconds=1))
+    assert _post(client, org_period, fix)[fix["idempotency_key"]] == "applied"
+    rep = _report(org_period, uid)
+    assert rep.status == "safe" and rep.updated_at >= before
+
+def test_duplicate_idempotency_key(client, org_period):
+    org_period["members"](("carol", "carol@example.com"))
+    item = _item("carol", "safe", datetime.utcnow())
+    assert _post(client, org_period, item) == {item["idempotency_key"]: "applied"}
+    # 再送（応答を受け取れなかった端末など）は適用しない
+    assert _post(client, org_period, dict(item, status="need_help")) == {item["idempotency_key"]: "duplicate"}
+    with SessionLocal() as db:
+        assert db.query(SubmissionKeyP).filter(SubmissionKeyP.key == item["idempotency_key"]).count() == 1
+
+def test_unknown_member_and_bad_status_are_rejected(client, org_period):
+    org_period["members"](("dave", "dave@example.com"))
+    stranger, bad = _item("nobody", "safe", datetime.utcnow()), _item("dave", "fine", datetime.utcnow())
+    res = _post(client, org_period, stranger, bad)
+    assert res == {stranger["idempotency_key"]: "rejected", bad["idempotency_key"]: "rejected"}
+
+def test_concurrent_flush_of_same_key_retries_as_duplicate(client, org_period, monkeypatch):
+    # ページと Service Worker が同じキーを同時に送った場合: 相手が先に確定 → こちらは IntegrityError → やり直して duplicate
+    (uid,) = org_period["members"](("erin", "erin@example.com"))
+    item = _item("erin", "need_help", datetime.utcnow())
+    apply_report, calls = pp.apply_report, []
+
+    def racing(db, period_id, user_id, payload, rep, **kw):
+        if not calls:
+            with SessionLocal() as other:
+                other.add(SubmissionKeyP(key=item["idempotency_key"], period_id=period_id,
+                                         user_id=user_id, result="applied"))
+                other.commit()
+        calls.append(user_id)
+        return apply_report(db, period_id, user_id, payload, rep, **kw)
+
+    monkeypatch.setattr(pp, "apply_report", racing)
+    assert _post(client, org_period, item) == {item["idempotency_key"]: "duplicate"}
+    assert calls == [uid]   # やり直しでは適用しない
+    with SessionLocal() as db:
+        assert db.query(SubmissionKeyP).filter(SubmissionKeyP.key == item["idempotency_key"]).count() == 1
@@ -0,0 +1,120 @@
+# tests/test_reminders.py
+# 未報告者リマインド（app/reminders.py）を smtplib が話せる SMTP スタンドインに対して送る
+import socketserver
+import threading
+from collections import Counter
+
+import pytest
+
+from app import reminders
+from app.database import SessionLocal
+from app.models_persistent import ReminderDeliveryP
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """smtplib.SMTP.send_message に必要な分だけの SMTP（EHLO / MAIL / RCPT / DATA / RSET / NOOP / QUIT）"""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self) -> None:
+        self.reply("220 stub ESMTP")
+        rcpts = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("ascii", "replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self.reply("250 stub")
+            elif cmd.startswith("MAIL FROM"):
+                rcpts = []
+                self.reply("250 OK")
+            elif cmd.startswith("RCPT TO"):
+                rcpts.append(line.decode("ascii", "replace").split(":", 1)[1].strip().strip("<>"))
+                self.reply("250 OK")
+            elif cmd == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.received.extend(rcpts)
+                self.reply("250 OK")
+            elif cmd in ("RSET", "NOOP"):
+                self.reply("250 OK")
+            elif cmd == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+class _SmtpStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.lock = threading.Lock()
+        self.received = []
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = _SmtpStub()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(reminders, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(reminders, "SMTP_PORT", server.server_address[1])
+    monkeypatch.setattr(reminders, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(reminders, "SMTP_USER", "")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _deliveries(period_id: str) -> dict:
+    with SessionLocal() as db:
+        return {d.email: d for d in db.query(ReminderDeliveryP).filter(ReminderDeliveryP.period_id == period_id)}
+
+def test_sends_once_per_absentee(smtp, org_period):
+    org_period["members"](("Alice", "alice@example.com"), ("Bob", "bob@example.com"), ("NoMail", None))
+    pid = org_period["period_id"]
+
+    stats = reminders.run_reminders(pid, 1)
+    assert stats["sent"] == 2
+    assert stats["skipped_no_email"] == 1
+    assert sorted(smtp.received) == ["alice@example.com", "bob@example.com"]
+    assert {d.status for d in _deliveries(pid).values()} == {"sent"}
+
+    # 再実行では送信済みを飛ばす
+    assert reminders.run_reminders(pid, 1)["sent"] == 0
+    assert len(smtp.received) == 2
+
+def test_concurrent_runs_do_not_duplicate(smtp, org_period, monkeypatch):
+    # 2つのワーカーが同時に実行した想定（プロセス内の実行中フラグを通らない _run を並べる）
+    monkeypatch.setattr(reminders, "BATCH_SIZE", 5)
+    people = [(f"user{i:02d}", f"user{i:02d}@example.com") for i in range(30)]
+    org_period["members"](*people)
+    pid = org_period["period_id"]
+
+    results = []
+    def worker():
+        results.append(reminders._run(pid, 1, reminders.DEFAULT_SUBJECT, reminders.DEFAULT_BODY))
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    counts = Counter(smtp.received)
+    assert len(counts) == 30
+    assert max(counts.values()) == 1
+    assert sum(r["sent"] for r in results) == 30
+
+def test_header_injection_fails_only_that_recipient(smtp, org_period):
+    org_period["members"](("Alice", "alice@example.com"), ("Mallory", "mallory@example.com\nBcc: victim@example.com"))
+    pid = org_period["period_id"]
+
+    stats = reminders.run_reminders(pid, 1)
+    assert stats["sent"] == 1
+    assert stats["failed"] == 1
+    assert smtp.received == ["alice@example.com"]
+    bad = _deliveries(pid)["mallory@example.com\nBcc: victim@example.com"]
+    assert bad.status == "failed"
+    assert bad.last_error.startswith("ValueError")
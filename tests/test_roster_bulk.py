@@ -0,0 +1,91 @@
+# tests/test_roster_bulk.py
+# 名簿の一括操作（app/roster_bulk.py）: 一致しなかったキーの報告・組織での絞り込み・ユーザー削除での後始末
+import uuid
+
+from sqlalchemy import text
+
+from app import roster_bulk, search
+from app.database import SessionLocal
+from app.models import Organization, Roster, User
+from app.models_persistent import ReportP
+
+def _other_org(name: str, email: str) -> str:
+    # 同じメールアドレスの人がいる別の組織
+    org_id = str(uuid.uuid4())
+    with SessionLocal() as db:
+        db.add(Organization(id=org_id, slug=f"x-{org_id[:8]}", name="other"))
+        u = User(org_id=org_id, grade="Staff", name=name, email=email)
+        db.add(u)
+        db.flush()
+        db.add(Roster(org_id=org_id, user_id=u.id, is_active=True))
+        db.commit()
+        return u.id
+
+def _active(user_id: str) -> bool:
+    with SessionLocal() as db:
+        return db.query(Roster.is_active).filter(Roster.user_id == user_id).scalar()
+
+def _run(org_id: str, action: str, keys) -> dict:
+    with SessionLocal() as db:
+        res = roster_bulk.apply(db, action, keys, org_id=org_id)
+        db.commit()
+        return res
+
+def test_unmatched_keys_are_reported_in_request_order(org_period):
+    a, b = org_period["members"](("alice", "alice@example.com"), ("bob", "bob@example.com"))
+    keys = roster_bulk.keys_from(ids=[a, "no-such-id"], emails=["bob@example.com", "ghost@example.com"],
+                                 members=[("Staff", "alice"), ("Staff", "nobody")])
+    res = _run(org_period["org_id"], "deactivate", keys)
+
+    assert res["requested"] == 6
+    assert res["matched"] == 2          # alice は id と学年+氏名の2キーで一致しても1人
+    assert res["affected"] == 2
+    assert res["unmatched"] == [{"id": "no-such-id"}, {"email": "ghost@example.com"},
+                                {"grade": "Staff", "name": "nobody"}]
+    assert not _active(a) and not _active(b)
+
+def test_matches_are_limited_to_the_organization(org_period):
+    (mine,) = org_period["members"](("carol", "carol@example.com"))
+    theirs = _other_org("carol", "carol@example.com")
+
+    res = _run(org_period["org_id"], "deactivate",
+               roster_bulk.keys_from(ids=[theirs], emails=["carol@example.com"], members=[("Staff", "carol")]))
+    assert res["matched"] == 1
+    assert res["unmatched"] == [{"id": theirs}]   # 他組織の id は一致しない
+    assert not _active(mine)
+    assert _active(theirs)
+
+def test_delete_user_removes_reports_and_search_rows(org_period):
+    a, b = org_period["members"](("dave", "dave@example.com"), ("erin", "erin@example.com"))
+    pid = org_period["period_id"]
+    with SessionLocal() as db:
+        for uid, shelter in ((a, "北体育館"), (b, "南公民館")):
+            db.add(ReportP(period_id=pid, user_id=uid, contact_email="", status="evacuating",
+                           shelter_name=shelter))
+            search.sync(db, pid, uid)
+        db.commit()
+        rowid = db.execute(text("SELECT rowid FROM reports_p WHERE period_id = :pid AND user_id = :uid"),
+                           {"pid": pid, "uid": a}).scalar()
+        assert db.execute(text(f"SELECT COUNT(*) FROM {search.FTS_TABLE} WHERE rowid = :r"),
+                          {"r": rowid}).scalar() == 1
+
+    res = _run(org_period["org_id"], "delete_user", roster_bulk.keys_from(emails=["dave@example.com"]))
+    assert res["affected"] == 1
+
+    with SessionLocal() as db:
+        assert db.query(User).filter(User.id == a).count() == 0
+        assert db.query(ReportP).filter(ReportP.user_id == a).count() == 0
+        assert db.execute(text(f"SELECT COUNT(*) FROM {search.FTS_TABLE} WHERE rowid = :r"),
+                          {"r": rowid}).scalar() == 0
+        hits = search.search(db, "体育館", period_id=pid, org_id=org_period["org_id"])
+        assert hits == []
+        # 対象外のユーザーの報告と索引は残る
+        assert [h["user_id"] for h in search.search(db, "公民館", period_id=pid, org_id=org_period["org_id"])] == [b]
+
+def test_grade_keys_use_the_public_form_spelling(org_period):
+    (a,) = org_period["members"](("frank", "frank@example.com"))   # 名簿上は "Staff"
+    keys = roster_bulk.keys_from_csv("grade,name\n staff ,frank\n")
+    assert keys == [("grade_name", "Staff", "frank")]
+    assert roster_bulk.keys_from(members=[("m", "x")]) == [("grade_name", "Master", "x")]
+    assert _run(org_period["org_id"], "deactivate", keys)["unmatched"] == []
+    assert not _active(a)
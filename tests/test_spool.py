@@ -0,0 +1,76 @@
+# tests/test_spool.py
+# 退避した報告の再生（app/spool.py）: 1件の不正なレコードで再生が止まらないこと、DB 停止中は持ち越すこと
+import uuid
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app import spool
+from app.database import SessionLocal
+from app.models_persistent import ReportP, SubmissionKeyP
+
+@pytest.fixture
+def spooled(org_period, tmp_path, monkeypatch):
+    monkeypatch.setattr(spool, "SPOOL_DIR", tmp_path)
+    monkeypatch.setattr(spool, "_writer", spool._Writer())
+
+    def add(name: str, status: str = "safe", **kw) -> str:
+        key = uuid.uuid4().hex
+        now = datetime.utcnow().isoformat()
+        spool._writer.append({
+            "key": key, "org_id": org_period["org_id"], "period_id": org_period["period_id"],
+            "grade": "Staff", "name": name, "email": f"{name}@example.com",
+            "payload": {"status": status}, "ts": now, "received_at": now, **kw,
+        })
+        return key
+
+    return add
+
+def _results(*keys) -> list:
+    with SessionLocal() as db:
+        rows = dict(db.query(SubmissionKeyP.key, SubmissionKeyP.result).filter(SubmissionKeyP.key.in_(keys)).all())
+    return [rows.get(k) for k in keys]
+
+def _status(org_period, user_id: str):
+    with SessionLocal() as db:
+        return db.query(ReportP.status).filter(ReportP.period_id == org_period["period_id"],
+                                               ReportP.user_id == user_id).scalar()
+
+def test_poison_records_are_rejected_and_replay_continues(org_period, spooled, monkeypatch):
+    a, m, b = org_period["members"](("alice", "a@example.com"), ("mallory", "m@example.com"),
+                                    ("bob", "b@example.com"))
+    apply_report = spool.apply_report
+
+    def failing(db, period_id, user_id, payload, rep, **kw):
+        if user_id == m:
+            raise IntegrityError("INSERT", {}, Exception("CHECK constraint failed"))
+        return apply_report(db, period_id, user_id, payload, rep, **kw)
+
+    monkeypatch.setattr(spool, "apply_report", failing)
+    keys = [spooled("alice"), spooled("mallory"), spooled("carol", ts="not a timestamp"), spooled("bob")]
+
+    assert spool.replay()["replayed"] == 4
+    assert _results(*keys) == ["applied", "rejected", "rejected", "applied"]
+    assert _status(org_period, a) == "safe" and _status(org_period, b) == "safe"
+    assert _status(org_period, m) is None   # 失敗したレコードの書きかけは巻き戻される
+    assert spool.pending()["records"] == 0
+
+def test_database_outage_stops_replay_without_losing_records(org_period, spooled, monkeypatch):
+    (a,) = org_period["members"](("dave", "d@example.com"))
+    key = spooled("dave", status="need_help")
+    apply_report = spool.apply_report
+
+    def down(db, *args, **kw):
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(spool, "apply_report", down)
+    assert spool.replay()["stopped"] == "database unavailable"
+    assert _results(key) == [None]
+    assert spool.pending()["records"] == 1
+
+    # 復旧後の再生で同じレコードが適用される
+    monkeypatch.setattr(spool, "apply_report", apply_report)
+    assert spool.replay()["replayed"] == 1
+    assert _results(key) == ["applied"]
+    assert _status(org_period, a) == "need_help"
@@ -0,0 +1,76 @@
+# tests/test_tenancy.py
+# テナント解決（app/tenancy.py）: パス → Host → セッション → 既定 の順、root_path の接頭辞、応答後の枠の返却
+import asyncio
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import tenancy
+from app.database import SessionLocal
+from app.models import Organization
+
+@pytest.fixture
+def orgs():
+    made = {}
+    with SessionLocal() as db:
+        for role in ("path", "host", "session"):
+            oid = str(uuid.uuid4())
+            db.add(Organization(id=oid, slug=f"{role}-{oid[:8]}", name=role,
+                                hosts=f"{oid[:8]}.example.com" if role == "host" else None, max_concurrency=1))
+            made[role] = tenancy.Org(oid, f"{role}-{oid[:8]}", role)
+        db.commit()
+    tenancy.load()
+    return made
+
+def test_resolution_order(orgs):
+    p, h, s = orgs["path"], orgs["host"], orgs["session"]
+    host = f"{h.id[:8]}.example.com:8000"
+    session = {"org": s.id}
+
+    org, pfx = tenancy.resolve(f"/o/{p.slug}/public", host, session)
+    assert (org.id, pfx) == (p.id, f"/o/{p.slug}")
+    assert tenancy.resolve("/public", host.upper(), session)[0].id == h.id
+    assert tenancy.resolve("/admin", "unknown.example.com", session)[0].id == s.id
+    assert tenancy.resolve("/admin", "", None) == (tenancy.DEFAULT_ORG, "")
+    assert tenancy.resolve("/o/no-such-org/public", host, session) == (None, "/o/no-such-org")
+
+def _client(inner) -> TestClient:
+    return TestClient(tenancy.TenantMiddleware(inner))
+
+async def _ok(send) -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def test_path_org_is_added_to_root_path(orgs):
+    p = orgs["path"]
+    seen = {}
+
+    async def inner(scope, receive, send):
+        seen.update(root_path=scope["root_path"], path=scope["path"], org=tenancy.current_id(),
+                    prefix=tenancy.prefix())
+        await _ok(send)
+
+    assert _client(inner).get(f"/o/{p.slug}/public/roster").status_code == 200
+    assert seen["root_path"] == f"/o/{p.slug}"
+    assert seen["path"] == f"/o/{p.slug}/public/roster"
+    assert (seen["org"], seen["prefix"]) == (p.id, f"/o/{p.slug}")
+    assert _client(inner).get("/o/no-such-org/public").status_code == 404
+
+def test_slot_is_released_after_the_final_body(orgs):
+    p = orgs["path"]
+    in_flight = []
+
+    def count() -> int:
+        return tenancy.budgets()[p.id]["in_flight"]
+
+    async def inner(scope, receive, send):
+        in_flight.append(count())
+        await _ok(send)
+        # 応答の後の処理（BackgroundTasks 相当）の間は枠を占有しない
+        in_flight.append(count())
+        await asyncio.sleep(0)
+
+    assert _client(inner).get(f"/o/{p.slug}/public").status_code == 200
+    assert in_flight == [1, 0]
+    assert count() == 0
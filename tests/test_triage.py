@@ -0,0 +1,92 @@
+# tests/test_triage.py
+# トリアージキュー（app/triage.py）: 構築後は作り直さず、他ワーカーの報告・担当の変更を差分で取り込む
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+
+from app import invalidation, triage
+from app.database import SessionLocal, engine
+
+def _write_from_other_worker(period_id: str, user_id: str, status: str, damage: str | None,
+                             updated_at: datetime) -> None:
+    # 別ワーカーの書き込み（このプロセスの commit 後フックを通らない）
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO reports_p (period_id, user_id, contact_email, status, damage_level, updated_at, written_at)
+            VALUES (:pid, :uid, '', :st, :dmg, :ts, :now)
+            ON CONFLICT (period_id, user_id) DO UPDATE
+            SET status = :st, damage_level = :dmg, updated_at = :ts, written_at = :now
+        """), {"pid": period_id, "uid": user_id, "st": status, "dmg": damage, "ts": updated_at,
+               "now": datetime.utcnow()})
+
+def _ids(q) -> list:
+    return [r["user_id"] for r in q.top(50)]
+
+@pytest.fixture
+def queue_env(org_period, monkeypatch):
+    monkeypatch.setattr(triage, "REFRESH_SEC", 0.0)
+    yield org_period
+    triage._drop_all()
+
+def test_reports_from_other_workers_are_merged_without_rebuilding(queue_env):
+    pid = queue_env["period_id"]
+    a, b = queue_env["members"](("a", "a@example.com"), ("b", "b@example.com"))
+    # オフライン送信で端末時刻が古い報告も、書き込み時刻で拾う
+    _write_from_other_worker(pid, a, "need_help", None, datetime.utcnow() - timedelta(hours=1))
+    with SessionLocal() as db:
+        q = triage.get_queue(db, pid)
+        assert _ids(q) == [a]
+
+        _write_from_other_worker(pid, b, "unknown", "severe", datetime.utcnow() - timedelta(hours=2))
+        _write_from_other_worker(pid, a, "safe", None, datetime.utcnow())
+        assert triage.get_queue(db, pid) is q
+        assert _ids(q) == [b]
+
+def test_claims_follow_the_bus_and_conflict(queue_env):
+    pid = queue_env["period_id"]
+    (a,) = queue_env["members"](("c", "c@example.com"))
+    _write_from_other_worker(pid, a, "need_help", "moderate", datetime.utcnow())
+    with SessionLocal() as db:
+        q = triage.get_queue(db, pid)
+        triage.claim(db, pid, a, "alice")
+        assert q.top(1)[0]["claimed_by"] == "alice"
+        with pytest.raises(triage.ClaimConflict):
+            triage.claim(db, pid, a, "bob")
+
+        # 別ワーカーでの解除: 担当表を書き換えて TRIAGE を publish
+        with engine.begin() as conn:
+            conn.execute(text("UPDATE triage_claims_p SET claimed_by = NULL, claimed_at = NULL "
+                              "WHERE period_id = :pid AND user_id = :uid"), {"pid": pid, "uid": a})
+        invalidation.publish(invalidation.TRIAGE)
+        assert triage.get_queue(db, pid) is q
+        assert q.top(1)[0]["claimed_by"] is None
+
+def test_ack_removes_until_a_newer_report(queue_env):
+    pid = queue_env["period_id"]
+    (a,) = queue_env["members"](("d", "d@example.com"))
+    _write_from_other_worker(pid, a, "need_help", None, datetime.utcnow() - timedelta(minutes=1))
+    with SessionLocal() as db:
+        q = triage.get_queue(db, pid)
+        triage.ack(db, pid, a, "alice")
+        assert _ids(q) == []
+        with pytest.raises(KeyError):
+            triage.claim(db, pid, a, "alice")
+
+        _write_from_other_worker(pid, a, "need_help", "severe", datetime.utcnow())
+        assert _ids(triage.get_queue(db, pid)) == [a]
+
+def test_failed_claim_sync_forces_a_full_reload(queue_env, monkeypatch):
+    pid = queue_env["period_id"]
+    (a,) = queue_env["members"](("e", "e@example.com"))
+    _write_from_other_worker(pid, a, "need_help", None, datetime.utcnow())
+    with SessionLocal() as db:
+        q = triage.get_queue(db, pid)
+
+        def broken(db, q):
+            raise RuntimeError("db down")
+
+        monkeypatch.setattr(triage, "_sync_claims", broken)
+        triage._on_claims_changed()
+        assert q.stale
+        assert triage.get_queue(db, pid) is not q